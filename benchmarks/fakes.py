@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""
+A local stand-in for the Meetup, Trello and Slack web APIs, serving a synthetic World
+"""
+
+import json
+import queue
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+from time import sleep
+from urllib.error import URLError
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
+from urllib.request import Request, urlopen
+
+from dave.webhooks import ThreadingHTTPServer, signature
+
+# Where each API is served on the stand-in
+ROUTES = {"api.meetup.com": "/meetup", "api.trello.com": "/trello", "slack.com": "/slack"}
+ID = re.compile(r"/[0-9a-f]{24}|/\d{6,}")
+
+
+class NotFound(Exception):
+    pass
+
+
+class FakeServices(object):
+    def __init__(self, world, latency=0.0, host="127.0.0.1", port=0, webhook_secret=None):
+        """Serves :world: over HTTP from a background thread
+
+        :param world: (World) The synthetic group
+        :param latency: (float) Seconds every response is delayed by, to stand in for the network
+        :param host: (str)
+        :param port: (int) 0 picks a free port
+        :param webhook_secret: (str) Signs the Trello webhooks it delivers, like Trello does with the app secret
+        """
+        self.world = world
+        self.latency = latency
+        self.webhook_secret = webhook_secret
+        self.calls = Counter()
+        self.webhooks = {}
+        self._deliveries = queue.Queue()
+        self._lock = threading.Lock()
+        world.listeners.append(self._action_taken)
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                services._handle(self, "GET")
+
+            def do_POST(self):
+                services._handle(self, "POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="fake-services", daemon=True).start()
+        threading.Thread(target=self._deliver, name="fake-webhooks", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_calls(self):
+        """Returns the calls counted so far and starts counting from zero"""
+        with self._lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
+    def _handle(self, request, method):
+        parts = urlsplit(request.path)
+        params = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        length = int(request.headers.get("Content-Length") or 0)
+        body = request.rfile.read(length) if length else b""
+        if body:
+            if request.headers.get("Content-Type", "").startswith("application/json"):
+                params.update(json.loads(body.decode()))
+            else:
+                params.update({k: v[-1] for k, v in parse_qs(body.decode()).items()})
+
+        service, _, path = parts.path.lstrip("/").partition("/")
+        with self._lock:
+            self.calls["{} {} /{}".format(service, method, ID.sub("/:id", "/" + path).lstrip("/"))] += 1
+        if self.latency:
+            sleep(self.latency)
+
+        handler = getattr(self, "_" + service, None)
+        try:
+            if handler is None:
+                raise NotFound()
+            with self._lock:
+                status, data = 200, handler(method, "/" + path, params)
+        except NotFound:
+            status, data = 404, {"error": "not found"}
+        payload = json.dumps(data).encode()
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def _meetup(self, method, path, params):
+        if path == "/2/events":
+            return _meetup_page(path, params, self.world.events)
+        if path == "/2/rsvps":
+            return _meetup_page(path, params, self.world.rsvps.get(params.get("event_id"), []))
+        raise NotFound()
+
+    def _trello(self, method, path, params):
+        world = self.world
+        segments = path.strip("/").split("/")[1:]  # Drop the API version
+        if segments[:2] == ["members", "me"]:
+            if segments[2:] == ["boards"]:
+                return [_board_fields(b) for b in world.boards.values()]
+            if segments[2:] == ["organizations"]:
+                return world.organizations
+        elif segments[0] == "boards" and method == "POST":
+            source = world.boards.get(params.get("idBoardSource"))
+            return _board_fields(world.add_board(params["name"], source, params.get("idOrganization")))
+        elif segments[0] == "boards" and len(segments) >= 2:
+            board = world.boards.get(segments[1])
+            if not board:
+                raise NotFound()
+            if len(segments) == 2:
+                return _nested_board(board)
+            if segments[2] == "actions":
+                return _actions_since(board, params.get("since"), int(params.get("limit", 50)))
+        elif segments[0] in ("cards", "lists", "labels") and method == "GET" and len(segments) == 2:
+            for board in world.boards.values():
+                resource = board[segments[0]].get(segments[1])
+                if resource:
+                    return resource
+        elif segments == ["cards"] and method == "POST":
+            board, board_list = _find(world, "lists", params["idList"])
+            label_ids = [l for l in params.get("idLabels", "").split(",") if l]
+            return world.add_card(board, board_list, params["name"], params.get("desc", ""), label_ids)
+        elif segments[0] == "cards" and segments[2:] == ["idLabels"] and method == "POST":
+            board, card = _find(world, "cards", segments[1])
+            world.label_card(board, card, board["labels"][params["value"]])
+            return card["idLabels"]
+        elif segments == ["lists"] and method == "POST":
+            board = world.boards[params["idBoard"]]
+            return world.add_list(board, params["name"], params.get("pos"))
+        elif segments == ["webhooks"] and method == "POST":
+            # Trello only registers callback URLs that answer a HEAD
+            try:
+                urlopen(Request(params["callbackURL"], method="HEAD"), timeout=5).close()
+            except (URLError, OSError):
+                raise NotFound()
+            self.webhooks.setdefault(params["idModel"], set()).add(params["callbackURL"])
+            return {"id": world.new_id(), "idModel": params["idModel"], "callbackURL": params["callbackURL"],
+                    "active": True}
+        raise NotFound()
+
+    def _action_taken(self, board, action):
+        for callback_url in self.webhooks.get(board["id"], ()):
+            self._deliveries.put((callback_url, {"action": action, "model": {"id": board["id"]}}))
+
+    def _deliver(self):
+        while True:
+            callback_url, payload = self._deliveries.get()
+            body = json.dumps(payload).encode()
+            headers = {"Content-Type": "application/json"}
+            if self.webhook_secret:
+                headers["X-Trello-Webhook"] = signature(self.webhook_secret, body, callback_url)
+            try:
+                urlopen(Request(callback_url, data=body, headers=headers), timeout=5).close()
+            except (URLError, OSError):
+                pass
+
+    def _slack(self, method, path, params):
+        world = self.world
+        api_method = path.rsplit("/", 1)[-1]
+        if api_method == "chat.postMessage":
+            world.posted.append(params)
+            return {"ok": True, "channel": params.get("channel"), "ts": str(len(world.posted))}
+        if api_method == "channels.list":
+            return {"ok": True, "channels": [_channel(world, c) for c in world.channels.values()],
+                    "response_metadata": {"next_cursor": ""}}
+        if api_method == "channels.info":
+            channel = world.channels.get(params.get("channel"))
+            if channel:
+                return {"ok": True, "channel": _channel(world, channel)}
+            return {"ok": False, "error": "channel_not_found"}
+        if api_method == "im.list":
+            return {"ok": True, "ims": world.ims, "response_metadata": {"next_cursor": ""}}
+        if api_method == "users.info":
+            user = world.users.get(params.get("user"))
+            return {"ok": True, "user": user} if user else {"ok": False, "error": "user_not_found"}
+        return {"ok": False, "error": "unknown_method"}
+
+
+def _meetup_page(path, params, results):
+    """One page of :results:, with only the requested fields and a meta.next link like Meetup's"""
+    size = int(params.get("page", 200))
+    offset = int(params.get("offset", 0))
+    page = results[offset * size:(offset + 1) * size]
+    if params.get("only"):
+        fields = params["only"].split(",")
+        page = [{k: v for k, v in r.items() if k in fields} for r in page]
+    next_url = ""
+    if (offset + 1) * size < len(results):
+        next_url = "http://api.meetup.com{}?{}".format(path, urlencode(dict(params, offset=offset + 1)))
+    return {"results": page, "meta": {"next": next_url, "count": len(page), "total_count": len(results)}}
+
+
+def _board_fields(board):
+    return {k: board[k] for k in ("id", "name", "desc", "closed", "url", "idOrganization")}
+
+
+def _nested_board(board):
+    data = _board_fields(board)
+    data["lists"] = [l for l in board["lists"].values() if not l["closed"]]
+    data["cards"] = [c for c in board["cards"].values() if not c["closed"]]
+    data["labels"] = list(board["labels"].values())
+    data["actions"] = [{"id": a["id"]} for a in board["actions"][-1:]]
+    return data
+
+
+def _actions_since(board, since, limit):
+    actions = [a for a in board["actions"] if not since or a["id"] > since]
+    return list(reversed(actions))[:limit]
+
+
+def _find(world, kind, resource_id):
+    for board in world.boards.values():
+        if resource_id in board[kind]:
+            return board, board[kind][resource_id]
+    raise NotFound()
+
+
+def _channel(world, channel):
+    return {"id": channel["id"], "name": channel["name"], "topic": {"value": world.channel_topic(channel)}}
+
+
+@contextmanager
+def redirect(base_url):
+    """Sends every request made with requests to the Meetup, Trello and Slack APIs to the stand-in at :base_url:
+    instead. Everything else goes out as usual.
+
+    :param base_url: (str) E.g. FakeServices.url
+    """
+    from requests.adapters import HTTPAdapter
+
+    target = urlsplit(base_url)
+    original = HTTPAdapter.send
+
+    def send(adapter, request, **kwargs):
+        parts = urlsplit(request.url)
+        prefix = ROUTES.get(parts.hostname)
+        if prefix:
+            request.url = urlunsplit((target.scheme, target.netloc, prefix + parts.path, parts.query, ""))
+        return original(adapter, request, **kwargs)
+
+    HTTPAdapter.send = send
+    try:
+        yield
+    finally:
+        HTTPAdapter.send = original
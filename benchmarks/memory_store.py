@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+An in-memory stand-in for the parts of dave.store.Store the bot uses, for benchmarking without a scratch Postgres
+"""
+
+import json
+import threading
+from collections import Counter
+
+
+class MemoryDatabase(object):
+    def __init__(self):
+        """The state shared by every MemoryStore, like the database is shared by every Store"""
+        self.events = {}
+        self.participants = {}
+        self.version = 0
+        self.upcoming = None
+        self.notifications = []
+        self.lock = threading.Lock()
+
+
+class MemoryStore(object):
+    def __init__(self, database):
+        """Creates a Store look-alike. Data is copied in and out as JSON, like it is through Postgres.
+
+        :param database: (MemoryDatabase) Shared with the stores of the other bots
+        """
+        self.db = database
+        self.queries = Counter()
+        self._listening_from = None
+
+    def reconnect(self):
+        pass
+
+    def store_event(self, event_id, data):
+        self.store_events({event_id: data})
+
+    def retrieve_event(self, event_id):
+        if not event_id:
+            return {}
+        return self.retrieve_events([event_id]).get(str(event_id), {})
+
+    def retrieve_events(self, event_ids):
+        self.queries["retrieve_events"] += 1
+        with self.db.lock:
+            return {str(e): json.loads(self.db.events[str(e)]) for e in event_ids if str(e) in self.db.events}
+
+    def store_events(self, events):
+        self.queries["store_events"] += 1
+        with self.db.lock:
+            for event_id, data in events.items():
+                self.db.events[str(event_id)] = json.dumps(data)
+
+    def retrieve_all_events(self):
+        self.queries["retrieve_all_events"] += 1
+        with self.db.lock:
+            return {e: json.loads(data) for e, data in self.db.events.items()}
+
+    def store_rsvps(self, event_id, venue, rsvps):
+        self.queries["store_rsvps"] += 1
+        with self.db.lock:
+            for member_id, name, response in rsvps:
+                self.db.participants[(str(event_id), str(member_id))] = (name, venue, response)
+
+    def publish_events(self, upcoming_ids, changed_ids):
+        self.queries["publish_events"] += 1
+        with self.db.lock:
+            self.db.version += 1
+            self.db.upcoming = [str(e) for e in upcoming_ids]
+            self.db.notifications.append({"version": self.db.version, "upcoming": self.db.upcoming,
+                                          "changed": [str(e) for e in changed_ids]})
+            return self.db.version
+
+    def events_state(self):
+        self.queries["events_state"] += 1
+        with self.db.lock:
+            return self.db.version, self.db.upcoming
+
+    def listen_events(self):
+        with self.db.lock:
+            self._listening_from = len(self.db.notifications)
+        return self.events_state()
+
+    def poll_events(self):
+        if self._listening_from is None:
+            return None
+        with self.db.lock:
+            payloads = self.db.notifications[self._listening_from:]
+            self._listening_from = len(self.db.notifications)
+        return payloads
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+"""
+Benchmarks the bot offline, against local stand-ins for Meetup, Trello, Slack and the Store.
+
+Times three monitor sweeps over a synthetic group (the first one, one without changes and one after RSVP churn),
+then replays a chat transcript through the RTM reader, the channel router and the conversation workers, and
+reports sweep times, command latency percentiles and the API calls each phase made. Run it from the repository
+root:
+
+    python -m benchmarks.run --events 20 --rsvps 200 --commands 500
+    python -m benchmarks.run --transcript benchmarks/transcripts/sample.jsonl --latency 0.05
+"""
+
+import argparse
+import json
+import queue
+import tempfile
+import threading
+from collections import Counter
+from os import environ, path
+from time import sleep, time
+
+from benchmarks.fakes import FakeServices, redirect
+from benchmarks.memory_store import MemoryDatabase, MemoryStore
+from benchmarks.synthetic import World
+from dave.webhooks import WebhookReceiver
+
+BOT_ID = "UDAVE"
+
+
+class TimedQueue(queue.Queue):
+    """A task queue that measures how long each task took, from being queued until its worker came back for the
+    next one. Conversation workers take one task at a time, so that's the end-to-end latency of a command.
+    """
+
+    def __init__(self):
+        queue.Queue.__init__(self)
+        self.latencies = []
+        self._current = None
+
+    def put(self, task, block=True, timeout=None):
+        queue.Queue.put(self, (time(), task), block, timeout)
+
+    def get(self, block=True, timeout=None):
+        if self._current is not None:
+            self.latencies.append(time() - self._current)
+            self._current = None
+        queued_at, task = queue.Queue.get(self, block, timeout)
+        self._current = queued_at
+        return task
+
+
+class Feed(object):
+    def __init__(self, events, rate=0.0, batch=100):
+        """Stands in for SlackClient.rtm_read, handing out :events: and then a goodbye
+
+        :param events: (list) RTM events
+        :param rate: (float) Events per second, or 0 to hand them out as fast as they're read
+        :param batch: (int) Events per read when there's no rate
+        """
+        self.events = list(events)
+        self.rate = rate
+        self.batch = batch
+
+    def read(self):
+        if not self.events:
+            return [{"type": "goodbye"}]
+        if self.rate:
+            sleep(1.0 / self.rate)
+            return [self.events.pop(0)]
+        batch, self.events = self.events[:self.batch], self.events[self.batch:]
+        return batch
+
+
+def configure(workdir, database_url=None, webhook_url=None):
+    """Points the bot's configuration at the stand-ins. Must run before dave.bot is imported."""
+    environ.update({
+        "SLACK_API_TOKEN": "xoxb-benchmark",
+        "TRELLO_API_KEY": "benchmark",
+        "TRELLO_TOKEN": "benchmark",
+        "TRELLO_TEAM": "storg",
+        "MEETUP_API_KEY": "benchmark",
+        "MEETUP_GROUP_ID": "1",
+        "BOT_ID": BOT_ID,
+        "LAB_CHANNEL_ID": "#dungeon_lab",
+        "SNAPSHOT_DIR": path.join(workdir, "snapshots"),
+        "METRICS_DIR": path.join(workdir, "metrics"),
+    })
+    if database_url:
+        environ["DATABASE_URL"] = database_url
+    if webhook_url:
+        environ["TRELLO_WEBHOOK_URL"] = webhook_url
+
+
+def new_bot(database):
+    from dave.bot import Bot
+
+    bot = Bot()
+    if database is not None:
+        bot.ds = MemoryStore(database)
+    return bot
+
+
+def sweep(bot, services):
+    """Runs one monitor sweep and waits for the Trello writes it started"""
+    services.reset_calls()
+    started = time()
+    bot.check_events()
+    bot.save_events()
+    swept = time() - started
+    bot.trello.writer.flush(timeout=600)
+    return {"seconds": swept, "with_writes": time() - started, "calls": services.reset_calls()}
+
+
+def replay(bots, reader, events, services, rate=0.0, timeout=600):
+    """Feeds :events: to :reader:'s RTM ingestion, which routes the commands to one conversation worker per bot
+
+    :return: (dict) The latency of every command, how long it all took and the API calls made
+    """
+    from dave.metrics import metrics
+    from worker import ChannelRouter
+
+    queues = [TimedQueue() for _ in bots]
+    for bot, tasks in zip(bots, queues):
+        threading.Thread(target=bot.conversation, args=(tasks,), daemon=True).start()
+
+    routed = Counter()
+
+    class CountingRouter(ChannelRouter):
+        def put(self, task):
+            routed["commands"] += 1
+            ChannelRouter.put(self, task)
+
+    reader.chat.sc.rtm_read = Feed(events, rate=rate).read
+    before = metrics.snapshot()
+    services.reset_calls()
+    started = time()
+    try:
+        reader.chat._ingest(CountingRouter(queues), read_timeout=0)
+    except ConnectionError:
+        pass
+    while sum(len(q.latencies) for q in queues) < routed["commands"] and time() - started < timeout:
+        sleep(0.01)
+    elapsed = time() - started
+    by_kind = {}
+    for key, series in metrics.snapshot().items():
+        if key.startswith("command "):
+            calls = series["calls"] - before.get(key, {}).get("calls", 0)
+            seconds = series["seconds"] - before.get(key, {}).get("seconds", 0)
+            if calls:
+                by_kind[key.split(" ", 1)[1]] = {"calls": calls, "mean": seconds / calls}
+    return {"latencies": sorted(l for q in queues for l in q.latencies), "seconds": elapsed,
+            "by_kind": by_kind, "calls": services.reset_calls()}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def load_transcript(filename):
+    """Reads a transcript: one RTM event JSON per line"""
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize_calls(calls):
+    services = Counter()
+    for endpoint, count in calls.items():
+        services[endpoint.split(" ", 1)[0]] += count
+    return ", ".join("{} {}".format(s, c) for s, c in sorted(services.items())) or "none"
+
+
+def report(args, sweeps, chat, verbose=False):
+    print("Group: {} events, {} RSVPs per event, {} tables, {} contacts, {:.0f}ms per API call".format(
+        args.events, args.rsvps, args.tables, args.contacts, args.latency * 1000))
+    print()
+    print("{:<12} {:>9} {:>12}   {}".format("sweep", "time", "with writes", "API calls"))
+    for name, result in sweeps:
+        print("{:<12} {:>8.2f}s {:>11.2f}s   {}".format(name, result["seconds"], result["with_writes"],
+                                                       summarize_calls(result["calls"])))
+        if verbose:
+            for endpoint, count in sorted(result["calls"].items()):
+                print("{:>16} {}".format(count, endpoint))
+    print()
+    latencies = chat["latencies"]
+    print("{} commands on {} workers in {:.2f}s".format(len(latencies), args.workers, chat["seconds"]))
+    print("latency p50 {:.3f}s, p90 {:.3f}s, p99 {:.3f}s, max {:.3f}s".format(
+        percentile(latencies, 0.5), percentile(latencies, 0.9), percentile(latencies, 0.99),
+        latencies[-1] if latencies else 0.0))
+    for kind, stats in sorted(chat["by_kind"].items()):
+        print("{:>24} {:>6} x {:.3f}s".format(kind, stats["calls"], stats["mean"]))
+    print("API calls: {}".format(summarize_calls(chat["calls"])))
+    if verbose:
+        for endpoint, count in sorted(chat["calls"].items()):
+            print("{:>16} {}".format(count, endpoint))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=10, help="upcoming events")
+    parser.add_argument("--rsvps", type=int, default=50, help="yes RSVPs per event")
+    parser.add_argument("--tables", type=int, default=6, help="tables per event board")
+    parser.add_argument("--contacts", type=int, default=200, help="cards on the Address Book board")
+    parser.add_argument("--churn", type=float, default=0.1, help="share of RSVPs changed before the last sweep")
+    parser.add_argument("--commands", type=int, default=200, help="chat commands to generate")
+    parser.add_argument("--transcript", help="replay this transcript, one RTM event JSON per line, instead")
+    parser.add_argument("--record", help="save the generated transcript here")
+    parser.add_argument("--rate", type=float, default=0.0, help="chat events per second, 0 for as fast as possible")
+    parser.add_argument("--workers", type=int, default=4, help="conversation workers")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every API call")
+    parser.add_argument("--database-url", help="a scratch Postgres to use instead of the in-memory Store")
+    parser.add_argument("--webhooks", action="store_true", help="push Trello changes to the bots through webhooks")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="list the API calls per endpoint")
+    args = parser.parse_args()
+
+    world = World(events=args.events, rsvps=args.rsvps, tables=args.tables, contacts=args.contacts, seed=args.seed)
+    if args.transcript:
+        transcript = load_transcript(args.transcript)
+    else:
+        transcript = world.transcript(args.commands, BOT_ID, seed=args.seed)
+        if args.record:
+            with open(args.record, "w") as f:
+                f.writelines(json.dumps(event) + "\n" for event in transcript)
+
+    services = FakeServices(world, latency=args.latency).start()
+    database = None if args.database_url else MemoryDatabase()
+    everyone = []
+    webhook_url = None
+    if args.webhooks:
+        def push(board_id, action):
+            for bot in everyone:
+                bot.trello.push(board_id, [action])
+
+        webhook_url = "http://{}:{}/".format(*WebhookReceiver(push).start(0, host="127.0.0.1"))
+
+    with tempfile.TemporaryDirectory() as workdir, redirect(services.url):
+        configure(workdir, args.database_url, webhook_url)
+        monitor = new_bot(database)
+        everyone.append(monitor)
+        if args.webhooks:
+            monitor.trello.register_webhooks()
+        sweeps = [("first", sweep(monitor, services)), ("unchanged", sweep(monitor, services))]
+        world.churn(args.churn)
+        sweeps.append(("churn", sweep(monitor, services)))
+
+        bots = [new_bot(database) for _ in range(max(1, args.workers))]
+        everyone.extend(bots)
+        for bot in bots:
+            bot.warm_up()
+        chat = replay(bots, new_bot(database), transcript, services, rate=args.rate)
+
+        # Still inside redirect: the bots' background threads must never reach the real APIs
+        if args.json:
+            print(json.dumps({"sweeps": dict(sweeps), "chat": chat}, indent=2, sort_keys=True))
+        else:
+            report(args, sweeps, chat, verbose=args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+Synthetic Meetup groups, Trello boards and Slack workspaces for the benchmarks
+"""
+
+import random
+from time import time
+
+import yaml
+
+VENUES = ["STORG Clubhouse", "STORG Northern Clubhouse"]
+GAMES = ["Blades in the Dark", "Fate", "Dungeon World", "Mouse Guard", "Call of Cthulhu", "Numenera", "Rat Queens",
+         "Apocalypse World", "Monster of the Week", "Tales from the Loop"]
+
+
+class World(object):
+    def __init__(self, events=10, rsvps=50, tables=6, contacts=200, seed=1):
+        """Creates a synthetic group. Everything is derived from :seed:, so two worlds built with the same
+        arguments are the same.
+
+        :param events: (int) Upcoming Meetup events
+        :param rsvps: (int) "yes" RSVPs per event
+        :param tables: (int) Table lists on the Meetup Template board, each with an Info card
+        :param contacts: (int) Cards on the Address Book board
+        :param seed: (int)
+        """
+        self.random = random.Random(seed)
+        self._ids = 0
+        self.members = [{"member_id": 1000 + i, "name": "Member {}".format(i)}
+                        for i in range(max(rsvps * 2, contacts, 1))]
+        self.events = []
+        self.rsvps = {}
+        self.boards = {}
+        self.organizations = [{"id": self.new_id(), "name": "storg", "displayName": "STORG",
+                               "url": "https://trello.com/storg"}]
+        self.channels = {}
+        self.users = {}
+        self.ims = []
+        self.posted = []
+        self.listeners = []
+
+        start = int(time() * 1000) + 86400000
+        for i in range(events):
+            event_id = str(240000000 + i)
+            name = "{} #{}".format(self.random.choice(GAMES), i)
+            self.events.append({"id": event_id, "name": name, "time": start + i * 7 * 86400000,
+                                "venue": {"name": VENUES[i % len(VENUES)]}, "rsvp_limit": rsvps + 10,
+                                "yes_rsvp_count": rsvps, "status": "upcoming",
+                                "event_url": "https://www.meetup.com/storg/events/{}/".format(event_id)})
+            attending = self.random.sample(self.members, rsvps)
+            self.rsvps[event_id] = [{"member": dict(m), "response": "yes"} for m in attending]
+            channel_id = "C{:08d}".format(i)
+            self.channels[channel_id] = {"id": channel_id, "name": name.lower().replace(" ", "_").replace("#", ""),
+                                         "event": name}
+
+        template = self.add_board("Meetup Template")
+        self.add_list(template, "RSVP", pos=0)
+        for t in range(1, tables + 1):
+            table = self.add_list(template, "{}. {}".format(t, self.random.choice(GAMES)), pos=t)
+            self.add_card(template, table, "Info", "A one shot for new players.\n\nPlayers: 5")
+        for label in ("GM", "Canceled"):
+            self.add_label(template, label)
+
+        address_book = self.add_board("Address Book")
+        contacts_list = self.add_list(address_book, "Contacts", pos=0)
+        no_slack = self.add_label(address_book, "NoSlack")
+        for member in self.members[:contacts]:
+            slack = "user{}".format(member["member_id"]) if self.random.random() < 0.7 else None
+            card = self.add_card(address_book, contacts_list, member["name"],
+                                 yaml.dump({"id": str(member["member_id"]), "slack": slack}, default_flow_style=False))
+            if slack is None:
+                card["idLabels"].append(no_slack["id"])
+            else:
+                user_id = "U{}".format(member["member_id"])
+                self.users[user_id] = {"id": user_id, "name": slack}
+                self.ims.append({"id": "D{}".format(member["member_id"]), "user": user_id})
+
+    def new_id(self):
+        """A Trello looking id: 24 hex digits, increasing"""
+        self._ids += 1
+        return "{:024x}".format(self._ids)
+
+    def add_board(self, name, source=None, organization_id=None):
+        board = {"id": self.new_id(), "name": name, "closed": False, "desc": "", "idOrganization": organization_id,
+                 "lists": {}, "cards": {}, "labels": {}, "actions": []}
+        board["url"] = "https://trello.com/b/{}/{}".format(board["id"][-8:], name.lower().replace(" ", "-"))
+        self.boards[board["id"]] = board
+        if source:
+            for source_list in sorted(source["lists"].values(), key=lambda l: l["pos"]):
+                board_list = self.add_list(board, source_list["name"], source_list["pos"])
+                for card in source["cards"].values():
+                    if card["idList"] == source_list["id"]:
+                        self.add_card(board, board_list, card["name"], card["desc"])
+            for label in source["labels"].values():
+                self.add_label(board, label["name"], label["color"])
+        return board
+
+    def add_list(self, board, name, pos=None):
+        if pos is None or pos == "bottom":
+            pos = max([l["pos"] for l in board["lists"].values()] or [0]) + 1
+        board_list = {"id": self.new_id(), "name": name, "pos": pos, "closed": False, "idBoard": board["id"]}
+        board["lists"][board_list["id"]] = board_list
+        self.action(board, "createList", list=board_list)
+        return board_list
+
+    def add_card(self, board, board_list, name, desc="", label_ids=None):
+        card = {"id": self.new_id(), "name": name, "desc": desc, "idList": board_list["id"],
+                "idLabels": list(label_ids or []), "pos": len(board["cards"]), "closed": False, "idBoard": board["id"]}
+        board["cards"][card["id"]] = card
+        self.action(board, "createCard", card=card, list=board_list)
+        return card
+
+    def add_label(self, board, name, color="red"):
+        label = {"id": self.new_id(), "name": name, "color": color, "idBoard": board["id"]}
+        board["labels"][label["id"]] = label
+        self.action(board, "createLabel", label=label)
+        return label
+
+    def label_card(self, board, card, label):
+        if label["id"] not in card["idLabels"]:
+            card["idLabels"].append(label["id"])
+        self.action(board, "addLabelToCard", card=card, label=label)
+
+    def action(self, board, action_type, **data):
+        action = {"id": self.new_id(), "type": action_type, "data": {k: {"id": v["id"]} for k, v in data.items()}}
+        board["actions"].append(action)
+        for listener in self.listeners:
+            listener(board, action)
+
+    def board_by_name(self, name):
+        for board in self.boards.values():
+            if board["name"] == name:
+                return board
+
+    def channel_topic(self, channel):
+        board = self.board_by_name(channel["event"])
+        return "<{}>".format(board["url"]) if board else ""
+
+    def churn(self, fraction=0.1):
+        """Changes about :fraction: of every event's RSVPs: half of them join, half cancel
+
+        :param fraction: (float)
+        :return: (int) How many RSVPs changed
+        """
+        changed = 0
+        for event in self.events:
+            rsvps = self.rsvps[event["id"]]
+            changes = max(1, int(len(rsvps) * fraction))
+            attending = [r for r in rsvps if r["response"] == "yes"]
+            for rsvp in self.random.sample(attending, min(len(attending), changes // 2)):
+                rsvp["response"] = "no"
+                changed += 1
+            known = set(r["member"]["member_id"] for r in rsvps)
+            newcomers = [m for m in self.members if m["member_id"] not in known]
+            for member in self.random.sample(newcomers, min(len(newcomers), changes - changes // 2)):
+                rsvps.append({"member": dict(member), "response": "yes"})
+                changed += 1
+            event["yes_rsvp_count"] = len([r for r in rsvps if r["response"] == "yes"])
+        return changed
+
+    def transcript(self, commands, bot_id, seed=None):
+        """Chat messages mentioning the bot, spread over the event channels, as RTM events
+
+        :param commands: (int) How many messages
+        :param bot_id: (str) The bot's user id
+        :param seed: (int)
+        :return: (list) RTM message events
+        """
+        rnd = random.Random(seed)
+        channels = list(self.channels.values())
+        users = list(self.users) or ["U0"]
+        templates = ["table status", "detailed table status", "table 1", "next event", "events", "hello!",
+                     "who is {slack}", "thanks", "table status for {event}"]
+        messages = []
+        for _ in range(commands):
+            channel = rnd.choice(channels)
+            text = rnd.choice(templates).format(slack=self.users[rnd.choice(users)]["name"] if self.users else "",
+                                                event=channel["event"].split(" #")[0])
+            messages.append({"type": "message", "channel": channel["id"], "user": rnd.choice(users),
+                             "text": "<@{}> {}".format(bot_id, text), "ts": "{:.6f}".format(time())})
+        return messages
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+An in-memory index of the Trello "Address Book" board
+"""
+
+import threading
+from os import getpid
+from time import sleep
+
+import yaml
+
+from dave.log import logger
+
+
+class AddressBook(object):
+    def __init__(self, loader, refresh_interval=300):
+        """Creates an address book index, keyed by Meetup id, Meetup name and Slack name
+
+        :param loader: (callable) Returns a fresh BoardSnapshot of the address book board
+        :param refresh_interval: (int) Seconds between background reloads of the index
+        """
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self._by_id = {}
+        self._by_name = {}
+        self._by_slack = {}
+        self._loaded = False
+        self._restored = False
+        self._lock = threading.Lock()
+        self._refresher_pid = None
+
+    @staticmethod
+    def _entry(card):
+        try:
+            info = yaml.safe_load(card["desc"])
+        except yaml.YAMLError:
+            logger.debug("Unreadable address book card {}".format(card["name"]))
+            return None
+        if not isinstance(info, dict) or info.get("id") is None:
+            return None
+        return {"name": card["name"], "id": str(info["id"]), "slack": info.get("slack")}
+
+    def load(self):
+        """(Re)builds the whole index from one snapshot of the board
+
+        :return: None
+        """
+        self.rebuild(self.loader())
+
+    def rebuild(self, snapshot):
+        """(Re)builds the whole index from :snapshot:, e.g. after changes were pushed to it
+
+        :param snapshot: (BoardSnapshot) The address book board
+        :return: None
+        """
+        by_id, by_name, by_slack = {}, {}, {}
+        if snapshot:
+            open_lists = set(l["id"] for l in snapshot.open_lists())
+            for card in snapshot.cards.values():
+                if card.get("closed") or card["idList"] not in open_lists:
+                    continue
+                entry = self._entry(card)
+                if entry:
+                    self._index(entry, by_id, by_name, by_slack)
+        with self._lock:
+            self._by_id, self._by_name, self._by_slack = by_id, by_name, by_slack
+            self._loaded = True
+        logger.debug("Address book loaded with {} contacts".format(len(by_id)))
+
+    @staticmethod
+    def _index(entry, by_id, by_name, by_slack):
+        by_id[entry["id"]] = entry
+        if entry["name"] not in by_name or not by_name[entry["name"]]["slack"]:
+            by_name[entry["name"]] = entry
+        if entry["slack"]:
+            by_slack.setdefault(entry["slack"], entry)
+
+    def add(self, name, member_id, slack=None):
+        """Adds a contact to the index without reloading the board
+
+        :param name: (str) The Meetup name
+        :param member_id: (str) The Meetup id
+        :param slack: (str) The Slack name, if known
+        :return: None
+        """
+        self._ensure_loaded()
+        entry = {"name": name, "id": str(member_id), "slack": slack}
+        with self._lock:
+            self._index(entry, self._by_id, self._by_name, self._by_slack)
+
+    def export(self):
+        return self.all() if self._loaded else []
+
+    def restore(self, contacts):
+        """Serves contacts saved with export until the background refresh reloads the board
+
+        :param contacts: (list) As returned by export
+        :return: None
+        """
+        if self._loaded:
+            return
+        by_id, by_name, by_slack = {}, {}, {}
+        for entry in contacts:
+            self._index(entry, by_id, by_name, by_slack)
+        with self._lock:
+            self._by_id, self._by_name, self._by_slack = by_id, by_name, by_slack
+            self._loaded = True
+            self._restored = True
+        self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        if self._refresher_pid != getpid():
+            # Threads don't survive a fork, so every process starts its own refresher
+            self._refresher_pid = getpid()
+            refresher = threading.Thread(target=self._refresh, name="addressbook-refresh", daemon=True)
+            refresher.start()
+        if not self._loaded:
+            self.load()
+
+    def _refresh(self):
+        while True:
+            if self._restored:
+                # Revalidate restored contacts right away
+                self._restored = False
+            else:
+                sleep(self.refresh_interval)
+            try:
+                self.load()
+            except Exception as e:
+                logger.warning("Exception {} when refreshing the address book".format(e))
+
+    def by_id(self, member_id):
+        self._ensure_loaded()
+        return self._by_id.get(str(member_id))
+
+    def by_name(self, member_name):
+        self._ensure_loaded()
+        return self._by_name.get(member_name)
+
+    def by_slack_name(self, slack_name):
+        self._ensure_loaded()
+        return self._by_slack.get(slack_name)
+
+    def all(self):
+        self._ensure_loaded()
+        return list(self._by_id.values())
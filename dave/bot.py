@@ -1,24 +1,53 @@
 #!/usr/bin/env python
 
+import hashlib
 import json
 import random
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
 from os import environ
-from time import sleep
-from fuzzywuzzy import process
+from time import sleep, time
 
+from dave.disk_cache import DiskCache
 from dave.log import logger
 from dave.meetup import MeetupGroup
+from dave.metrics import metrics, summary as metrics_summary
+from dave.participants import diff_rsvps, known_participants, needs_migration, participant_names, \
+    stored_participants
+from dave.resolver import EventResolver
+from dave.scheduler import PollScheduler
 from dave.slack import Slack
 from dave.store import Store
 from dave.trello_boards import TrelloBoard
 
 sleep_time = int(environ.get('CHECK_TIME', '600'))
+min_sleep_time = int(environ.get('MIN_CHECK_TIME', '60'))
+max_sleep_time = int(environ.get('MAX_CHECK_TIME', '3600'))
+snapshot_ttl = int(environ.get('TRELLO_SNAPSHOT_TTL', '60'))
+addressbook_refresh = int(environ.get('ADDRESS_BOOK_REFRESH', '300'))
+meetup_concurrency = int(environ.get('MEETUP_CONCURRENCY', '8'))
+trello_write_rate = float(environ.get('TRELLO_WRITE_RATE', '10'))
+trello_write_workers = int(environ.get('TRELLO_WRITE_WORKERS', '4'))
+slack_directory_ttl = int(environ.get('SLACK_DIRECTORY_TTL', '3600'))
+slack_coalesce_window = int(environ.get('SLACK_COALESCE_WINDOW', '5'))
+snapshot_dir = environ.get('SNAPSHOT_DIR', '/tmp/dave-snapshots')
+snapshot_max_age = int(environ.get('SNAPSHOT_MAX_AGE', '86400'))
+snapshot_interval = int(environ.get('SNAPSHOT_INTERVAL', '300'))
+trello_webhook_url = environ.get('TRELLO_WEBHOOK_URL')
+trello_pushed_ttl = int(environ.get('TRELLO_PUSHED_TTL', '3600'))
+metrics_dir = environ.get('METRICS_DIR', '/tmp/dave-metrics')
+metrics_interval = int(environ.get('METRICS_INTERVAL', '15'))
 
 
 class Bot(object):
     def __init__(self):
+        """Creates the bot. Nothing here waits on the network: clients connect on first use and the events are
+        loaded by monitor_events and, in conversation workers, from the shared state on the first command.
+        """
+        self._started_at = time()
+        self._first_response_at = None
         meetup_key = environ.get('MEETUP_API_KEY')
         group_id = environ.get('MEETUP_GROUP_ID')
         slack_token = environ["SLACK_API_TOKEN"]
@@ -27,25 +56,138 @@ class Bot(object):
         bot_id = environ.get("BOT_ID")
         self.lab_channel_id = environ.get("LAB_CHANNEL_ID")
         self.team_name = environ["TRELLO_TEAM"]
-        self.storg = MeetupGroup(meetup_key, group_id)
-        self.chat = Slack(slack_token, bot_id)
-        self.trello = TrelloBoard(api_key=trello_key, token=trello_token)
+        self.storg = MeetupGroup(meetup_key, group_id, concurrency=meetup_concurrency)
+        self.chat = Slack(slack_token, bot_id, directory_ttl=slack_directory_ttl,
+                          coalesce_window=slack_coalesce_window)
+        self.trello = TrelloBoard(api_key=trello_key, token=trello_token, snapshot_ttl=snapshot_ttl,
+                                  addressbook_refresh=addressbook_refresh, write_rate=trello_write_rate,
+                                  write_workers=trello_write_workers, webhook_url=trello_webhook_url,
+                                  pushed_ttl=trello_pushed_ttl)
         self.ds = Store()
-        with open("dave/resources/phrases.json", "r") as phrases:
-            self._phrases = json.loads(phrases.read())
-        if self.storg.upcoming_events:
-            current_event_ids = [e["id"] for e in self.storg.upcoming_events]
-            self.stored_events = self.ds.retrieve_events(current_event_ids)
-        else:
-            self.stored_events = {}
+        self.disk = DiskCache(snapshot_dir, max_age=snapshot_max_age)
+        self._phrase_book = None
+        self.stored_events = {}
+        self._saved_fingerprints = {}
+        self._published_upcoming = None
+        self._state_version = None
+        self._monitoring = False
+        self._resolver = EventResolver()
+        self._failed_rsvps = {}
+        self._failed_rsvps_lock = threading.Lock()
 
-        logger.debug("Known events: {}".format(self.stored_events))
         logger.debug("Env: {}".format(environ.items()))
         self.chat.message("Reporting for duty!", environ.get("LAB_CHANNEL_ID"))
 
+    @property
+    def _phrases(self):
+        if self._phrase_book is None:
+            with open("dave/resources/phrases.json", "r") as phrases:
+                self._phrase_book = json.loads(phrases.read())
+        return self._phrase_book
+
+    def _load_events(self):
+        """Loads the upcoming events from Meetup and what the Store knows about them, in parallel"""
+        loading_started = time()
+
+        def stored_upcoming_events():
+            _, upcoming = self.ds.events_state()
+            return self.ds.retrieve_events(upcoming or [])
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            meetup = pool.submit(self.storg.update_upcoming_events)
+            stored = pool.submit(stored_upcoming_events)
+            meetup.result()
+            known_events = stored.result()
+
+        current_event_ids = [e["id"] for e in self.storg.upcoming_events]
+        missing = [e for e in current_event_ids if e not in known_events]
+        if missing:
+            known_events.update(self.ds.retrieve_events(missing))
+        self.stored_events = {e: known_events[e] for e in current_event_ids if e in known_events}
+        self._saved_fingerprints = {k: self._fingerprint(v) for k, v in self.stored_events.items()}
+        self._resolver.index(self.event_names)
+        logger.debug("Known events: {}".format(self.stored_events))
+        logger.info("Events loaded in {:.2f}s".format(time() - loading_started))
+
+    def _restore(self, events=False):
+        """Serves the caches saved on disk before the last restart, until they're revalidated
+
+        :param events: (bool) Whether to restore the events too. Only until the shared state is first synced.
+        """
+        boards, age = self.disk.load_merged("trello")
+        if boards:
+            self.trello.restore(boards)
+            logger.info("Restored {} Trello boards saved {:.0f}s ago".format(len(boards), age))
+        contacts, age = self.disk.load("addressbook")
+        if contacts:
+            self.trello.contacts.restore(contacts)
+            logger.info("Restored {} contacts saved {:.0f}s ago".format(len(contacts), age))
+        saved, age = self.disk.load("meetup")
+        if events and saved and self._state_version is None:
+            self.stored_events = {e: saved["events"][e] for e in saved["upcoming"] if e in saved["events"]}
+            self.storg.upcoming_events = list(self.stored_events.values())
+            self._resolver.index(self.event_names)
+            logger.info("Restored {} events saved {:.0f}s ago".format(len(self.stored_events), age))
+
+    @staticmethod
+    def _last_action(board):
+        # Trello ids grow with time, so the board synced up to the latest action is the newest
+        return board["actions"][0]["id"] if board["actions"] else ""
+
+    def _persist(self):
+        """Saves the Trello boards, the address book and, from the process monitoring them, the events to disk.
+        Each process caches boards of its own, so they're merged with the boards the other processes saved.
+        """
+        self.disk.merge("trello", self.trello.export(), newest=self._last_action)
+        contacts = self.trello.contacts.export()
+        if contacts:
+            self.disk.save("addressbook", contacts)
+        stored_events = dict(self.stored_events)
+        if stored_events and self._monitoring:
+            upcoming = [e["id"] for e in self.storg.upcoming_events]
+            self.disk.save("meetup", {"upcoming": upcoming, "events": stored_events})
+
+    def _persist_periodically(self):
+        while True:
+            sleep(snapshot_interval)
+            try:
+                self._persist()
+            except Exception as e:
+                logger.warning("Exception {} when saving snapshots".format(e))
+
+    def _in_background(self, *loads):
+        def quietly(load):
+            try:
+                load()
+            except Exception as e:
+                logger.warning("Exception {} in {}".format(e, getattr(load, "__name__", load)))
+
+        for load in loads:
+            threading.Thread(target=quietly, args=(load,), daemon=True).start()
+
+    def warm_up(self):
+        """Restores the caches saved on disk, then loads the Slack channel directory and the address book in the
+        background, so that neither the worker's start nor its first commands wait for them
+        """
+        self._restore(events=True)
+        self._in_background(self.chat.warm_up, self.trello.contacts.all, self._persist_periodically)
+
+    def follow_trello(self, pushes):
+        """Applies the Trello changes the webhook receiver puts on :pushes: to this process' caches"""
+        def follow():
+            self.trello.follow(pushes)
+
+        self._in_background(follow)
+
+    def after_fork(self):
+        """Gives a freshly started worker process connections of its own"""
+        self.ds.reconnect()
+        self.storg.reset_session()
+        metrics.publish_periodically(metrics_dir, metrics_interval)
+
     @property
     def event_names(self):
-        return [e["name"] for e in self.stored_events.values()]
+        return [e["name"] for e in list(self.stored_events.values())]
 
     def _handle_event(self, event):
         cet = timezone(timedelta(0, 3600), "CET")
@@ -60,51 +202,71 @@ class Bot(object):
             self.trello.create_board(event["name"], team_name=self.team_name)
             self.stored_events[event_id] = event
             self.stored_events[event_id]["participants"] = []
+            self._resolver.index(self.event_names)
 
-    def _handle_rsvps(self, event):
+    def _handle_rsvps(self, event, rsvps=None):
         event_id = event["id"]
         event_name = event["name"]
         venue = event["venue"]["name"]
         channel_for_venue = {"STORG Clubhouse": "#storg-south", "STORG Northern Clubhouse": "#storg-north"}
         channel = channel_for_venue.get(venue)
-        newcomers = []
-        cancels = []
-
-        for rsvp in self.storg.rsvps(event_id):
-            member_name = rsvp["member"]["name"]
-            member_id = rsvp["member"]["member_id"]
-            try:
-                known_participants = self.stored_events[event_id]["participants"]
-            except KeyError:
-                logger.error("No key {}".format(event_id))
-                logger.error("Known events: {}".format(self.stored_events))
-
-            if member_name not in known_participants and rsvp["response"] == "yes":
-                self.trello.add_rsvp(name=member_name, member_id=member_id, board_name=event_name)
-                # self.trello.add_contact(member_name=member_name, member_id=member_id)
-                newcomers.append(member_name)
-                sleep(0.2)
-            elif member_name in known_participants and rsvp["response"] == "no":
-                self.trello.cancel_rsvp(member_id, board_name=event_name)
-                cancels.append(member_name)
+        stored_event = self.stored_events.get(event_id)
+        if stored_event is None:
+            logger.error("No key {}".format(event_id))
+            logger.error("Known events: {}".format(self.stored_events))
+            return False
+        if rsvps is None:
+            rsvps = self.storg.iter_rsvps(event_id)
+        if needs_migration(stored_event):
+            rsvps = list(rsvps)
+            if not rsvps:
+                # A failed Meetup fetch looks the same, and migrating from it would announce everyone again
+                logger.warning("No RSVPs for {}, migrating its participants on a later check".format(event_name))
+                return False
+
+        known = known_participants(stored_event, rsvps)
+        newcomers, cancels = diff_rsvps(known, rsvps)
+        with self._failed_rsvps_lock:
+            failed = self._failed_rsvps.pop(event_id, ())
+        # Their card was never written. They were announced and stored already, so only the card is retried.
+        retries = [(m, known[m]) for m in failed if m in known and m not in cancels]
+        for member_id, member_name in list(newcomers.items()) + retries:
+            self._add_rsvp(event_id, event_name, member_id, member_name)
+            # self.trello.add_contact(member_name=member_name, member_id=member_id)
+        for member_id in cancels:
+            self.trello.cancel_rsvp(member_id, board_name=event_name)
 
         if newcomers or cancels:
+            changes = [(m, n, "yes") for m, n in newcomers.items()] + [(m, n, "no") for m, n in cancels.items()]
+            self.ds.store_rsvps(event_id, venue, changes)
             spots_left = int(event["rsvp_limit"]) - int(event["yes_rsvp_count"]) if event["rsvp_limit"] else 'Unknown'
 
             if newcomers:
-                logger.info("Newcomers found: {}".format(newcomers))
-                self.chat.new_rsvp(', '.join(newcomers), "yes", event_name, spots_left, channel)
-                self.stored_events[event_id]["participants"] += newcomers
-                logger.debug("Participant list: {}".format(self.stored_events[event_id]["participants"]))
+                logger.info("Newcomers found: {}".format(list(newcomers.values())))
+                self.chat.new_rsvp(', '.join(newcomers.values()), "yes", event_name, spots_left, channel)
+                known.update(newcomers)
 
             if cancels:
-                logger.info("Cancellations found: {}".format(cancels))
-                self.chat.new_rsvp(', '.join(cancels), "no", event_name, spots_left, channel)
-                self.stored_events[event_id]["participants"] = [p for p in self.stored_events[event_id]["participants"]
-                                                                if p not in cancels]
-                logger.debug("Participant list: {}".format(self.stored_events[event_id]["participants"]))
+                logger.info("Cancellations found: {}".format(list(cancels.values())))
+                self.chat.new_rsvp(', '.join(cancels.values()), "no", event_name, spots_left, channel)
+                for member_id in cancels:
+                    del known[member_id]
+            logger.debug("Participant list: {}".format(known))
         else:
             logger.info("No changes for {}".format(event_name))
+        # Also keeps a migration from a list of names, even if nothing else changed
+        stored_event["participants"] = stored_participants(known)
+        return bool(newcomers or cancels)
+
+    def _add_rsvp(self, event_id, event_name, member_id, member_name):
+        written = self.trello.add_rsvp(name=member_name, member_id=member_id, board_name=event_name)
+        if written is not None:
+            written.add_done_callback(lambda f: f.exception() and self._rsvp_failed(event_id, member_id))
+
+    def _rsvp_failed(self, event_id, member_id):
+        """Called from the Trello writer when a newcomer's card couldn't be written"""
+        with self._failed_rsvps_lock:
+            self._failed_rsvps.setdefault(event_id, set()).add(member_id)
 
     def _check_for_greeting(self, sentence):
         """If any of the words in the user's input was a greeting, return a greeting response"""
@@ -125,7 +287,7 @@ class Bot(object):
     def _next_event_info(self):
         next_event = self.next_event
         if next_event:
-            participants = next_event["participants"]
+            participants = participant_names(next_event)
             event_time = next_event["time"] / 1000
             date = datetime.fromtimestamp(event_time).strftime('%A %B %d at %H:%M')
             name = next_event["name"]
@@ -138,8 +300,13 @@ class Bot(object):
 
     def _all_events_info(self):
         msgs = ["Here are our next events.\n"]
-        for event in self.stored_events.values():
-            participants = event["participants"]
+        # Only the upcoming ones: the monitor keeps past events, and may be adding events from another thread
+        stored_events = self.stored_events
+        for upcoming in list(self.storg.upcoming_events):
+            event = stored_events.get(upcoming["id"])
+            if event is None:
+                continue
+            participants = participant_names(event)
             event_time = event["time"] / 1000
             date = datetime.fromtimestamp(event_time).strftime('%A %B %d at %H:%M')
             name = event["name"]
@@ -155,10 +322,10 @@ class Bot(object):
 
         logger.debug("Request {}".format(request))
         logger.debug("Channel {}".format(channel))
-        events = self.event_names
-        logger.debug("Events {}".format(events))
-        event_name = process.extractOne(request, events)[0]
+        event_name = self._resolver.resolve(request)
         logger.debug("Chose {}".format(event_name))
+        if not event_name:
+            return json.dumps([])
 
         table_info = self.trello.tables_detail(event_name)
 
@@ -192,41 +359,145 @@ class Bot(object):
 
         return json.dumps(tables)
 
-    def check_events(self):
+    def check_events(self, scheduler=None):
         logger.info("Checking for event updates")
         self.storg.update_upcoming_events()
-        for event in self.storg.upcoming_events:
+        events = self.storg.upcoming_events
+        for event in events:
             self._handle_event(event)
-            self._handle_rsvps(event)
-        logger.info("Done checking")
+        if scheduler:
+            events = scheduler.due(events)
+        events_by_id = {e["id"]: e for e in events}
+        for event_id, rsvps in self.storg.rsvps_for(list(events_by_id)):
+            event = events_by_id[event_id]
+            changed = self._handle_rsvps(event, rsvps)
+            if scheduler:
+                scheduler.record(event, changed)
+        logger.info("Done checking {} events".format(len(events)))
 
-    def save_events(self):
-        logger.debug("Saving events")
-        self.ds.store_events(self.stored_events)
+    @staticmethod
+    def _fingerprint(event):
+        return hashlib.sha1(json.dumps(event, sort_keys=True).encode()).hexdigest()
 
-    def monitor_events(self, sleep_time=900):
+    def save_events(self):
+        changed, fingerprints = {}, {}
+        for event_id, event in self.stored_events.items():
+            fingerprint = self._fingerprint(event)
+            if self._saved_fingerprints.get(event_id) != fingerprint:
+                changed[event_id] = event
+                fingerprints[event_id] = fingerprint
+        upcoming = sorted(e["id"] for e in self.storg.upcoming_events)
+        if not changed and upcoming == self._published_upcoming:
+            logger.debug("No event changes to save")
+            return
+        if changed:
+            logger.debug("Saving events {}".format(list(changed)))
+            self.ds.store_events(changed)
+            self._saved_fingerprints.update(fingerprints)
+        self.ds.publish_events(upcoming, list(changed))
+        self._published_upcoming = upcoming
+
+    def _sync_shared_state(self):
+        """Picks up the events the monitor process has saved since the last call. Costs no database round-trip
+        unless something changed.
+        """
+        if self._state_version is None:
+            version, upcoming = self.ds.listen_events()
+            changed = set(upcoming or [])
+        else:
+            notifications = self.ds.poll_events()
+            if notifications is None:
+                self._state_version = None
+                return self._sync_shared_state()
+            notifications = [n for n in notifications if n["version"] > self._state_version]
+            if not notifications:
+                return
+            latest = notifications[-1]
+            version, upcoming = latest["version"], latest["upcoming"]
+            if notifications[0]["version"] > self._state_version + 1:
+                # Missed a notification, reload everything that's upcoming
+                changed = set(upcoming)
+            else:
+                changed = set(e for n in notifications for e in n["changed"])
+
+        if upcoming is not None:
+            missing = set(upcoming) - set(self.stored_events)
+            fetched = self.ds.retrieve_events(list(changed | missing))
+            known_events = dict(self.stored_events, **fetched)
+            # Events that are no longer upcoming are dropped
+            self.stored_events = {e: known_events[e] for e in upcoming if e in known_events}
+            fingerprints = dict(self._saved_fingerprints, **{k: self._fingerprint(v) for k, v in fetched.items()})
+            self._saved_fingerprints = {k: v for k, v in fingerprints.items() if k in self.stored_events}
+            self.storg.upcoming_events = list(self.stored_events.values())
+            self._resolver.index(self.event_names)
+            logger.debug("Synced event state version {}".format(version))
+        self._state_version = version
+
+    def start_monitoring(self, sleep_time=sleep_time, restore=True):
+        """Loads the events and registers the Trello webhooks. Can be called again if loading the events failed.
+
+        :param sleep_time: (int) The base interval between checks of an event
+        :param restore: (bool) Whether to restore the caches saved on disk and keep saving them. Not needed when
+                        warm_up already did.
+        :return: (PollScheduler) The scheduler to pass to check_once
+        """
+        if not self._monitoring:
+            self._monitoring = True
+            if restore:
+                self._restore()
+                self._in_background(self._persist_periodically)
+            self._in_background(self.trello.register_webhooks)
+        self._load_events()
+        return PollScheduler(base_interval=sleep_time, min_interval=min_sleep_time, max_interval=max_sleep_time)
+
+    def check_once(self, scheduler):
+        """Checks the events that are due and saves what changed
+
+        :param scheduler: (PollScheduler)
+        :return: (float) Seconds until the next check
+        """
+        try:
+            self.check_events(scheduler)
+        except Exception as e:
+            self.chat.message("Swallowed exception at check_events: {}".format(e), self.lab_channel_id)
+            logger.error("Swallowed exception at check_events: {}".format(e))
+        self.save_events()
+        wait = scheduler.next_wakeup()
+        logger.debug("Next check in {:.0f}s".format(wait))
+        return wait
+
+    def monitor_events(self, sleep_time=sleep_time):
+        scheduler = None
         while True:
             try:
-                self.check_events()
+                if scheduler is None:
+                    scheduler = self.start_monitoring(sleep_time)
+                wait = self.check_once(scheduler)
             except Exception as e:
-                self.chat.message("Swallowed exception at check_events: {}".format(e), self.lab_channel_id)
-                logger.error("Swallowed exception at check_events: {}".format(e))
-            self.save_events()
-            sleep(sleep_time)
+                # E.g. Meetup or Postgres unreachable. The other processes keep going, so this one does too.
+                logger.error("Swallowed exception at monitor_events, retrying in {}s: {}".format(min_sleep_time, e))
+                wait = min_sleep_time
+            sleep(wait)
 
     def read_chat(self, tasks):
+        metrics.publish_periodically(metrics_dir, metrics_interval)
         self.chat.rtm(tasks)
 
     def respond(self, response, channel, attachments=None):
         self.chat.message(content=response, channel=channel, attachments=attachments)
+        if self._first_response_at is None:
+            self._first_response_at = time()
+            logger.info("First response {:.2f}s after startup".format(self._first_response_at - self._started_at))
 
     @property
     def next_event(self):
-        if not self.storg.upcoming_events:
-            return None
-        self.storg.upcoming_events.sort(key=lambda d: d["time"])
-        next_id = self.storg.upcoming_events[0]["id"]
-        return self.stored_events[next_id]
+        # A sorted copy, skipping events not stored yet: like in _all_events_info, the monitor may be adding them
+        stored_events = self.stored_events
+        for upcoming in sorted(list(self.storg.upcoming_events), key=lambda d: d["time"]):
+            event = stored_events.get(upcoming["id"])
+            if event is not None:
+                return event
+        return None
 
     def table(self, event_name, table_title):
         return self.trello.table(event_name, table_title)
@@ -241,65 +512,104 @@ class Bot(object):
         return "{} is known on Meetup as *{}*: {}".format(slack_name, meetup_username, profile_url)
 
     def conversation(self, task_queue):
-        unknown_responses = self._phrases["responses"]["unknown"]
         while True:
             try:
                 command, channel_id, user_id = task_queue.get()
-                attachments = None
-                if command.startswith("help"):
-                    response = "Hold on tight, I'm coming!\nJust kidding!\n\n{}".format(self._phrases["responses"]["help"])
-                elif command.lower().startswith("table status"):
-                    response = "Available tables"
-                    attachments = self._tables_info(channel=self.chat.channel_name(channel_id),
-                                                    request=command.split('table status')[-1])
-                elif command.lower().startswith("detailed table status"):
-                    response = "Available tables"
-                    attachments = self._tables_info(channel=self.chat.channel_name(channel_id),
-                                                    request=command.split('table status')[-1], detail=True)
-                elif command.lower().startswith("table"):
-                    full_req = command.split('table')[-1].strip()
-                    split_req = full_req.split(" ", 1)
-                    table_number = split_req[0]
-                    if len(split_req) == 2:
-                        request = split_req[1]
-                    else:
-                        request = None
-                    logger.debug("Table {}".format(table_number))
-                    response = "Details for table {}".format(table_number)
-                    attachments = self._tables_info(channel=self.chat.channel_name(channel_id),
-                                                    request=request, detail=True, table_number=table_number)
-                elif "next event" in command.lower() and "events" not in command.lower():
-                    response = self._next_event_info()
-                elif "events" in command.lower():
-                    response = self._all_events_info()
-                elif "thanks" in command.lower() or "thank you" in command.lower():
-                    response = random.choice(self._phrases["responses"]["thanks"])
-                elif "who is" in command.lower():
-                    slack_name = command.split("who is")[-1].strip("?").strip()
-                    response = self._user_info(slack_name)
-                elif command.lower().startswith("what can you do") or command.lower() == "man":
-                    response = self._phrases["responses"]["help"]
-                elif "admin info" in command.lower():
-                    response = self._phrases["responses"]["admin_info"]
-                elif "add table" == command.lower():
-                    response = "Sure thing. Just send me a message in the following format:\n" \
-                               "add table <TABLE TITLE>: <BLURB>, Players: <MAX NUMBER OF PLAYERS>, e.g.\n" \
-                               "```add table Rat Queens (Fate): One more awesome Rat Queens adventure, Players: 5```"
-                elif command.lower().startswith("add table"):
-                    response = self._add_table(command, channel_id)
-                else:
-                    response = self._check_for_greeting(command) if self._check_for_greeting(command) else random.choice(
-                        unknown_responses)
-                self.respond(response, channel_id, attachments=attachments)
             except Exception as e:
-                self.chat.message("Swallowed exception at conversation: {}".format(e), self.lab_channel_id)
                 logger.error("Swallowed exception at conversation: {}".format(e))
+                continue
+            self.answer(command, channel_id, user_id)
+
+    def answer(self, command, channel_id, user_id, sync=True):
+        """Answers one command. Never raises: failures are reported on the lab channel.
+
+        :param command: (str) The message, without the bot's @-name
+        :param channel_id: (str) Where it was said
+        :param user_id: (str) Who said it
+        :param sync: (bool) Whether to pick up the events the monitor saved first. Not needed when the monitor
+                     runs in this process.
+        :return: None
+        """
+        started = time()
+        kind = "unknown"
+        try:
+            if sync:
+                try:
+                    self._sync_shared_state()
+                except Exception as e:
+                    logger.warning("Answering from local event state, sync failed: {}".format(e))
+            attachments = None
+            if command.startswith("help"):
+                kind = "help"
+                response = "Hold on tight, I'm coming!\nJust kidding!\n\n{}".format(self._phrases["responses"]["help"])
+            elif command.lower().startswith("table status"):
+                kind = "table status"
+                response = "Available tables"
+                attachments = self._tables_info(channel=self.chat.channel_name(channel_id),
+                                                request=command.split('table status')[-1])
+            elif command.lower().startswith("detailed table status"):
+                kind = "detailed table status"
+                response = "Available tables"
+                attachments = self._tables_info(channel=self.chat.channel_name(channel_id),
+                                                request=command.split('table status')[-1], detail=True)
+            elif command.lower().startswith("table"):
+                kind = "table"
+                full_req = command.split('table')[-1].strip()
+                split_req = full_req.split(" ", 1)
+                table_number = split_req[0]
+                if len(split_req) == 2:
+                    request = split_req[1]
+                else:
+                    request = None
+                logger.debug("Table {}".format(table_number))
+                response = "Details for table {}".format(table_number)
+                attachments = self._tables_info(channel=self.chat.channel_name(channel_id),
+                                                request=request, detail=True, table_number=table_number)
+            elif "next event" in command.lower() and "events" not in command.lower():
+                kind = "next event"
+                response = self._next_event_info()
+            elif "events" in command.lower():
+                kind = "events"
+                response = self._all_events_info()
+            elif "thanks" in command.lower() or "thank you" in command.lower():
+                kind = "thanks"
+                response = random.choice(self._phrases["responses"]["thanks"])
+            elif "who is" in command.lower():
+                kind = "who is"
+                slack_name = command.split("who is")[-1].strip("?").strip()
+                response = self._user_info(slack_name)
+            elif command.lower().startswith("what can you do") or command.lower() == "man":
+                kind = "what can you do"
+                response = self._phrases["responses"]["help"]
+            elif command.lower() == "metrics":
+                kind = "metrics"
+                response = metrics_summary(metrics_dir)
+            elif "admin info" in command.lower():
+                kind = "admin info"
+                response = self._phrases["responses"]["admin_info"]
+            elif "add table" == command.lower():
+                kind = "add table help"
+                response = "Sure thing. Just send me a message in the following format:\n" \
+                           "add table <TABLE TITLE>: <BLURB>, Players: <MAX NUMBER OF PLAYERS>, e.g.\n" \
+                           "```add table Rat Queens (Fate): One more awesome Rat Queens adventure, Players: 5```"
+            elif command.lower().startswith("add table"):
+                kind = "add table"
+                response = self._add_table(command, channel_id)
+            else:
+                response = self._check_for_greeting(command) if self._check_for_greeting(command) else random.choice(
+                    self._phrases["responses"]["unknown"])
+            self.respond(response, channel_id, attachments=attachments)
+            metrics.record("command", kind, time() - started)
+        except Exception as e:
+            metrics.record("command", kind, time() - started, error=True)
+            self.chat.message("Swallowed exception at conversation: {}".format(e), self.lab_channel_id)
+            logger.error("Swallowed exception at conversation: {}".format(e))
 
     def _add_table(self, command, channel_id):
         title, info = command.split(":", 1)
         title = title.split("add table")[-1]
         try:
-            board_url = self.chat.channel_topic(channel_id).strip("<").strip(">")
+            board_url = self.chat.channel_topic(channel_id, cached=False).strip("<").strip(">")
         except ValueError:
             return "I can't find the Trello board for this channel." \
                    " Make sure the topic of this channel is the URL of the event's Trello board"
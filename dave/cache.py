@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+A TTL cache with bounded negative caching, and a decorator to cache instance methods with it
+"""
+
+import inspect
+import threading
+from collections import OrderedDict
+from functools import wraps
+from time import time
+
+
+class TTLCache(object):
+    def __init__(self, ttl=300, negative_ttl=30, maxsize=1024, negative_maxsize=128):
+        """Creates a cache whose entries expire after :ttl: seconds. None results are cached separately, for
+        :negative_ttl: seconds, and there can be at most :negative_maxsize: of them.
+
+        :param ttl: (float) Seconds a value is served
+        :param negative_ttl: (float) Seconds a None is served
+        :param maxsize: (int) The most values kept; the oldest is dropped first
+        :param negative_maxsize: (int) The most Nones kept; the oldest is dropped first
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = maxsize
+        self.negative_maxsize = negative_maxsize
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+        self._negatives = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Looks up :key:
+
+        :param key: (hashable)
+        :return: (tuple) Whether it was a hit, and the cached value
+        """
+        now = time()
+        with self._lock:
+            for entries in (self._values, self._negatives):
+                if key in entries:
+                    expires, value = entries[key]
+                    if expires > now:
+                        self.hits += 1
+                        return True, value
+                    del entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        if value is None:
+            entries, ttl, maxsize = self._negatives, self.negative_ttl, self.negative_maxsize
+        else:
+            entries, ttl, maxsize = self._values, self.ttl, self.maxsize
+        with self._lock:
+            self._values.pop(key, None)
+            self._negatives.pop(key, None)
+            entries[key] = (time() + ttl, value)
+            while len(entries) > maxsize:
+                entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Drops :key:, or everything if no key is given
+
+        :param key: (hashable)
+        :return: None
+        """
+        with self._lock:
+            if key is None:
+                self._values.clear()
+                self._negatives.clear()
+            else:
+                self._values.pop(key, None)
+                self._negatives.pop(key, None)
+
+    def invalidate_negatives(self):
+        """Drops every cached None, e.g. after something was created that earlier lookups couldn't find"""
+        with self._lock:
+            self._negatives.clear()
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._values),
+                "negative_size": len(self._negatives)}
+
+
+def cached(cache_name):
+    """Caches an instance method in the TTLCache stored in the instance's :_caches: dict under :cache_name:.
+    Entries are keyed by the method's arguments, so f(1) and f(x=1) share one.
+
+    :param cache_name: (str)
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(bound.arguments.values())[1:]
+            cache = self._caches[cache_name]
+            hit, value = cache.get(key)
+            if hit:
+                return value
+            value = method(self, *args, **kwargs)
+            cache.set(key, value)
+            return value
+        return wrapper
+    return decorator
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Snapshots of the bot's caches on disk, so a restarted bot doesn't start cold
+"""
+
+import fcntl
+import json
+import os
+from time import time
+
+from dave.log import logger
+
+FORMAT_VERSION = 2
+
+
+class DiskCache(object):
+    def __init__(self, directory, max_age=86400):
+        """Creates a disk cache with one JSON file per section
+
+        :param directory: (str) Where the files are kept. Should survive a restart.
+        :param max_age: (int) Seconds after which a saved section is ignored
+        """
+        self.directory = directory
+        self.max_age = max_age
+
+    def _path(self, section):
+        return os.path.join(self.directory, "{}.json".format(section))
+
+    def save(self, section, data):
+        """Writes :data: for :section:, atomically
+
+        :param section: (str) E.g. "trello"
+        :param data: Anything JSON serializable
+        :return: None
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(section)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump({"version": FORMAT_VERSION, "saved_at": time(), "data": data}, f)
+        os.replace(tmp_path, path)
+        logger.debug("Saved {} to {}".format(section, path))
+
+    def load(self, section):
+        """Reads what was last saved for :section:
+
+        :param section: (str)
+        :return: (tuple) The data and its age in seconds, or (None, None) if it's missing, unreadable, from
+                 another format version or older than :max_age:
+        """
+        try:
+            with open(self._path(section), "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if saved.get("version") != FORMAT_VERSION:
+            logger.info("Ignoring {} saved in format {}".format(section, saved.get("version")))
+            return None, None
+        age = time() - saved.get("saved_at", 0)
+        if age > self.max_age:
+            logger.info("Ignoring {} saved {:.0f}s ago".format(section, age))
+            return None, None
+        return saved["data"], age
+
+    def merge(self, section, items, newest):
+        """Saves :items: for :section: along with the items other processes saved there, one per id. Items
+        nobody saved for :max_age: are dropped.
+
+        :param section: (str) E.g. "trello"
+        :param items: (list) JSON serializable dicts, each with an "id"
+        :param newest: (callable) Called with two versions of an item; the one it returns more for is kept
+        :return: None
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open("{}.lock".format(self._path(section)), "a") as lock:
+            # Every process merges into the same file, one at a time
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            saved, _ = self.load(section)
+            now = time()
+            entries = {k: v for k, v in (saved or {}).items() if now - v["saved_at"] <= self.max_age}
+            for item in items:
+                entry = entries.get(item["id"])
+                if entry is None or newest(item) >= newest(entry["item"]):
+                    entries[item["id"]] = {"saved_at": now, "item": item}
+            self.save(section, entries)
+
+    def load_merged(self, section):
+        """Reads the items saved for :section: with merge
+
+        :param section: (str)
+        :return: (tuple) The items and the age of the section in seconds, or (None, None), see load
+        """
+        entries, age = self.load(section)
+        if not entries:
+            return None, None
+        return [e["item"] for e in entries.values()], age
@@ -1,20 +1,42 @@
 #!/usr/bin/env python
 
 import requests
+from time import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from dave.log import logger
+from dave.metrics import metrics
+
+# Results per page, and the fields the bot uses
+PAGE_SIZE = 200
+EVENT_FIELDS = "id,name,time,venue,rsvp_limit,yes_rsvp_count,event_url"
+RSVP_FIELDS = "member,response"
 
 
 class MeetupGroup(object):
-    def __init__(self, api_key, group_id):
+    def __init__(self, api_key, group_id, concurrency=8):
         """ Creates a Meetup Group object
         :param api_key: (str) The API key for your Meetup account
         :param group_id: (int) The group_id of the Meetup Group. Get it at GET /2/groups
+        :param concurrency: (int) How many requests may be in flight at the same time
         """
         self.api_url = "http://api.meetup.com"
         self.api_key = api_key
         self.group_id = group_id
-        self._upcoming_events = {}
-        self.update_upcoming_events()
+        self.concurrency = max(1, concurrency)
+        self.session = self._new_session()
+        self._upcoming_events = []
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def reset_session(self):
+        """Replaces the pooled session, so a forked process doesn't share sockets with its parent"""
+        self.session = self._new_session()
 
     @property
     def upcoming_events(self):
@@ -30,9 +52,21 @@ class MeetupGroup(object):
 
         :return: (list) A list of dicts, one dict per event
         """
-        params = {"key": self.api_key, "group_id": self.group_id, "status": "upcoming"}
+        params = {"key": self.api_key, "group_id": self.group_id, "status": "upcoming", "only": EVENT_FIELDS}
         self._upcoming_events = self._get("/2/events", params)
 
+    def _rsvp_params(self, event_id):
+        return {"event_id": event_id, "key": self.api_key, "only": RSVP_FIELDS}
+
+    def iter_rsvps(self, event_id):
+        """Yields the RSVPs for a specific event one by one, fetching a page at a time
+        https://secure.meetup.com/meetup_api/console/?path=/2/rsvps
+
+        :param event_id: (str) The id of the event you're querying
+        :return: (generator) RSVP dicts
+        """
+        return self._results("/2/rsvps", self._rsvp_params(event_id))
+
     def rsvps(self, event_id):
         """Get's all RSVPs for a specific event
         https://secure.meetup.com/meetup_api/console/?path=/2/rsvps
@@ -40,20 +74,70 @@ class MeetupGroup(object):
         :param event_id: (str) The id of the event you're querying
         :return: (list) A list of dicts, one dict per RSVP
         """
-        params = {"event_id": event_id, "key": self.api_key}
-        return self._get("/2/rsvps", params)
+        return list(self.iter_rsvps(event_id))
+
+    def rsvps_for(self, event_ids):
+        """Gets the RSVPs of several events. The first pages are fetched concurrently, over the pooled session,
+        and every event is yielded as soon as its first page is in. Further pages are fetched as its RSVPs are
+        consumed.
+
+        :param event_ids: (list) The ids of the events you're querying
+        :return: (generator) (event id, RSVP iterator) tuples, in the order the first pages came in
+        """
+        if not event_ids:
+            return
+        url = self.api_url + "/2/rsvps"
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(event_ids))) as pool:
+            first_pages = {pool.submit(self._fetch, url, self._rsvp_params(e), "/2/rsvps"): e for e in event_ids}
+            for first_page in as_completed(first_pages):
+                yield first_pages[first_page], self._results("/2/rsvps", None, first_page.result())
 
     def _get(self, path, params):
         """ Do a GET towards the Meetup API
         :param path: (str) The path to GET
         :param params: (dict) Extra parameters to pass to the request
-        :return: (list) The "response" list contained in the Meetup API response
+        :return: (list) The "results" of every page of the Meetup API response
         """
-        url = self.api_url + path
-        req = requests.get(url, params)
+        return list(self._results(path, params))
+
+    def _results(self, path, params, first_page=None):
+        """Yields the results of a GET towards the Meetup API one by one, following the meta.next link of every
+        page. A page that can't be fetched ends the results.
+
+        :param path: (str) The path to GET
+        :param params: (dict) Extra parameters to pass to the request
+        :param first_page: (dict) The first page, if it was already fetched
+        :return: (generator)
+        """
+        page = first_page if first_page is not None else self._fetch(self.api_url + path, params, path)
+        while page:
+            for result in page.get("results", []):
+                yield result
+            next_url = page.get("meta", {}).get("next")
+            page = self._fetch(next_url, None, path) if next_url else None
+
+    def _fetch(self, url, params, path):
+        """Gets one page from the Meetup API
+
+        :param url: (str) The URL to GET
+        :param params: (dict) Extra parameters to pass to the request
+        :param path: (str) The API path, for the metrics
+        :return: (dict) The decoded page, or an empty dict if the request failed
+        """
+        params = dict(params, page=PAGE_SIZE) if params is not None else None
+        started = time()
         try:
-            return req.json()["results"]
+            req = self.session.get(url, params=params)
         except Exception:
-            logger.debug("GET {} failed: {}".format(self.api_url + path, req.headers))
-            return []
-
+            metrics.record("meetup", path, time() - started, error=True)
+            raise
+        try:
+            page = req.json()
+        except ValueError:
+            page = None
+        if not isinstance(page, dict) or "results" not in page:
+            metrics.record("meetup", path, time() - started, error=True)
+            logger.debug("GET {} failed: {}".format(url, req.headers))
+            return {}
+        metrics.record("meetup", path, time() - started)
+        return page
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""
+Call counts, error counts and latency histograms for every external dependency and chat command.
+
+Each process keeps its own registry in `metrics` and publishes it to a shared directory; `collect` merges what
+every live process published.
+"""
+
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from time import sleep, time
+
+from dave.log import logger
+
+# Upper bounds, in seconds, of the latency histogram buckets. The last bucket catches everything slower.
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TRELLO_ID = re.compile(r"/[0-9a-f]{24}")
+
+
+class Metrics(object):
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+        self._publisher_pid = None
+
+    def record(self, dependency, endpoint, seconds, error=False):
+        """Records one call
+
+        :param dependency: (str) E.g. "meetup", "trello", "slack", "postgres" or "command"
+        :param endpoint: (str) E.g. "/2/rsvps"
+        :param seconds: (float) How long the call took
+        :param error: (bool) Whether it failed
+        :return: None
+        """
+        key = "{} {}".format(dependency, endpoint)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"calls": 0, "errors": 0, "seconds": 0.0, "buckets": [0] * (len(BUCKETS) + 1)}
+                self._series[key] = series
+            series["calls"] += 1
+            series["errors"] += 1 if error else 0
+            series["seconds"] += seconds
+            series["buckets"][_bucket(seconds)] += 1
+
+    @contextmanager
+    def timed(self, dependency, endpoint):
+        """Times the enclosed block, counting it as an error if it raises"""
+        started = time()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(dependency, endpoint, time() - started, error)
+
+    def timed_method(self, dependency):
+        """Decorator timing a method, with the method's name as endpoint"""
+        def decorator(method):
+            @wraps(method)
+            def wrapper(*args, **kwargs):
+                with self.timed(dependency, method.__name__):
+                    return method(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self._lock:
+            return {k: dict(v, buckets=list(v["buckets"])) for k, v in self._series.items()}
+
+    def publish(self, directory):
+        """Writes this process' metrics to :directory:, for collect to pick up"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "{}.json".format(os.getpid()))
+        with open(path + ".tmp", "w") as f:
+            json.dump({"updated_at": time(), "series": self.snapshot()}, f)
+        os.replace(path + ".tmp", path)
+
+    def publish_periodically(self, directory, interval=15):
+        """Starts publishing this process' metrics every :interval: seconds, once per process"""
+        if self._publisher_pid == os.getpid():
+            return
+        self._publisher_pid = os.getpid()
+
+        def publish():
+            while True:
+                try:
+                    self.publish(directory)
+                except OSError as e:
+                    logger.warning("Couldn't publish metrics: {}".format(e))
+                sleep(interval)
+
+        threading.Thread(target=publish, name="metrics-publisher", daemon=True).start()
+
+
+def _bucket(seconds):
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            return i
+    return len(BUCKETS)
+
+
+def _percentile(buckets, fraction):
+    """The upper bound of the bucket holding the :fraction: percentile, or None if it's the overflow bucket"""
+    target = sum(buckets) * fraction
+    seen = 0
+    for i, count in enumerate(buckets):
+        seen += count
+        if seen >= target and count:
+            return BUCKETS[i] if i < len(BUCKETS) else None
+
+
+def collect(directory, max_age=300):
+    """Merges the metrics published by every process that published in the last :max_age: seconds
+
+    :param directory: (str) Where the processes publish
+    :param max_age: (int) Seconds after which a process' metrics are considered gone
+    :return: (dict) Series keyed by "<dependency> <endpoint>"
+    """
+    merged = {}
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        names = []
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                published = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if time() - published.get("updated_at", 0) > max_age:
+            continue
+        for key, series in published["series"].items():
+            total = merged.setdefault(key, {"calls": 0, "errors": 0, "seconds": 0.0,
+                                            "buckets": [0] * (len(BUCKETS) + 1)})
+            total["calls"] += series["calls"]
+            total["errors"] += series["errors"]
+            total["seconds"] += series["seconds"]
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], series["buckets"])]
+    for series in merged.values():
+        series["mean"] = series["seconds"] / series["calls"] if series["calls"] else 0
+        series["p50"] = _percentile(series["buckets"], 0.5)
+        series["p95"] = _percentile(series["buckets"], 0.95)
+    return merged
+
+
+def summary(directory):
+    """A chat friendly table of the collected metrics
+
+    :param directory: (str) Where the processes publish
+    :return: (str)
+    """
+    merged = collect(directory)
+    if not merged:
+        return "No metrics yet"
+
+    def bound(value):
+        return "<={}s".format(value) if value is not None else ">{}s".format(BUCKETS[-1])
+
+    lines = ["{:<40} {:>7} {:>6} {:>8} {:>8} {:>8}".format("call", "count", "errors", "mean", "p50", "p95")]
+    for key in sorted(merged):
+        s = merged[key]
+        lines.append("{:<40} {:>7} {:>6} {:>7.3f}s {:>8} {:>8}".format(
+            key[:40], s["calls"], s["errors"], s["mean"], bound(s["p50"]), bound(s["p95"])))
+    return "```{}```".format("\n".join(lines))
+
+
+def serve(directory, port, host="127.0.0.1"):
+    """Serves the collected metrics as JSON on http://:host:::port:/metrics. Blocks forever.
+
+    :param directory: (str) Where the processes publish
+    :param port: (int)
+    :param host: (str)
+    :return: None
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = json.dumps(collect(directory), sort_keys=True).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug("Metrics endpoint: " + format % args)
+
+    logger.info("Serving metrics on http://{}:{}/metrics".format(host, port))
+    HTTPServer((host, port), Handler).serve_forever()
+
+
+def trello_endpoint(http_method, uri_path):
+    return "{} /{}".format(http_method, TRELLO_ID.sub("/:id", uri_path.split("?")[0].strip("/")))
+
+
+metrics = Metrics()
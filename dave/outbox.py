@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+A rate limited, coalescing queue for outbound Slack messages
+"""
+
+import threading
+from collections import deque
+from os import getpid
+from time import time
+
+from dave.log import logger
+from dave.ratelimit import TokenBucket
+
+RETRYABLE_ERRORS = ("ratelimited", "fatal_error", "internal_error", "request_timeout", "service_unavailable")
+
+
+class Outbox(object):
+    def __init__(self, send, rate=1.0, burst=1, coalesce_window=5, max_retries=5):
+        """Creates an outbox that posts messages from a background thread
+
+        :param send: (callable) Called as send("chat.postMessage", channel=..., **kwargs). Returns the Slack response.
+        :param rate: (float) Messages per second allowed on each channel
+        :param burst: (int) Messages that may go out back to back on a quiet channel
+        :param coalesce_window: (float) Seconds to collect coalesced messages before they're posted as one
+        :param max_retries: (int) Attempts before a message is dropped
+        """
+        self.send = send
+        self.rate = rate
+        self.burst = burst
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.dropped = 0
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._pid == getpid():
+            return
+        # Nothing is shared with a parent process: its lock might have been held when we forked,
+        # and whatever it had queued is its own to send
+        self._pid = getpid()
+        self._cond = threading.Condition()
+        self._channels = {}
+        self._buckets = {}
+        self._pending = {}
+        threading.Thread(target=self._run, name="slack-outbox", daemon=True).start()
+
+    def post(self, channel, **kwargs):
+        """Queues a chat.postMessage. Returns right away.
+
+        :param channel: (str) The channel to post to
+        :param kwargs: Any other chat.postMessage arguments
+        :return: None
+        """
+        self._ensure_started()
+        with self._cond:
+            self._channels.setdefault(channel, deque()).append([kwargs, 0])
+            self._cond.notify()
+
+    def coalesce(self, key, channel, item, render):
+        """Queues a message that's merged with every other message queued with the same :key: within the
+        coalescing window. Returns right away.
+
+        :param key: (hashable) What identifies messages that may be merged
+        :param channel: (str) The channel to post to
+        :param item: Anything; all items collected for :key: are passed to :render: in order
+        :param render: (callable) Turns the list of items into chat.postMessage arguments
+        :return: None
+        """
+        self._ensure_started()
+        with self._cond:
+            pending = self._pending.get((channel, key))
+            if pending:
+                pending["items"].append(item)
+                pending["render"] = render
+            else:
+                self._pending[(channel, key)] = {"items": [item], "render": render,
+                                                 "deadline": time() + self.coalesce_window}
+                self._cond.notify()
+
+    def _bucket(self, channel):
+        if channel not in self._buckets:
+            self._buckets[channel] = TokenBucket(self.rate, self.burst)
+        return self._buckets[channel]
+
+    def _flush_due(self, now):
+        """Moves coalesced messages whose window has closed to their channel's queue. Returns the seconds until
+        the next window closes, or None.
+        """
+        next_deadline = None
+        for channel, key in list(self._pending):
+            pending = self._pending[(channel, key)]
+            if pending["deadline"] <= now:
+                del self._pending[(channel, key)]
+                kwargs = pending["render"](pending["items"])
+                self._channels.setdefault(channel, deque()).append([kwargs, 0])
+            elif next_deadline is None or pending["deadline"] < next_deadline:
+                next_deadline = pending["deadline"]
+        return next_deadline - now if next_deadline else None
+
+    def _next(self):
+        """Blocks until a message may be sent on some channel, then takes it off its queue"""
+        with self._cond:
+            while True:
+                now = time()
+                wait = self._flush_due(now)
+                for channel, messages in self._channels.items():
+                    if not messages:
+                        continue
+                    delay = self._bucket(channel).consume(now)
+                    if delay <= 0:
+                        return channel, messages.popleft()
+                    wait = delay if wait is None else min(wait, delay)
+                self._cond.wait(wait)
+
+    def _run(self):
+        while True:
+            channel, message = self._next()
+            try:
+                self._deliver(channel, message)
+            except Exception as e:
+                logger.error("Swallowed exception in the Slack outbox: {}".format(e))
+
+    def _deliver(self, channel, message):
+        kwargs, attempts = message
+        try:
+            resp = self.send("chat.postMessage", channel=channel, **kwargs)
+        except Exception as e:
+            resp = {"ok": False, "error": str(e)}
+            retryable = True
+        else:
+            retryable = resp.get("error") in RETRYABLE_ERRORS
+        if resp.get("ok"):
+            return
+
+        if not retryable or attempts + 1 >= self.max_retries:
+            self.dropped += 1
+            logger.error("Dropped message to {} after {} attempts: {}".format(channel, attempts + 1, resp.get("error")))
+            return
+
+        retry_after = float(resp.get("headers", {}).get("Retry-After", 2 ** attempts))
+        logger.warning("Posting to {} failed with {}, retrying in {}s".format(channel, resp.get("error"), retry_after))
+        with self._cond:
+            message[1] = attempts + 1
+            self._bucket(channel).pause(retry_after)
+            self._channels.setdefault(channel, deque()).appendleft(message)
+            self._cond.notify()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+The participants of an event, keyed by Meetup member id
+
+An event's "participants" is a list of [member id, name] pairs in the order they joined, with the member ids as str.
+It's not a dict because events are stored as JSONB, which doesn't keep the order of an object's keys.
+Events saved before hold a list of member names, or a dict of names keyed by member id; known_participants
+reads all of them.
+"""
+
+
+def _is_pair(item):
+    return isinstance(item, list) and len(item) == 2
+
+
+def known_participants(event, rsvps=()):
+    """The participants of :event:, migrated from a list of names if it's still one
+
+    :param event: (dict) A stored event
+    :param rsvps: (iterable) The event's RSVPs, used to find the member ids of a list of names
+    :return: (dict) Member names keyed by member id, in the order they joined. A copy, store it back with
+             stored_participants.
+    """
+    known = event.get("participants") or []
+    if isinstance(known, dict):
+        return dict(known)
+    if all(_is_pair(p) for p in known):
+        return dict((str(member_id), name) for member_id, name in known)
+    names = set(known)
+    migrated = {}
+    for rsvp in rsvps:
+        member = rsvp["member"]
+        if member["name"] in names:
+            migrated[str(member["member_id"])] = member["name"]
+    return migrated
+
+
+def needs_migration(event):
+    """Whether :event: still holds a list of names. Migrating it takes a pass over the RSVPs of its own.
+
+    :param event: (dict) A stored event
+    :return: (bool)
+    """
+    known = event.get("participants") or []
+    return isinstance(known, list) and not all(_is_pair(p) for p in known)
+
+
+def stored_participants(known):
+    """What to store as an event's participants
+
+    :param known: (dict) Member names keyed by member id, as returned by known_participants
+    :return: (list) [member id, name] pairs, in the order they joined
+    """
+    return [[member_id, name] for member_id, name in known.items()]
+
+
+def participant_names(event):
+    """The names of the participants of :event:, in the order they joined
+
+    :param event: (dict) A stored event
+    :return: (list)
+    """
+    known = event.get("participants") or []
+    if isinstance(known, dict):
+        return list(known.values())
+    return [p[1] if _is_pair(p) else p for p in known]
+
+
+def diff_rsvps(known, rsvps):
+    """Compares RSVPs against the known participants in one pass over :rsvps:
+
+    :param known: (dict) Member names keyed by member id, as returned by known_participants
+    :param rsvps: (iterable) RSVP dicts as returned by the Meetup API
+    :return: (tuple) The members that joined and the members that cancelled, both as names keyed by member id,
+             in the order their RSVPs came in
+    """
+    joined, cancelled = {}, {}
+    for rsvp in rsvps:
+        member_id = str(rsvp["member"]["member_id"])
+        if rsvp["response"] == "yes":
+            if member_id not in known:
+                joined[member_id] = rsvp["member"]["name"]
+        elif rsvp["response"] == "no" and member_id in known:
+            cancelled[member_id] = known[member_id]
+    return joined, cancelled
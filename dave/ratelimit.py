@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+A thread safe token bucket
+"""
+
+import threading
+from time import sleep, time
+
+
+class TokenBucket(object):
+    def __init__(self, rate, capacity=1):
+        """Creates a token bucket that refills at :rate: tokens per second, up to :capacity: tokens
+
+        :param rate: (float) Tokens added per second
+        :param capacity: (int) The most tokens the bucket holds, i.e. the largest burst allowed
+        """
+        self.rate = float(rate)
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def delay(self, now=None):
+        """Seconds until a token is available
+
+        :param now: (float) The current timestamp
+        :return: (float) 0 if a token is available right away
+        """
+        now = now or time()
+        with self._lock:
+            self._refill(now)
+            wait = 0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            return max(wait, self._paused_until - now, 0)
+
+    def consume(self, now=None):
+        """Takes a token, or returns how long to wait if there's none
+
+        :param now: (float) The current timestamp
+        :return: (float) 0 if a token was taken, otherwise the seconds until one is available
+        """
+        now = now or time()
+        with self._lock:
+            self._refill(now)
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._tokens < 1:
+                return (1 - self._tokens) / self.rate
+            self._tokens -= 1
+            return 0
+
+    def acquire(self):
+        """Blocks until a token is taken
+
+        :return: None
+        """
+        wait = self.consume()
+        while wait > 0:
+            sleep(wait)
+            wait = self.consume()
+
+    def pause(self, seconds, now=None):
+        """Hands out no tokens for :seconds:, e.g. after the server answered with a Retry-After
+
+        :param seconds: (float)
+        :param now: (float) The current timestamp
+        :return: None
+        """
+        now = now or time()
+        with self._lock:
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = min(self._tokens, 0)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Resolves free text, usually a channel name, to the name of a stored event
+"""
+
+from bisect import bisect_left
+
+from fuzzywuzzy import process, utils
+
+
+class EventResolver(object):
+    def __init__(self, names=(), memo_size=1024):
+        """Creates an event name resolver
+
+        :param names: (list) The event names to resolve to
+        :param memo_size: (int) How many resolutions to remember before starting over
+        """
+        self.memo_size = memo_size
+        self._names = None
+        self._normalized = {}
+        self._sorted = []
+        self._memo = {}
+        self.index(names)
+
+    @staticmethod
+    def normalize(text):
+        return utils.full_process(text or "")
+
+    def index(self, names):
+        """Indexes the event names. Call whenever the stored events change.
+
+        :param names: (list) The event names to resolve to
+        :return: None
+        """
+        names = list(names)
+        if names == self._names:
+            return
+        self._names = names
+        self._normalized = {}
+        for name in names:
+            self._normalized.setdefault(self.normalize(name), name)
+        self._sorted = sorted(self._normalized)
+        self._memo = {}
+
+    def _prefixed(self, key):
+        start = bisect_left(self._sorted, key)
+        matches = []
+        for candidate in self._sorted[start:]:
+            if not candidate.startswith(key):
+                break
+            matches.append(candidate)
+        return matches
+
+    def resolve(self, request):
+        """The event name that best matches :request:. Exact and prefix matches win over fuzzy ones.
+
+        :param request: (str) Free text, e.g. "storg south" for the #storg_south channel
+        :return: (str) The event name, or None if there are no events
+        """
+        if request in self._memo:
+            return self._memo[request]
+        key = self.normalize(request)
+        if key in self._normalized:
+            match = key
+        else:
+            candidates = self._prefixed(key) if key else []
+            if len(candidates) == 1:
+                match = candidates[0]
+            else:
+                best = process.extractOne(key, candidates or self._sorted, processor=None)
+                match = best[0] if best else None
+
+        resolved = self._normalized.get(match)
+        if len(self._memo) >= self.memo_size:
+            self._memo = {}
+        self._memo[request] = resolved
+        return resolved
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Runs the whole bot on one asyncio event loop, in a single process
+"""
+
+import asyncio
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from dave.log import logger
+
+
+class AsyncRuntime(object):
+    def __init__(self, bot, workers=4, threads=16, retry_after=60):
+        """Reading Slack, answering commands, monitoring Meetup and following Trello's webhooks run as tasks on
+        one event loop. They all use the same Bot, so its caches and events are shared in memory rather than
+        through Postgres and process queues. The Meetup, Trello, Slack and Postgres clients block, so their calls
+        run on a thread pool. A task that fails logs it and carries on, so the others keep running.
+
+        :param bot: (Bot) The bot to run
+        :param workers: (int) Commands answered at the same time. Commands from one channel are answered in order.
+        :param threads: (int) Threads for the blocking client calls
+        :param retry_after: (float) Seconds the monitor waits after a failed check before trying again
+        """
+        self.bot = bot
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="dave")
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.tasks = [asyncio.Queue() for _ in range(max(1, workers))]
+        self.pushes = asyncio.Queue()
+        self._main = None
+
+    def put(self, task):
+        """Hands a command to the worker for its channel. Called by the RTM reader, from its own thread.
+
+        :param task: (tuple) The command, channel id and user id
+        :return: None
+        """
+        command, channel_id, user_id = task
+        queue = self.tasks[zlib.crc32(channel_id.encode()) % len(self.tasks)]
+        self.loop.call_soon_threadsafe(queue.put_nowait, task)
+
+    def push(self, board_id, action):
+        """Hands a Trello action to the task applying them. Called by the webhook receiver, from its own thread.
+
+        :param board_id: (str)
+        :param action: (dict)
+        :return: None
+        """
+        self.loop.call_soon_threadsafe(self.pushes.put_nowait, (board_id, action))
+
+    async def _blocking(self, function, *args, **kwargs):
+        return await self.loop.run_in_executor(self.executor, partial(function, *args, **kwargs))
+
+    # CancelledError is an Exception before Python 3.8; it's re-raised everywhere so that stop still works
+    async def answer(self, tasks):
+        while True:
+            command, channel_id, user_id = await tasks.get()
+            try:
+                await self._blocking(self.bot.answer, command, channel_id, user_id, sync=False)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Swallowed exception at conversation: {}".format(e))
+
+    async def monitor(self):
+        scheduler = None
+        while True:
+            try:
+                if scheduler is None:
+                    scheduler = await self._blocking(self.bot.start_monitoring, restore=False)
+                wait = await self._blocking(self.bot.check_once, scheduler)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Swallowed exception at monitor, retrying in {}s: {}".format(self.retry_after, e))
+                wait = self.retry_after
+            await asyncio.sleep(wait)
+
+    async def follow_trello(self):
+        while True:
+            board_id, action = await self.pushes.get()
+            try:
+                await self._blocking(self.bot.trello.push, board_id, [action])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Exception {} when applying a pushed action to board {}".format(e, board_id))
+
+    async def main(self):
+        try:
+            await self._blocking(self.bot.warm_up)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Starting cold, exception {} when warming up".format(e))
+        # The RTM reader blocks on its socket for good, so it gets a thread of its own rather than one of the pool's
+        threading.Thread(target=self.bot.chat.rtm, args=(self,), name="slack-rtm", daemon=True).start()
+        await asyncio.gather(self.monitor(), self.follow_trello(), *[self.answer(tasks) for tasks in self.tasks])
+
+    def run(self):
+        """Runs the bot until stop is called
+
+        :return: None
+        """
+        logger.info("Running on one event loop with {} workers".format(len(self.tasks)))
+        self._main = self.loop.create_task(self.main())
+        try:
+            self.loop.run_until_complete(self._main)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.executor.shutdown(wait=False)
+
+    def stop(self):
+        """Stops run. Can be called from any thread.
+
+        :return: None
+        """
+        self.loop.call_soon_threadsafe(self._main.cancel)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Decides when each upcoming event should next have its RSVPs checked
+"""
+
+from time import time
+
+DAY = 24 * 3600
+
+
+class PollScheduler(object):
+    def __init__(self, base_interval=600, min_interval=60, max_interval=3600):
+        """Creates a per-event polling scheduler
+
+        :param base_interval: (int) Seconds between checks of an ordinary event
+        :param min_interval: (int) Seconds between checks of an event that's about to start or fill up
+        :param max_interval: (int) The longest an event is ever left unchecked
+        """
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self._next_check = {}
+        self._last_change = {}
+        self._unchanged = {}
+
+    def interval(self, event, now=None):
+        """How long to wait before checking :event: again
+
+        :param event: (dict) A Meetup event
+        :param now: (float) The current timestamp
+        :return: (float) Seconds
+        """
+        now = now or time()
+        event_id = event["id"]
+        starts_in = int(event["time"]) / 1000 - now
+
+        if starts_in < 0:
+            interval = self.max_interval
+        elif starts_in < DAY:
+            interval = self.min_interval
+        elif starts_in < 7 * DAY:
+            interval = self.base_interval
+        else:
+            interval = self.base_interval * 2
+
+        if event.get("rsvp_limit"):
+            spots_left = int(event["rsvp_limit"]) - int(event.get("yes_rsvp_count", 0))
+            if spots_left <= max(3, int(event["rsvp_limit"]) // 10):
+                interval /= 2
+
+        last_change = self._last_change.get(event_id)
+        if last_change and now - last_change < self.base_interval:
+            interval /= 2
+        else:
+            interval *= 2 ** min(self._unchanged.get(event_id, 0), 3)
+
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def due(self, events, now=None):
+        """The events that should be checked now. Events the scheduler hasn't seen yet are always due.
+
+        :param events: (list) Meetup events
+        :param now: (float) The current timestamp
+        :return: (list) The events that are due
+        """
+        now = now or time()
+        current = set(e["id"] for e in events)
+        for event_id in list(self._next_check):
+            if event_id not in current:
+                self.forget(event_id)
+        return [e for e in events if self._next_check.get(e["id"], 0) <= now]
+
+    def record(self, event, changed, now=None):
+        """Records the outcome of checking :event: and schedules its next check
+
+        :param event: (dict) The Meetup event that was checked
+        :param changed: (bool) Whether its RSVPs changed
+        :param now: (float) The current timestamp
+        :return: None
+        """
+        now = now or time()
+        event_id = event["id"]
+        if changed:
+            self._last_change[event_id] = now
+            self._unchanged[event_id] = 0
+        else:
+            self._unchanged[event_id] = self._unchanged.get(event_id, 0) + 1
+        self._next_check[event_id] = now + self.interval(event, now)
+
+    def forget(self, event_id):
+        self._next_check.pop(event_id, None)
+        self._last_change.pop(event_id, None)
+        self._unchanged.pop(event_id, None)
+
+    def next_wakeup(self, now=None):
+        """Seconds until the next event is due, at least the minimum interval and never more than the base
+        interval, so new events are still noticed
+
+        :param now: (float) The current timestamp
+        :return: (float) Seconds
+        """
+        now = now or time()
+        if not self._next_check:
+            return self.base_interval
+        wait = min(self._next_check.values()) - now
+        return max(self.min_interval, min(self.base_interval, wait))
@@ -1,46 +1,152 @@
 #!/usr/bin/env python
 
+import select
 from slackclient import SlackClient
 from dave.log import logger
-from time import sleep
+from dave.metrics import metrics
+from dave.outbox import Outbox
+from time import sleep, time
 
 
 class Slack(object):
-    def __init__(self, slack_token, bot_id):
+    def __init__(self, slack_token, bot_id, directory_ttl=3600, coalesce_window=5, directory_retry=60):
         """Creates a Slack connection object
 
         :param slack_token: (str) Your Slack API key
         :param bot_id: (str) The bot's user id
+        :param directory_ttl: (int) Seconds before the channel directory is reloaded from scratch
+        :param coalesce_window: (int) Seconds during which RSVP announcements for an event are merged
+        :param directory_retry: (int) Seconds before a channel directory that failed to load is tried again
         """
         self.sc = SlackClient(slack_token)
+        self.sc.api_call = self._timed_api_call(self.sc.api_call)
+        self.outbox = Outbox(self.sc.api_call, coalesce_window=coalesce_window)
         self.at_bot = "<@" + bot_id + ">"
         self.bot_id = bot_id
+        self.directory_ttl = directory_ttl
+        self.directory_retry = directory_retry
+        self._directory = {}
+        self._directory_expires_at = 0
+        self._ims = None
+        self.dropped_events = 0
+
+    @staticmethod
+    def _timed_api_call(api_call):
+        def timed(method, *args, **kwargs):
+            started = time()
+            try:
+                resp = api_call(method, *args, **kwargs)
+            except Exception:
+                metrics.record("slack", method, time() - started, error=True)
+                raise
+            metrics.record("slack", method, time() - started, error=not resp.get("ok"))
+            return resp
+        return timed
+
+    def _load_channels(self):
+        """Loads every channel, page by page, into the channel directory
+
+        :return: None
+        """
+        directory = {}
+        params = {"exclude_archived": True, "exclude_members": True, "limit": 200}
+        while True:
+            resp = self.sc.api_call("channels.list", **params)
+            if not resp.get("ok"):
+                logger.warning("Couldn't list channels: {}".format(resp.get("error")))
+                # Lookups fall back to channels.info meanwhile, rather than every command listing again
+                self._directory_expires_at = time() + min(self.directory_retry, self.directory_ttl)
+                return
+            for channel in resp["channels"]:
+                directory[channel["id"]] = {"name": channel["name"], "topic": channel["topic"]["value"]}
+            cursor = resp.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                break
+            params["cursor"] = cursor
+        logger.debug("Channel directory loaded with {} channels".format(len(directory)))
+        self._directory = directory
+        self._directory_expires_at = time() + self.directory_ttl
 
     @property
     def _channels(self):
-        """Gets all channels
+        """The channel directory, loaded on first use and reloaded every :directory_ttl: seconds
 
-        :return: (list) List of channel objects (dicts)
+        :return: (dict) Channel names and topics keyed by channel id
         """
-        return self.sc.api_call("channels.list")["channels"]
+        if time() > self._directory_expires_at:
+            self._load_channels()
+        return self._directory
+
+    def warm_up(self):
+        """Loads the channel directory ahead of the first lookup"""
+        self._load_channels()
+
+    def _track_channels(self, event):
+        """Applies RTM events to the channel directory of the process reading them. Conversation workers in
+        other processes don't see these events; their directory is reloaded every :directory_ttl: seconds, and
+        channels it doesn't know are looked up with channels.info.
+
+        :param event: (dict) An RTM event
+        :return: None
+        """
+        event_type = event.get("type")
+        if event_type in ("channel_created", "channel_rename"):
+            channel = event["channel"]
+            entry = self._directory.setdefault(channel["id"], {"topic": ""})
+            entry["name"] = channel["name"]
+        elif event_type in ("channel_deleted", "channel_archive"):
+            self._directory.pop(event.get("channel"), None)
+        elif event_type == "message" and event.get("subtype") == "channel_topic":
+            entry = self._directory.get(event["channel"])
+            if entry:
+                entry["topic"] = event.get("topic", "")
+        elif event_type == "im_created" and self._ims is not None:
+            self._ims.add(event["channel"]["id"])
+        elif event_type == "im_open" and self._ims is not None:
+            self._ims.add(event["channel"])
+
+    def _channel_info(self, channel_id):
+        """Looks :channel_id: up on Slack and puts it in the channel directory
+
+        :param channel_id: (str)
+        :return: (dict) The channel's name and topic, or None if Slack doesn't know it
+        """
+        info = self.sc.api_call("channels.info", channel=channel_id)
+        if not info["ok"]:
+            logger.warning("Couldn't look up channel {}: {}".format(channel_id, info.get("error")))
+            return None
+        entry = {"name": info["channel"]["name"], "topic": info["channel"]["topic"]["value"]}
+        self._directory[channel_id] = entry
+        return entry
 
     def channel_name(self, channel_id):
-        """Get the name of the channel with id :channel_:
+        """Get the name of the channel with id :channel_:. Channels created since the directory was loaded are
+        looked up on Slack.
 
         :param channel_id: (str)
         :return: (str) The channel name
         """
-        for channel in self._channels:
-            if channel["id"] == channel_id:
-                return channel["name"]
+        channel = self._channels.get(channel_id)
+        if channel is None and not self._is_im(channel_id):
+            channel = self._channel_info(channel_id)
+        if channel:
+            return channel["name"]
 
-    def channel_topic(self, channel_id):
-        info = self.sc.api_call("channels.info", channel=channel_id)
-        if info["ok"]:
-            return info["channel"]["topic"]["value"]
-        else:
-            logger.critical("{}".format(info))
+    def channel_topic(self, channel_id, cached=True):
+        """Get the topic of the channel with id :channel_id:
+
+        :param channel_id: (str)
+        :param cached: (bool) Whether the channel directory will do. Only the RTM reader sees topic changes, so
+                       pass False when the topic decides where something gets written.
+        :return: (str) The channel topic
+        """
+        channel = self._channels.get(channel_id) if cached else None
+        if channel and channel["topic"]:
+            return channel["topic"]
+        channel = self._channel_info(channel_id)
+        if channel is None:
             raise ValueError
+        return channel["topic"]
 
     def message(self, content, channel, attachments=None):
         """Sends a simple message containing :content: to :channel:
@@ -51,12 +157,7 @@ class Slack(object):
         :return: None
         """
         logger.debug("Sending {} to {}".format(content[0:10], channel))
-        self.sc.api_call(
-            "chat.postMessage",
-            as_user=True,
-            channel=channel,
-            text=content,
-            attachments=attachments)
+        self.outbox.post(channel, as_user=True, text=content, attachments=attachments)
 
     def send_attachment(self, message, channel, title=None, colour = "#808080", extra_options=None):
         if not extra_options:
@@ -65,41 +166,64 @@ class Slack(object):
         self._announcement(attachment, channel=channel)
 
     def _announcement(self, attachment, channel="#small_council"):
-        self.sc.api_call(
-            "chat.postMessage",
-            as_user=True,
-            channel=channel,
-            attachments=attachment
-        )
+        self.outbox.post(channel, as_user=True, attachments=attachment)
+
+    def _load_ims(self):
+        """Loads the ids of every IM channel of the bot, page by page
+
+        :return: None
+        """
+        ims = set()
+        params = {"limit": 200}
+        while True:
+            resp = self.sc.api_call("im.list", **params)
+            if not resp.get("ok"):
+                logger.warning("Couldn't list IMs: {}".format(resp.get("error")))
+                break
+            ims.update(i["id"] for i in resp["ims"])
+            cursor = resp.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                break
+            params["cursor"] = cursor
+        logger.debug("Loaded {} IM channels".format(len(ims)))
+        self._ims = ims
 
     def _is_im(self, channel_id):
-        ims = self.sc.api_call("im.list")["ims"]
-        ids = [i["id"] for i in ims]
-        return channel_id in ids
+        if self._ims is None:
+            self._load_ims()
+        return channel_id in self._ims
 
-    # TODO: return the calling user id as well
     def _parse_slack_output(self, slack_rtm_output):
         """Parse the :slack_rtm_output: received from Slack and return everything after the bot's @-name
-        or None if it wasn't directed at the bot.
+        for every message that was directed at the bot, in the order they were received.
 
-        :param slack_rtm_output: (str) Slack message to parse
-        :return: (tuple) A tuple of the striped message and channel id
+        :param slack_rtm_output: (list) Slack RTM events to parse
+        :return: (list) Tuples of the striped message, channel id and user id
         """
-        output_list = slack_rtm_output
-        if output_list and len(output_list) > 0:
-            for output in output_list:
-                if output and 'text' in output and self.at_bot in output['text'] and output["user"] != 'USLACKBOT':
-                    # return text excluding the @ mention, whitespace removed
-                    logger.debug(output)
-                    command = ' '.join([t.strip() for t in output["text"].split(self.at_bot) if t])
-                    return command, output["channel"], output["user"]
-                elif output and "channel" in output and "text" in output\
-                        and self._is_im(output["channel"]) and output["user"] != self.bot_id and output["user"] != 'USLACKBOT':
-                    logger.debug(output)
-                    return output["text"], output["channel"], output["user"]
-                else:
-                    logger.debug(output)
-        return None, None, None
+        commands = []
+        for output in slack_rtm_output or []:
+            if not isinstance(output, dict):
+                self.dropped_events += 1
+                logger.warning("Dropped malformed RTM event: {}".format(output))
+                continue
+            logger.debug(output)
+            if "text" not in output:
+                continue
+            if "user" not in output or "channel" not in output:
+                # Bot messages and other subtypes legitimately come without a user
+                if not output.get("subtype"):
+                    self.dropped_events += 1
+                    logger.warning("Dropped RTM message without user or channel: {}".format(output))
+                continue
+            if output["user"] in ('USLACKBOT', self.bot_id):
+                continue
+            if self.at_bot in output["text"]:
+                # text excluding the @ mention, whitespace removed
+                command = ' '.join([t.strip() for t in output["text"].split(self.at_bot) if t])
+                commands.append((command, output["channel"], output["user"]))
+            elif self._is_im(output["channel"]):
+                commands.append((output["text"], output["channel"], output["user"]))
+        return commands
 
     def new_event(self, event_name, date, venue, url, channel="#announcements"):
         """
@@ -117,7 +241,8 @@ class Slack(object):
         self.send_attachment(title=title, message=text, channel=channel, extra_options=extra_options)
 
     def new_rsvp(self, names, response, event_name, spots, channel="#dungeon_lab"):
-        """Announces a new RSVP on :channel:
+        """Announces a new RSVP on :channel:. Announcements for the same event and response made within the
+        outbox's coalescing window are posted as one message.
 
         :param names: (str) The names of the ones that RSVPed
         :param response: (str) "yes" or "no"
@@ -127,25 +252,64 @@ class Slack(object):
         :return: None
         """
         colour = "#36a64f" if response == "yes" else "b20000"
-        text = "{} replied {} for the {}\n{} spots left".format(names, response, event_name, spots)
-        self.send_attachment(title="New RSVP", message=text, colour=colour, channel=channel)
 
-    def rtm(self, queue, read_delay=1):
-        """Creates a Real Time Messaging connection to Slack and listens for events
+        def render(rsvps):
+            all_names = ', '.join(n for n, _ in rsvps)
+            text = "{} replied {} for the {}\n{} spots left".format(all_names, response, event_name, rsvps[-1][1])
+            return {"as_user": True, "attachments": [{"pretext": "New RSVP", "color": colour, "text": text}]}
+
+        self.outbox.coalesce((event_name, response), channel, (names, spots), render)
+
+    def _wait_for_events(self, timeout):
+        """Blocks until the RTM socket has data to read or :timeout: seconds have passed"""
+        try:
+            sock = self.sc.server.websocket.sock
+        except AttributeError:
+            sleep(timeout)
+            return
+        select.select([sock], [], [], timeout)
+
+    def _ingest(self, queue, read_timeout):
+        """Reads RTM events until the connection drops, putting every command on :queue:"""
+        events = []
+        while True:
+            if not events:
+                self._wait_for_events(read_timeout)
+            events = self.sc.rtm_read()
+            for event in events:
+                if isinstance(event, dict):
+                    if event.get("type") == "goodbye":
+                        raise ConnectionError("Slack said goodbye")
+                    self._track_channels(event)
+            for command, channel, user_id in self._parse_slack_output(events):
+                logger.debug("command found text: {}, channel: {}, user_id: {}".format(command, channel, user_id))
+                queue.put((command, channel, user_id))
+
+    def rtm(self, queue, read_timeout=1, max_backoff=60):
+        """Creates a Real Time Messaging connection to Slack and listens for events, reconnecting whenever the
+        connection drops
         https://api.slack.com/rtm
 
         :param queue: (queue) A Multiprocess Queue where it'll put the incoming events
-        :param read_delay: (int) How often to check for events. Default: 1s
+        :param read_timeout: (int) The longest to block on the socket before reading again. Default: 1s
+        :param max_backoff: (int) The longest to wait between reconnection attempts. Default: 60s
         :return: None
         """
-        if self.sc.rtm_connect():
+        backoff = 1
+        while True:
+            if not self.sc.rtm_connect():
+                logger.error("Slack RTM connection failed, retrying in {}s".format(backoff))
+                sleep(backoff)
+                backoff = min(backoff * 2, max_backoff)
+                continue
             logger.info("Slack RTM connected")
-            while True:
-                command, channel, user_id = self._parse_slack_output(self.sc.rtm_read())
-                if command and channel and user_id:
-                    logger.debug("command found text: {}, channel: {}, user_id: {}".format(command, channel, user_id))
-                    queue.put((command, channel, user_id))
-                sleep(read_delay)
+            backoff = 1
+            self._load_ims()
+            try:
+                self._ingest(queue, read_timeout)
+            except Exception as e:
+                logger.warning("Slack RTM connection lost: {}. Dropped events so far: {}".format(
+                    e, self.dropped_events))
 
     def userid_info(self, user_id):
         logger.debug("Looking for user {}".format(user_id))
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+"""
+In-memory models of Trello boards, loaded with a single nested request
+"""
+
+from collections import OrderedDict
+from time import time
+
+from dave.log import logger
+
+
+class BoardSnapshot(object):
+    def __init__(self, board_id, name, url, lists, cards, labels, last_action_id=None):
+        """Creates a snapshot of a Trello board
+
+        :param board_id: (str) The board's id
+        :param name: (str) The board's name
+        :param url: (str) The board's URL
+        :param lists: (dict) List JSON objects keyed by list id
+        :param cards: (dict) Card JSON objects keyed by card id
+        :param labels: (dict) Label JSON objects keyed by label id
+        :param last_action_id: (str) The id of the newest board action reflected in the snapshot
+        """
+        self.board_id = board_id
+        self.name = name
+        self.url = url
+        self.lists = lists
+        self.cards = cards
+        self.labels = labels
+        self.last_action_id = last_action_id
+        self.fetched_at = time()
+        self._cards_by_list = None
+        self._cards_by_desc = None
+
+    @classmethod
+    def from_json(cls, data):
+        """Builds a snapshot out of a nested GET /boards/{id} response
+
+        :param data: (dict) The board JSON, including its lists, cards and labels
+        :return: (BoardSnapshot)
+        """
+        lists = OrderedDict((l["id"], l) for l in data.get("lists", []))
+        cards = {c["id"]: c for c in data.get("cards", [])}
+        labels = {l["id"]: l for l in data.get("labels", [])}
+        actions = data.get("actions")
+        last_action_id = actions[0]["id"] if actions else None
+        return cls(data["id"], data["name"], data.get("url"), lists, cards, labels, last_action_id)
+
+    def to_json(self):
+        """The snapshot in the same shape as the response it's built from, see from_json
+
+        :return: (dict)
+        """
+        return {"id": self.board_id, "name": self.name, "url": self.url,
+                "lists": list(self.lists.values()), "cards": list(self.cards.values()),
+                "labels": list(self.labels.values()),
+                "actions": [{"id": self.last_action_id}] if self.last_action_id else []}
+
+    def copy(self):
+        """A copy that can be synced while readers keep using this snapshot. Cards, lists and labels are
+        replaced rather than modified when syncing, so they're shared.
+
+        :return: (BoardSnapshot)
+        """
+        snapshot = BoardSnapshot(self.board_id, self.name, self.url, OrderedDict(self.lists), dict(self.cards),
+                                 dict(self.labels), self.last_action_id)
+        snapshot.fetched_at = self.fetched_at
+        return snapshot
+
+    @property
+    def age(self):
+        return time() - self.fetched_at
+
+    def open_lists(self):
+        """The open lists of the board, in the order they're shown on Trello
+
+        :return: (list) List JSON objects
+        """
+        return sorted([l for l in self.lists.values() if not l.get("closed")], key=lambda l: l.get("pos", 0))
+
+    def cards_in(self, list_id):
+        """The open cards of a list, in the order they're shown on Trello
+
+        :param list_id: (str) The id of the list
+        :return: (list) Card JSON objects
+        """
+        if self._cards_by_list is None:
+            by_list = {}
+            for card in self.cards.values():
+                if not card.get("closed"):
+                    by_list.setdefault(card["idList"], []).append(card)
+            for cards in by_list.values():
+                cards.sort(key=lambda c: c.get("pos", 0))
+            self._cards_by_list = by_list
+        return self._cards_by_list.get(list_id, [])
+
+    def card_by_desc(self, desc):
+        """Looks up an open card by its description, e.g. an RSVP card by its Meetup member id
+
+        :param desc: (str)
+        :return: (dict) Card JSON object or None
+        """
+        if self._cards_by_desc is None:
+            self._cards_by_desc = {}
+            for card in self.cards.values():
+                if not card.get("closed"):
+                    self._cards_by_desc.setdefault(card.get("desc"), card)
+        return self._cards_by_desc.get(desc)
+
+    def card_labels(self, card):
+        """The names of the labels on :card:
+
+        :param card: (dict) Card JSON object
+        :return: (list) Label names
+        """
+        return [self.labels[i].get("name") for i in card.get("idLabels", []) if i in self.labels]
+
+    def label(self, label_name):
+        """Looks up a label by name
+
+        :param label_name: (str)
+        :return: (dict) Label JSON object or None
+        """
+        for label in self.labels.values():
+            if label.get("name") == label_name:
+                return label
+
+    def apply_actions(self, actions):
+        """Applies a board action feed to the snapshot. Removals, and updates whose action carries every changed
+        field, are applied directly. Everything else that was touched is returned so the caller can fetch its
+        current state.
+
+        :param actions: (list) Action JSON objects, newest first, as returned by GET /boards/{id}/actions
+        :return: (tuple) Sets of the card, list and label ids that need to be fetched again
+        """
+        cards, lists, labels = set(), set(), set()
+        for action in reversed(actions):
+            action_type = action.get("type")
+            data = action.get("data", {})
+            card_id = data.get("card", {}).get("id")
+            list_id = data.get("list", {}).get("id")
+            label_id = data.get("label", {}).get("id")
+
+            if action_type in ("deleteCard", "moveCardFromBoard"):
+                cards.discard(card_id)
+                self.remove_card(card_id)
+            elif action_type == "moveListFromBoard":
+                lists.discard(list_id)
+                self.remove_list(list_id)
+            elif action_type == "deleteLabel":
+                labels.discard(label_id)
+                self.remove_label(label_id)
+            elif action_type == "updateCard" and card_id in self.cards and card_id not in cards and \
+                    _carries_changes(data, "card"):
+                self.upsert_card(_merged(self.cards[card_id], data["card"]))
+            elif action_type in ("addLabelToCard", "removeLabelFromCard") and card_id in self.cards and \
+                    card_id not in cards and label_id in self.labels:
+                card = dict(self.cards[card_id])
+                others = [i for i in card.get("idLabels", []) if i != label_id]
+                card["idLabels"] = others + [label_id] if action_type == "addLabelToCard" else others
+                self.upsert_card(card)
+            elif action_type == "updateList" and list_id in self.lists and list_id not in lists and \
+                    _carries_changes(data, "list"):
+                self.upsert_list(_merged(self.lists[list_id], data["list"]))
+            elif action_type in ("createList", "updateList", "moveListToBoard"):
+                lists.add(list_id)
+            elif action_type in ("createLabel", "updateLabel"):
+                labels.add(label_id)
+            elif card_id:
+                cards.add(card_id)
+                if label_id and label_id not in self.labels:
+                    labels.add(label_id)
+            self.last_action_id = action.get("id", self.last_action_id)
+        return cards, lists, labels
+
+    def upsert_card(self, card):
+        self.cards[card["id"]] = card
+        self._reindex()
+
+    def remove_card(self, card_id):
+        if self.cards.pop(card_id, None) is not None:
+            self._reindex()
+
+    def upsert_list(self, board_list):
+        self.lists[board_list["id"]] = board_list
+
+    def remove_list(self, list_id):
+        self.lists.pop(list_id, None)
+
+    def upsert_label(self, label):
+        self.labels[label["id"]] = label
+
+    def remove_label(self, label_id):
+        self.labels.pop(label_id, None)
+
+    def touch(self):
+        self.fetched_at = time()
+
+    def _reindex(self):
+        self._cards_by_list = None
+        self._cards_by_desc = None
+
+
+def _carries_changes(data, kind):
+    """Whether an update action holds the new value of every field it changed"""
+    old = data.get("old")
+    return bool(old) and all(field in data.get(kind, {}) for field in old)
+
+
+def _merged(current, changes):
+    merged = dict(current)
+    merged.update((k, v) for k, v in changes.items() if k not in ("idShort", "shortLink"))
+    return merged
+
+
+class SnapshotCache(object):
+    def __init__(self, loader, ttl=60, syncer=None, pushed_ttl=3600):
+        """Keeps board snapshots in memory for :ttl: seconds
+
+        :param loader: (callable) Called with a board id, returns a fresh BoardSnapshot
+        :param ttl: (int) Seconds a snapshot is served before it's refreshed
+        :param syncer: (callable) Called with a stale BoardSnapshot to bring it up to date in place.
+                       Returns False when the snapshot has to be reloaded instead. Called with a BoardSnapshot and
+                       a list of actions to apply pushed actions, see push.
+        :param pushed_ttl: (int) Seconds a snapshot is served before it's refreshed, once its board pushes changes
+        """
+        self.loader = loader
+        self.ttl = ttl
+        self.syncer = syncer
+        self.pushed_ttl = pushed_ttl
+        self._snapshots = {}
+        self._pushed = set()
+
+    def get(self, board_id):
+        snapshot = self._snapshots.get(board_id)
+        ttl = self.pushed_ttl if board_id in self._pushed else self.ttl
+        if snapshot is None or snapshot.age > ttl:
+            snapshot = self.refresh(board_id)
+        return snapshot
+
+    def push(self, board_id, actions):
+        """Applies actions pushed by a webhook to the cached snapshot of :board_id:. The snapshot keeps its place
+        in the action feed, so the next, now rare, refresh fills in anything that was never pushed.
+
+        :param board_id: (str)
+        :param actions: (list) Action JSON objects, newest first
+        :return: (BoardSnapshot) The updated snapshot, or None if the board isn't cached
+        """
+        self._pushed.add(board_id)
+        snapshot = self._snapshots.get(board_id)
+        if snapshot is None:
+            return None
+        pushed = snapshot.copy()
+        try:
+            applied = self.syncer(pushed, actions)
+        except Exception as e:
+            logger.warning("Exception {} when applying pushed actions to board {}".format(e, board_id))
+            applied = False
+        if not applied:
+            self.expire(board_id)
+            return None
+        pushed.last_action_id = snapshot.last_action_id
+        pushed.fetched_at = snapshot.fetched_at
+        self._snapshots[board_id] = pushed
+        return pushed
+
+    def refresh(self, board_id):
+        """Brings the snapshot of :board_id: up to date, incrementally if possible
+
+        :param board_id: (str)
+        :return: (BoardSnapshot)
+        """
+        snapshot = self._snapshots.get(board_id)
+        if snapshot is not None and self.syncer:
+            try:
+                synced = snapshot.copy()
+                if self.syncer(synced):
+                    synced.touch()
+                    self._snapshots[board_id] = synced
+                    return synced
+            except Exception as e:
+                logger.warning("Exception {} when syncing board {}".format(e, board_id))
+        logger.debug("Loading snapshot for board {}".format(board_id))
+        snapshot = self.loader(board_id)
+        self._snapshots[board_id] = snapshot
+        return snapshot
+
+    def refresh_all(self):
+        """Brings every tracked snapshot up to date
+
+        :return: None
+        """
+        for board_id in list(self._snapshots):
+            self.refresh(board_id)
+
+    def find(self, board_name):
+        """The cached snapshot of the board named :board_name:, whatever its age
+
+        :param board_name: (str)
+        :return: (BoardSnapshot) or None
+        """
+        for snapshot in list(self._snapshots.values()):
+            if snapshot.name == board_name:
+                return snapshot
+
+    def export(self):
+        return [s.to_json() for s in list(self._snapshots.values())]
+
+    def restore(self, boards):
+        """Serves snapshots saved with export until they're next refreshed
+
+        :param boards: (list) As returned by export
+        :return: None
+        """
+        for board in boards:
+            if board["id"] not in self._snapshots:
+                self._snapshots[board["id"]] = BoardSnapshot.from_json(board)
+
+    def expire(self, board_id):
+        """Marks the snapshot of :board_id: as stale, so it's synced on the next read
+
+        :param board_id: (str)
+        :return: None
+        """
+        snapshot = self._snapshots.get(board_id)
+        if snapshot is not None:
+            snapshot.fetched_at = 0
+
+    def invalidate(self, board_id=None):
+        """Drops the snapshot of :board_id:, or every snapshot if no id is given
+
+        :param board_id: (str)
+        :return: None
+        """
+        if board_id is None:
+            self._snapshots.clear()
+        else:
+            self._snapshots.pop(board_id, None)
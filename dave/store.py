@@ -4,70 +4,285 @@ import json
 from os import environ
 from urllib import parse
 from dave.log import logger
+from dave.metrics import metrics
 
 import psycopg2
+from psycopg2.extras import Json, execute_values
+
+EVENTS_CHANNEL = "dave_events"
 
 
 class Store(object):
     def __init__(self):
+        """Creates a Store. The database connection is opened on first use."""
+        self._conn = None
+        self._schema_ready = False
+        self._inherited = []
+        self._listen_conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            conn = self._connect()
+            if not self._schema_ready:
+                try:
+                    self._ensure_schema(conn)
+                except Exception:
+                    # E.g. another process creating the same table. Starts over on the next use rather than
+                    # keeping a connection stuck in an aborted transaction.
+                    conn.close()
+                    raise
+                self._schema_ready = True
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _connect():
         parse.uses_netloc.append("postgres")
         url = parse.urlparse(environ["DATABASE_URL"])
-        self.conn = psycopg2.connect(
+        return psycopg2.connect(
             database=url.path[1:],
             user=url.username,
             password=url.password,
             host=url.hostname,
             port=url.port
         )
-        self.cur = self.conn.cursor()
+
+    def reconnect(self):
+        """Opens a connection of its own for a forked process. The inherited connection is kept referenced but
+        never used again: closing it, even by garbage collection, would end the session for the parent too.
+        """
+        if self._conn is not None:
+            self._inherited.append(self._conn)
+            self._conn = None
+        if self._listen_conn is not None:
+            self._inherited.append(self._listen_conn)
+            self._listen_conn = None
+
+    @staticmethod
+    def _ensure_schema(conn):
+        """Creates the events table, and migrates its data column to JSONB if it's still text"""
+        with conn.cursor() as cur:
+            cur.execute("CREATE TABLE IF NOT EXISTS events (event_id TEXT PRIMARY KEY, data JSONB NOT NULL);")
+            cur.execute("SELECT data_type FROM information_schema.columns "
+                        "WHERE table_name = 'events' AND column_name = 'data';")
+            data_type = cur.fetchone()[0]
+            if data_type != "jsonb":
+                logger.info("Migrating events.data from {} to jsonb".format(data_type))
+                cur.execute("ALTER TABLE events ALTER COLUMN data TYPE JSONB USING data::jsonb;")
+            cur.execute("CREATE TABLE IF NOT EXISTS participants ("
+                        "event_id TEXT NOT NULL, "
+                        "member_id TEXT NOT NULL, "
+                        "member_name TEXT NOT NULL, "
+                        "venue TEXT, "
+                        "response TEXT NOT NULL, "
+                        "updated_at TIMESTAMPTZ NOT NULL DEFAULT now(), "
+                        "PRIMARY KEY (event_id, member_id));")
+            cur.execute("CREATE INDEX IF NOT EXISTS participants_member_id_idx ON participants (member_id);")
+            cur.execute("CREATE INDEX IF NOT EXISTS participants_venue_idx ON participants (venue, response);")
+            cur.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, version BIGINT NOT NULL, "
+                        "value JSONB NOT NULL);")
+        conn.commit()
+
+    @staticmethod
+    def _load(data):
+        return json.loads(data) if isinstance(data, str) else data
 
     def store_event(self, event_id, data):
-        logger.debug("Storing event {}".format(event_id))
-        data = json.dumps(data)
-        sql = "INSERT INTO events (event_id, data) VALUES ('{0}', $${1}$$) ON CONFLICT (event_id) DO UPDATE SET " \
-              "data=$${1}$$;".format(event_id, data)
-        cur = self.conn.cursor()
-        cur.execute(sql)
-        self.conn.commit()
+        self.store_events({event_id: data})
 
     def retrieve_event(self, event_id):
         logger.debug("Retrieving event {}".format(event_id))
         if not event_id:
             return {}
-        sql = "SELECT data FROM events WHERE event_id='{}';".format(event_id)
-        cur = self.conn.cursor()
-        cur.execute(sql)
-        resp = cur.fetchone()
-        return json.dumps(resp)
+        return self.retrieve_events([event_id]).get(str(event_id), {})
 
+    @metrics.timed_method("postgres")
     def retrieve_events(self, event_ids):
         logger.debug("Retrieving events {}".format(event_ids))
         resp = {}
         if not event_ids:
             return resp
-        event_ids = ["$${}$$".format(e) for e in event_ids]
-        sql = "SELECT event_id, data FROM events WHERE event_id IN ({});".format(','.join(event_ids))
-        cur = self.conn.cursor()
-        cur.execute(sql)
-        all_events = cur.fetchall()
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT event_id, data FROM events WHERE event_id = ANY(%s);", ([str(e) for e in event_ids],))
+            all_events = cur.fetchall()
+        self.conn.commit()
         for event_id, data in all_events:
-            resp[event_id] = json.loads(data)
+            resp[event_id] = self._load(data)
         return resp
 
+    @metrics.timed_method("postgres")
     def store_events(self, events):
-        logger.debug("Storing events {}".format(events))
-        for event_id, data in events.items():
-            self.store_event(event_id, data)
+        """Upserts all :events: with a single statement in one transaction
 
+        :param events: (dict) Event data keyed by event id
+        :return: None
+        """
+        logger.debug("Storing events {}".format(list(events)))
+        if not events:
+            return
+        rows = [(str(event_id), Json(data)) for event_id, data in events.items()]
+        try:
+            with self.conn.cursor() as cur:
+                execute_values(cur, "INSERT INTO events (event_id, data) VALUES %s "
+                                    "ON CONFLICT (event_id) DO UPDATE SET data = EXCLUDED.data;",
+                               rows, page_size=len(rows))
+            self.conn.commit()
+        except psycopg2.Error:
+            self.conn.rollback()
+            raise
+
+    @metrics.timed_method("postgres")
     def retrieve_all_events(self):
         logger.debug("Retrieving all events {}")
         resp = {}
-        sql = "SELECT event_id, data FROM events;"
-
-        cur = self.conn.cursor()
-        cur.execute(sql)
-        all_events = self.cur.fetchall()
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT event_id, data FROM events;")
+            all_events = cur.fetchall()
         self.conn.commit()
         for event_id, data in all_events:
-            resp[event_id] = json.loads(data)
+            resp[event_id] = self._load(data)
         return resp
+
+    @metrics.timed_method("postgres")
+    def store_rsvps(self, event_id, venue, rsvps):
+        """Upserts RSVPs for an event into the participants table
+
+        :param event_id: (str) The Meetup event id
+        :param venue: (str) The name of the event's venue
+        :param rsvps: (list) (member_id, member_name, response) tuples
+        :return: None
+        """
+        logger.debug("Storing {} RSVPs for event {}".format(len(rsvps), event_id))
+        if not rsvps:
+            return
+        rows = [(str(event_id), str(member_id), name, venue, response) for member_id, name, response in rsvps]
+        try:
+            with self.conn.cursor() as cur:
+                execute_values(cur, "INSERT INTO participants (event_id, member_id, member_name, venue, response) "
+                                    "VALUES %s ON CONFLICT (event_id, member_id) DO UPDATE SET "
+                                    "member_name = EXCLUDED.member_name, venue = EXCLUDED.venue, "
+                                    "response = EXCLUDED.response, updated_at = now();",
+                               rows, page_size=len(rows))
+            self.conn.commit()
+        except psycopg2.Error:
+            self.conn.rollback()
+            raise
+
+    def _query(self, sql, params):
+        with self.conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+        self.conn.commit()
+        return rows
+
+    @metrics.timed_method("postgres")
+    def event_participants(self, event_id, response="yes"):
+        """The members that gave :response: for an event
+
+        :param event_id: (str) The Meetup event id
+        :param response: (str) "yes" or "no"
+        :return: (list) (member_id, member_name) tuples
+        """
+        return self._query("SELECT member_id, member_name FROM participants "
+                           "WHERE event_id = %s AND response = %s ORDER BY updated_at;", (str(event_id), response))
+
+    @metrics.timed_method("postgres")
+    def member_history(self, member_id):
+        """Every RSVP of a member, newest event first
+
+        :param member_id: (str) The Meetup member id
+        :return: (list) (event_id, event_name, event_time, venue, response) tuples
+        """
+        return self._query("SELECT p.event_id, e.data->>'name', (e.data->>'time')::bigint, p.venue, p.response "
+                           "FROM participants p LEFT JOIN events e ON e.event_id = p.event_id "
+                           "WHERE p.member_id = %s ORDER BY 3 DESC NULLS LAST;", (str(member_id),))
+
+    @metrics.timed_method("postgres")
+    def member_rsvp_count(self, member_id, response="yes"):
+        """How many events a member gave :response: to
+
+        :param member_id: (str) The Meetup member id
+        :param response: (str) "yes" or "no"
+        :return: (int)
+        """
+        return self._query("SELECT count(*) FROM participants WHERE member_id = %s AND response = %s;",
+                           (str(member_id), response))[0][0]
+
+    @metrics.timed_method("postgres")
+    def venue_participants(self, venue, response="yes"):
+        """The members that have RSVPed to events at :venue:, most frequent first
+
+        :param venue: (str) The name of the venue
+        :param response: (str) "yes" or "no"
+        :return: (list) (member_id, member_name, count) tuples
+        """
+        return self._query("SELECT member_id, max(member_name), count(*) FROM participants "
+                           "WHERE venue = %s AND response = %s GROUP BY member_id ORDER BY 3 DESC;", (venue, response))
+
+    @metrics.timed_method("postgres")
+    def publish_events(self, upcoming_ids, changed_ids):
+        """Bumps the version of the shared event state and notifies every listening process
+
+        :param upcoming_ids: (list) The ids of the upcoming events
+        :param changed_ids: (list) The ids of the events that were just saved
+        :return: (int) The new version
+        """
+        upcoming_ids = [str(e) for e in upcoming_ids]
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("INSERT INTO state (key, version, value) VALUES ('events', 1, %s) "
+                            "ON CONFLICT (key) DO UPDATE SET version = state.version + 1, value = EXCLUDED.value "
+                            "RETURNING version;", (Json({"upcoming": upcoming_ids}),))
+                version = cur.fetchone()[0]
+                payload = json.dumps({"version": version, "upcoming": upcoming_ids,
+                                      "changed": [str(e) for e in changed_ids]})
+                cur.execute("SELECT pg_notify(%s, %s);", (EVENTS_CHANNEL, payload))
+            self.conn.commit()
+        except psycopg2.Error:
+            self.conn.rollback()
+            raise
+        logger.debug("Published event state version {}".format(version))
+        return version
+
+    @metrics.timed_method("postgres")
+    def events_state(self):
+        """The latest published event state
+
+        :return: (tuple) The version and the list of upcoming event ids, or (0, None) if nothing was published
+        """
+        rows = self._query("SELECT version, value FROM state WHERE key = 'events';", ())
+        if not rows:
+            return 0, None
+        version, value = rows[0]
+        return version, self._load(value)["upcoming"]
+
+    @metrics.timed_method("postgres")
+    def listen_events(self):
+        """Starts listening for event state notifications on a dedicated connection
+
+        :return: (tuple) The current event state, as returned by events_state
+        """
+        self._listen_conn = self._connect()
+        self._listen_conn.set_session(autocommit=True)
+        with self._listen_conn.cursor() as cur:
+            cur.execute("LISTEN {};".format(EVENTS_CHANNEL))
+        return self.events_state()
+
+    def poll_events(self):
+        """Collects the event state notifications received since the last poll, without a round-trip
+
+        :return: (list) Notification payloads, oldest first, or None if the listening connection was lost
+        """
+        if self._listen_conn is None:
+            return None
+        try:
+            self._listen_conn.poll()
+        except psycopg2.Error as e:
+            logger.warning("Lost the event notification connection: {}".format(e))
+            self._listen_conn = None
+            return None
+        payloads = []
+        while self._listen_conn.notifies:
+            payloads.append(json.loads(self._listen_conn.notifies.pop(0).payload))
+        return payloads
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Incremental synchronisation of board snapshots through the Trello action feed
+"""
+
+from trello.exceptions import ResourceUnavailable
+
+from dave.log import logger
+
+SYNC_TYPES = frozenset([
+    "createCard", "updateCard", "deleteCard", "copyCard", "moveCardToBoard", "moveCardFromBoard",
+    "convertToCardFromCheckItem", "addLabelToCard", "removeLabelFromCard",
+    "createList", "updateList", "moveListToBoard", "moveListFromBoard",
+    "createLabel", "updateLabel", "deleteLabel",
+])
+SYNC_ACTIONS = ",".join(sorted(SYNC_TYPES))
+ACTIONS_LIMIT = 1000
+# Past this many cards, lists and labels to fetch one by one, reloading the whole board takes fewer requests
+REFETCH_LIMIT = 10
+CARD_FIELDS = "name,desc,idList,idLabels,pos,closed,idBoard"
+LIST_FIELDS = "name,pos,closed,idBoard"
+LABEL_FIELDS = "name,color,idBoard"
+
+
+class BoardSync(object):
+    def __init__(self, fetch_json):
+        """Creates a BoardSync object
+
+        :param fetch_json: (callable) TrelloClient.fetch_json or anything with the same signature
+        """
+        self.fetch_json = fetch_json
+
+    def __call__(self, snapshot, actions=None):
+        if actions is None:
+            return self.sync(snapshot)
+        return self.apply(snapshot, actions)
+
+    def sync(self, snapshot):
+        """Applies every board action since :snapshot: was last synced to it
+
+        :param snapshot: (BoardSnapshot) The snapshot to bring up to date, in place
+        :return: (bool) False when the snapshot can't be synced incrementally and needs a full reload
+        """
+        if not snapshot.last_action_id:
+            return False
+        actions = self.fetch_json("/boards/{}/actions".format(snapshot.board_id),
+                                  query_params={"since": snapshot.last_action_id, "filter": SYNC_ACTIONS,
+                                                "limit": ACTIONS_LIMIT, "fields": "id,type,data"})
+        if len(actions) >= ACTIONS_LIMIT:
+            logger.info("Too many changes on board {}, reloading it".format(snapshot.name))
+            return False
+        return self.apply(snapshot, actions)
+
+    def apply(self, snapshot, actions):
+        """Applies :actions: to :snapshot:, fetching whatever they touched that they don't carry
+
+        :param snapshot: (BoardSnapshot) The snapshot to update, in place
+        :param actions: (list) Action JSON objects, newest first. Those that don't change cards, lists or labels
+                        are skipped.
+        :return: (bool) False when so much changed that the snapshot is better reloaded in full
+        """
+        actions = [a for a in actions if a.get("type") in SYNC_TYPES]
+        if not actions:
+            return True
+
+        logger.debug("Applying {} actions to board {}".format(len(actions), snapshot.name))
+        cards, lists, labels = snapshot.apply_actions(actions)
+        if len(cards) + len(lists) + len(labels) > REFETCH_LIMIT:
+            logger.info("Too many changes on board {} to fetch one by one, reloading it".format(snapshot.name))
+            return False
+        for label_id in labels:
+            label = self._fetch("/labels/{}".format(label_id), LABEL_FIELDS, snapshot)
+            if label:
+                snapshot.upsert_label(label)
+            else:
+                snapshot.remove_label(label_id)
+        for list_id in lists:
+            board_list = self._fetch("/lists/{}".format(list_id), LIST_FIELDS, snapshot)
+            if board_list:
+                snapshot.upsert_list(board_list)
+            else:
+                snapshot.remove_list(list_id)
+        for card_id in cards:
+            card = self._fetch("/cards/{}".format(card_id), CARD_FIELDS, snapshot)
+            if card and not card.get("closed"):
+                snapshot.upsert_card(card)
+            else:
+                snapshot.remove_card(card_id)
+        return True
+
+    def _fetch(self, path, fields, snapshot):
+        """Gets the current state of a card, list or label
+
+        :return: (dict) The JSON object, or None if it's gone or no longer on the snapshot's board
+        :raise ResourceUnavailable: For any other failure, e.g. rate limiting, so the snapshot is reloaded instead
+        """
+        try:
+            resource = self.fetch_json(path, query_params={"fields": fields})
+        except ResourceUnavailable as e:
+            if getattr(e, "_status", None) != 404:
+                raise
+            return None
+        if resource.get("idBoard") != snapshot.board_id:
+            return None
+        return resource
@@ -1,24 +1,85 @@
 #!/usr/bin/env python
 
+import threading
 import yaml
-from functools import lru_cache
 from trello import TrelloClient
+from trello.exceptions import ResourceUnavailable
 from collections import OrderedDict
+from dave.addressbook import AddressBook
+from dave.cache import TTLCache, cached
 from dave.log import logger
+from dave.metrics import metrics, trello_endpoint
+from dave.snapshot import BoardSnapshot, SnapshotCache
+from dave.sync import BoardSync
+from dave.trello_writer import TrelloWriter
+
+BOARD_QUERY = {
+    "fields": "name,url",
+    "lists": "open",
+    "list_fields": "name,pos,closed",
+    "cards": "open",
+    "card_fields": "name,desc,idList,idLabels,pos,closed",
+    "labels": "all",
+    "label_fields": "name,color",
+    "labels_limit": "1000",
+    "actions": "all",
+    "actions_limit": "1",
+    "action_fields": "id",
+}
+# Seconds each kind of lookup is cached for
+CACHE_TTLS = {
+    "org_id": 3600,
+    "board": 600,
+    "board_by_url": 600,
+}
 
 
 class TrelloBoard(object):
-    def __init__(self, api_key, token):
+    def __init__(self, api_key, token, snapshot_ttl=60, addressbook_refresh=300, write_rate=10, write_workers=4,
+                 webhook_url=None, pushed_ttl=3600):
         """Creates a TrelloBoard object
 
         :param api_key: (str) Your Trello api key https://trello.com/1/appKey/generate
         :param token:  (str) Your Trello token
+        :param snapshot_ttl: (int) Seconds a board snapshot is served before it's reloaded
+        :param webhook_url: (str) The public URL of the webhook receiver, if there's one
+        :param pushed_ttl: (int) Seconds a board snapshot is served before it's reloaded, once webhooks push its
+                           changes
+        :param addressbook_refresh: (int) Seconds between background reloads of the address book
+        :param write_rate: (float) Trello writes per second
+        :param write_workers: (int) How many Trello writes may be in flight at the same time
         """
         self.tc = TrelloClient(api_key=api_key, token=token)
-        self._ab_id_cache = {}
-        self._ab_name_cache = {}
-        self._ab_slack_cache = {}
-        # self._warmup_caches()
+        timed_fetch_json = self._timed_fetch_json(self.tc.fetch_json)
+        self.writer = TrelloWriter(timed_fetch_json, rate=write_rate, workers=write_workers)
+        # py-trello's own objects call back into the client, so this times every Trello request. Trello's limit
+        # is per token, so the other requests take their turn in the writer's bucket.
+        self.tc.fetch_json = self._limited_fetch_json(timed_fetch_json, self.writer.bucket)
+        self._caches = {name: TTLCache(ttl=ttl) for name, ttl in CACHE_TTLS.items()}
+        self._snapshots = SnapshotCache(self._fetch_snapshot, ttl=snapshot_ttl, syncer=BoardSync(self.tc.fetch_json),
+                                        pushed_ttl=pushed_ttl)
+        self.webhook_url = webhook_url
+        self.contacts = AddressBook(self._address_book_snapshot, refresh_interval=addressbook_refresh)
+
+    @staticmethod
+    def _timed_fetch_json(fetch_json):
+        def timed(uri_path, http_method="GET", *args, **kwargs):
+            with metrics.timed("trello", trello_endpoint(http_method, uri_path)):
+                return fetch_json(uri_path, http_method, *args, **kwargs)
+        return timed
+
+    @staticmethod
+    def _limited_fetch_json(fetch_json, bucket):
+        def limited(uri_path, http_method="GET", *args, **kwargs):
+            bucket.acquire()
+            try:
+                return fetch_json(uri_path, http_method, *args, **kwargs)
+            except ResourceUnavailable as e:
+                if getattr(e, "_status", None) == 429:
+                    # Holds back the writes too, as the writer does after a 429 of its own
+                    bucket.pause(10)
+                raise
+        return limited
 
     @property
     def boards(self):
@@ -30,17 +91,9 @@ class TrelloBoard(object):
 
     @property
     def addressbook(self):
-        board = self._board("Address Book")
-        ab = {}
-        for l in board.list_lists(list_filter="open"):
-            for card in l.list_cards():
-                info = yaml.load(card.desc)
-                if info:
-                    ab[info["id"]] = {"name": card.name, "slack": info["slack"]}
-        self._ab_id_cache = ab
-        return ab
-
-    @lru_cache(maxsize=128)
+        return {c["id"]: {"name": c["name"], "slack": c["slack"]} for c in self.contacts.all()}
+
+    @cached("org_id")
     def _org_id(self, team_name):
         """Get the id of a Trello team
 
@@ -52,49 +105,147 @@ class TrelloBoard(object):
             if org.name == team_name:
                 return org.id
 
-    @lru_cache(maxsize=128)
+    @cached("board")
     def _board(self, board_name):
         logger.debug("Looking up board {}".format(board_name))
         board = [b for b in self.boards if b.name == board_name]
         if board:
             return board[0]
 
-    @lru_cache(maxsize=128)
+    @cached("board_by_url")
     def _board_by_url(self, board_url):
         board = [b for b in self.boards if b.url == board_url]
         if board:
             return board[0]
 
-    @lru_cache(maxsize=128)
-    def _member(self, member_id, board_name):
-        member_id = str(member_id)
-        board = self._board(board_name)
+    def _fetch_snapshot(self, board_id):
+        """Loads the lists, cards and labels of a board in one request
+
+        :param board_id: (str)
+        :return: (BoardSnapshot)
+        """
+        data = self.tc.fetch_json("/boards/{}".format(board_id), query_params=BOARD_QUERY)
+        return BoardSnapshot.from_json(data)
 
+    def snapshot(self, board_name):
+        """A cached snapshot of the board named :board_name:
+
+        :param board_name: (str)
+        :return: (BoardSnapshot) or None if there's no such board
+        """
+        known = self._snapshots.find(board_name)
+        if known:
+            return self._snapshots.get(known.board_id)
+        board = self._board(board_name)
         if not board:
             return None
+        return self._snapshots.get(board.id)
+
+    def expire(self, board_name):
+        """Marks the cached snapshot of :board_name: as stale, so it's synced on the next read
+
+        :param board_name: (str)
+        :return: None
+        """
+        board = self._board(board_name)
+        if board:
+            self._snapshots.expire(board.id)
 
-        for l in board.list_lists(list_filter="open"):
-            for card in l.list_cards():
-                if card.desc == member_id:
-                    return card
+    def invalidate(self, board_name=None):
+        """Drops the cached snapshot of :board_name:, or all snapshots if no name is given
 
-    @lru_cache(maxsize=128)
-    def _label(self, label_name, board_name):
+        :param board_name: (str)
+        :return: None
+        """
+        if board_name is None:
+            self._snapshots.invalidate()
+            return
         board = self._board(board_name)
-        label = [l for l in board.get_labels() if l.name == label_name]
-        if label:
-            return label[0]
+        if board:
+            self._snapshots.invalidate(board.id)
+
+    def _address_book_snapshot(self):
+        board = self._board("Address Book")
+        if board:
+            return self._snapshots.refresh(board.id)
+
+    def sync(self):
+        """Brings every cached board snapshot up to date through the boards' action feeds
+
+        :return: None
+        """
+        self._snapshots.refresh_all()
+
+    def export(self):
+        """The cached board snapshots, to be saved and given back to restore after a restart
+
+        :return: (list)
+        """
+        return self._snapshots.export()
 
-    def _warmup_caches(self):
-        logger.debug("Warming up the caches")
-        ids = self.addressbook
+    def restore(self, boards):
+        """Serves board snapshots saved with export right away, and brings them up to date in the background
+
+        :param boards: (list) As returned by export
+        :return: None
+        """
+        self._snapshots.restore(boards)
+
+        def revalidate():
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warning("Exception {} when revalidating restored boards".format(e))
+
+        threading.Thread(target=revalidate, name="trello-revalidate", daemon=True).start()
+
+    def watch(self, board):
+        """Registers a webhook pushing the changes of :board: to the webhook receiver
+
+        :param board: (Board)
+        :return: None
+        """
+        if not self.webhook_url:
+            return
         try:
-            for meetup_name, slack_name in [(n["name"], n["slack"]) for n in ids.values()]:
-                _ = self.contact_by_name(meetup_name)
-                if slack_name:
-                    _ = self.contact_by_slack_name(slack_name)
-        except Exception as e:
-            logger.warning("Exception {} when warming up caches".format(e))
+            self.tc.fetch_json("/webhooks", http_method="POST",
+                               post_args={"callbackURL": self.webhook_url, "idModel": board.id,
+                                          "description": "Dave: {}".format(board.name)})
+            logger.info("Watching board {}".format(board.name))
+        except ResourceUnavailable as e:
+            # Also what Trello answers when the webhook is registered already
+            logger.debug("Couldn't register a webhook for {}: {}".format(board.name, e))
+
+    def register_webhooks(self):
+        """Registers a webhook for the address book. Event boards are watched as they're created."""
+        board = self._board("Address Book")
+        if board:
+            self.watch(board)
+
+    def push(self, board_id, actions):
+        """Applies actions a webhook pushed to the cached snapshot of the board
+
+        :param board_id: (str)
+        :param actions: (list) Action JSON objects, newest first
+        :return: None
+        """
+        snapshot = self._snapshots.push(board_id, actions)
+        if snapshot and snapshot.name == "Address Book":
+            self.contacts.rebuild(snapshot)
+            self.contacts.refresh_interval = max(self.contacts.refresh_interval, self._snapshots.pushed_ttl)
+
+    def follow(self, pushes):
+        """Applies the actions put on :pushes: by the webhook receiver, forever
+
+        :param pushes: (queue) (board id, action) tuples
+        :return: None
+        """
+        while True:
+            board_id, action = pushes.get()
+            try:
+                self.push(board_id, [action])
+            except Exception as e:
+                logger.warning("Exception {} when applying a pushed action to board {}".format(e, board_id))
 
     def create_board(self, board_name, team_name=None):
         logger.debug("Checking for board {} on {} team".format(board_name, team_name))
@@ -104,8 +255,11 @@ class TrelloBoard(object):
 
         if not board:
             logger.debug("Adding board {}".format(board_name))
-            self.tc.add_board(board_name=board_name, source_board=template, organization_id=org_id,
-                              permission_level="public")
+            board = self.tc.add_board(board_name=board_name, source_board=template, organization_id=org_id,
+                                      permission_level="public")
+            self._caches["board"].set((board_name,), board)
+            self._caches["board_by_url"].invalidate_negatives()
+            self.watch(board)
 
     def add_rsvp(self, name, member_id, board_name):
         logger.debug("Adding rsvp {} to {}".format(name, board_name))
@@ -114,43 +268,52 @@ class TrelloBoard(object):
         if not board:
             return None
 
-        if not self._member(member_id, board_name):
-            rsvp_list = board.list_lists(list_filter="open")[0]
-            rsvp_list.add_card(name=name, desc=member_id)
+        snapshot = self._snapshots.get(board.id)
+        if not snapshot.card_by_desc(member_id):
+            rsvp_list = snapshot.open_lists()[0]
+            return self.writer.add_card(rsvp_list["id"], name=name, desc=member_id,
+                                        key="rsvp:{}:{}".format(board.id, member_id),
+                                        on_done=lambda _: self._snapshots.expire(board.id))
 
     def cancel_rsvp(self, member_id, board_name):
         logger.debug("Cancelling RSVP for members id {} at {}".format(member_id, board_name))
-        card = self._member(member_id, board_name)
+        snapshot = self.snapshot(board_name)
+        if not snapshot:
+            return None
+        member_id = str(member_id)
+        card = snapshot.card_by_desc(member_id)
         logger.debug("Card for member id {} is {}".format(member_id, card))
-        canceled = self._label("Canceled", board_name)
+        canceled = snapshot.label("Canceled")
         logger.debug("Canceled tag is {}".format(canceled))
-        if card:
-            card.add_label(canceled)
+        if card and canceled and canceled["id"] not in card.get("idLabels", []):
+            return self.writer.add_label(card["id"], canceled["id"],
+                                         on_done=lambda _: self._snapshots.expire(snapshot.board_id))
 
     def tables_detail(self, board_name):
         tables = {}
-        board = self._board(board_name)
+        snapshot = self.snapshot(board_name)
         info_card = None
-        if not board:
+        if not snapshot:
             return None
-        for table in board.list_lists(list_filter="open"):
+        for table in snapshot.open_lists():
             names = []
-            title = table.name if not table.name.startswith("RSVP") else "~ without a table ~"
-            for card in table.list_cards():
-                if card.name != "Info" and not card.labels:
-                    names.append(card.name)
-                elif card.name == "Info":
+            title = table["name"] if not table["name"].startswith("RSVP") else "~ without a table ~"
+            for card in snapshot.cards_in(table["id"]):
+                labels = snapshot.card_labels(card)
+                if card["name"] != "Info" and not labels:
+                    names.append(card["name"])
+                elif card["name"] == "Info":
                     info_card = card
-                elif card.labels:
-                    for label in card.labels:
-                        if label.name == "GM":
-                            names.append(card.name + " (GM)")
-                        elif label.name == "Canceled":
-                            names.append(card.name + " (CANCELED)")
+                elif labels:
+                    for label in labels:
+                        if label == "GM":
+                            names.append(card["name"] + " (GM)")
+                        elif label == "Canceled":
+                            names.append(card["name"] + " (CANCELED)")
                         else:
-                            names.append(card.name)
+                            names.append(card["name"])
             if info_card:
-                full_info = info_card.desc.split("Players: ", 1)
+                full_info = info_card["desc"].split("Players: ", 1)
                 blurb = full_info[0]
                 if len(full_info) == 2:
                     players = full_info[1]
@@ -169,69 +332,48 @@ class TrelloBoard(object):
 
     def contact_by_name(self, member_name):
         logger.debug("Checking {}".format(member_name))
-        if self._ab_name_cache.get(member_name):
-            return self._ab_name_cache[member_name]
-        else:
-            board = self._board("Address Book")
-            for l in board.list_lists(list_filter="open"):
-                for card in l.list_cards():
-                    desc = yaml.load(card.desc)
-                    if card.name == member_name and desc["slack"]:
-                        logger.debug("Desc: {}".format(desc))
-                        self._ab_name_cache[member_name] = yaml.load(card.desc)
-                        return self._ab_name_cache[member_name]
+        contact = self.contacts.by_name(member_name)
+        if contact and contact["slack"]:
+            return {"id": contact["id"], "slack": contact["slack"]}
 
     def contact_by_slack_name(self, slack_name):
-        if self._ab_slack_cache.get(slack_name):
-            return self._ab_slack_cache[slack_name]
-        else:
-            board = self._board("Address Book")
-            try:
-                for l in board.list_lists(list_filter="open"):
-                    for card in l.list_cards():
-                        desc = yaml.load(card.desc)
-                        if desc["slack"] == slack_name:
-                            self._ab_slack_cache[slack_name] = {"name": card.name, "id": desc["id"]}
-                            return self._ab_slack_cache[slack_name]
-            except:
-                logger.debug("Nothing found for {}".format(slack_name))
+        contact = self.contacts.by_slack_name(slack_name)
+        if contact:
+            return {"name": contact["name"], "id": contact["id"]}
+        logger.debug("Nothing found for {}".format(slack_name))
 
     def contact_by_id(self, member_id):
-        if self._ab_id_cache.get(member_id):
-            return self._ab_id_cache[member_id]
-        else:
-            board = self._board("Address Book")
-            for l in board.list_lists(list_filter="open"):
-                for card in l.list_cards():
-                    info = yaml.load(card.desc)
-                    if info:
-                        if info['id'] == member_id and info["slack"]:
-                            self._ab_id_cache[member_id] = {"name": card.name, "slack": info["slack"]}
-                            return self._ab_id_cache[member_id]
+        contact = self.contacts.by_id(member_id)
+        if contact and contact["slack"]:
+            return {"name": contact["name"], "slack": contact["slack"]}
 
     def add_contact(self, member_name, member_id):
         member_id = str(member_id)
-        if self._ab_id_cache.get(member_id):
+        if self.contacts.by_id(member_id):
             return True
 
-        board = self._board("Address Book")
-        ab_list = board.list_lists(list_filter="open")[0]
+        snapshot = self.snapshot("Address Book")
+        ab_list = snapshot.open_lists()[0]
         info = yaml.dump({"id": member_id, "slack": None}, default_flow_style=False)
-        no_slack = self._label("NoSlack", "Address Book")
-
-        for card in ab_list.list_cards():
-            desc = yaml.load(card.desc)
-            if desc["id"] == member_id:
-                return True
+        no_slack = snapshot.label("NoSlack")
 
-        ab_list.add_card(name=member_name, desc=info, labels=[no_slack])
+        self.contacts.add(member_name, member_id)
+        return self.writer.add_card(ab_list["id"], name=member_name, desc=info,
+                                    label_ids=[no_slack["id"]] if no_slack else None,
+                                    key="contact:{}".format(member_id))
 
     def add_table(self, title, info, board_url):
         board = self._board_by_url(board_url)
-        table_numbers = [int(n.name.split(".", 1)[0]) for n in board.list_lists(list_filter="open") if n.name[0].isnumeric()]
+        if not board:
+            # Let the next attempt look again, the topic may have been pointing to a board that's not there yet
+            self._caches["board_by_url"].invalidate((board_url,))
+            return "I can't find the Trello board {}".format(board_url)
+        snapshot = self._snapshots.get(board.id)
+        table_numbers = [int(n["name"].split(".", 1)[0]) for n in snapshot.open_lists() if n["name"][0].isnumeric()]
         ordinal = max(table_numbers) + 1 if table_numbers else 1
         title = "{}. {}".format(ordinal, title)
-        table = board.add_list(name=title, pos="bottom")
+        table = self.writer.add_list(board.id, name=title, pos="bottom").result()
         info = "\n\nPlayers:".join(info.split("Players:"))
-        table.add_card("Info", desc=info)
+        self.writer.add_card(table["id"], "Info", desc=info).result()
+        self._snapshots.expire(board.id)
         return "Table *{}* added to *{}*".format(title, board.name)
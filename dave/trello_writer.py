@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+A rate limited, parallel pipeline for writes to Trello
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from os import getpid
+from time import sleep, time
+
+from requests.exceptions import RequestException
+from trello.exceptions import ResourceUnavailable
+
+from dave.log import logger
+from dave.ratelimit import TokenBucket
+
+
+class TrelloWriter(object):
+    def __init__(self, fetch_json, rate=10, burst=10, workers=4, max_retries=5, idempotency_ttl=600):
+        """Creates a Trello write pipeline. Trello allows 100 requests per 10 seconds per token.
+
+        :param fetch_json: (callable) TrelloClient.fetch_json or anything with the same signature
+        :param rate: (float) Requests per second
+        :param burst: (int) Requests that may go out back to back after a quiet period
+        :param workers: (int) How many requests may be in flight at the same time
+        :param max_retries: (int) Attempts before a write is given up
+        :param idempotency_ttl: (int) Seconds a finished write's key keeps repeated submissions from being sent
+        """
+        self.fetch_json = fetch_json
+        self.bucket = TokenBucket(rate, burst)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.idempotency_ttl = idempotency_ttl
+        self.failed = 0
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._pid == getpid():
+            return
+        self._pid = getpid()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._in_flight = {}
+        self._done = OrderedDict()
+
+    def submit(self, key, path, post_args, on_done=None):
+        """Queues a POST to Trello. Submitting a key that's in flight or recently done returns the earlier write.
+
+        :param key: (str) Idempotency key identifying the write
+        :param path: (str) The API path, e.g. /cards
+        :param post_args: (dict) The request body
+        :param on_done: (callable) Called with the response JSON once the write succeeded
+        :return: (Future) Resolves to the response JSON
+        """
+        self._ensure_started()
+        with self._lock:
+            now = time()
+            while self._done and next(iter(self._done.values()))[0] < now - self.idempotency_ttl:
+                self._done.popitem(last=False)
+            if key in self._done:
+                return self._done[key][1]
+            if key in self._in_flight:
+                return self._in_flight[key]
+            future = self._pool.submit(self._write, path, post_args)
+            self._in_flight[key] = future
+        future.add_done_callback(lambda f: self._finished(key, f, on_done))
+        return future
+
+    def flush(self, timeout=None):
+        """Waits for every write in flight to finish
+
+        :param timeout: (float) The longest to wait, in seconds
+        :return: (bool) Whether they all finished
+        """
+        if self._pid != getpid():
+            return True
+        with self._lock:
+            in_flight = list(self._in_flight.values())
+        return not wait(in_flight, timeout=timeout).not_done
+
+    def _finished(self, key, future, on_done):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if not future.exception():
+                self._done[key] = (time(), future)
+        if future.exception():
+            self.failed += 1
+            logger.error("Trello write {} failed: {}".format(key, future.exception()))
+        elif on_done:
+            on_done(future.result())
+
+    def _write(self, path, post_args):
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                return self.fetch_json(path, http_method="POST", post_args=post_args)
+            except ResourceUnavailable as e:
+                status = getattr(e, "_status", None)
+                if status != 429 and (status is None or status < 500):
+                    raise
+                error = e
+            except RequestException as e:
+                status, error = None, e
+            attempt += 1
+            if attempt >= self.max_retries:
+                raise error
+            backoff = 10 if status == 429 else 2 ** attempt
+            logger.warning("Trello write to {} failed ({}), retrying in {}s".format(path, error, backoff))
+            if status == 429:
+                self.bucket.pause(backoff)
+            else:
+                sleep(backoff)
+
+    def add_card(self, list_id, name, desc="", label_ids=None, key=None, on_done=None):
+        post_args = {"idList": list_id, "name": name, "desc": desc}
+        if label_ids:
+            post_args["idLabels"] = ",".join(label_ids)
+        return self.submit(key or "card:{}:{}:{}".format(list_id, name, desc), "/cards", post_args, on_done)
+
+    def add_label(self, card_id, label_id, key=None, on_done=None):
+        return self.submit(key or "label:{}:{}".format(card_id, label_id), "/cards/{}/idLabels".format(card_id),
+                           {"value": label_id}, on_done)
+
+    def add_list(self, board_id, name, pos="bottom", key=None, on_done=None):
+        return self.submit(key or "list:{}:{}".format(board_id, name), "/lists",
+                           {"idBoard": board_id, "name": name, "pos": pos}, on_done)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+An embedded HTTP endpoint receiving Trello webhooks
+https://developers.trello.com/page/webhooks
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from dave.log import logger
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    # http.server only has one from Python 3.7
+    daemon_threads = True
+
+
+def signature(secret, body, callback_url):
+    """The signature Trello sends in the X-Trello-Webhook header
+
+    :param secret: (str) The Trello application's secret
+    :param body: (bytes) The request body
+    :param callback_url: (str) The callback URL the webhook was registered with
+    :return: (str)
+    """
+    digest = hmac.new(secret.encode(), body + callback_url.encode(), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode()
+
+
+class WebhookReceiver(object):
+    def __init__(self, on_action, secret=None, callback_url=None):
+        """Creates a receiver for Trello webhooks
+
+        :param on_action: (callable) Called with the id of the watched model and the action, for every webhook
+        :param secret: (str) The Trello application's secret. If given, requests without a valid signature are
+                       refused.
+        :param callback_url: (str) The public URL the webhooks were registered with. Needed to check signatures.
+        """
+        self.on_action = on_action
+        self.secret = secret
+        self.callback_url = callback_url
+        self.received = 0
+        self.refused = 0
+        self.server = None
+
+    def verify(self, body, header):
+        if not self.secret:
+            return True
+        return bool(header) and hmac.compare_digest(signature(self.secret, body, self.callback_url or ""), header)
+
+    def _handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                # Trello checks the callback URL answers before it registers a webhook
+                self.send_response(200)
+                self.end_headers()
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if not receiver.verify(body, self.headers.get("X-Trello-Webhook")):
+                    receiver.refused += 1
+                    logger.warning("Refused a Trello webhook with a bad signature")
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+                try:
+                    payload = json.loads(body.decode())
+                    model_id, action = payload["model"]["id"], payload["action"]
+                except (ValueError, KeyError, TypeError):
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                receiver.received += 1
+                self.send_response(200)
+                self.end_headers()
+                try:
+                    receiver.on_action(model_id, action)
+                except Exception as e:
+                    logger.error("Swallowed exception handling a Trello webhook: {}".format(e))
+
+            def log_message(self, format, *args):
+                logger.debug("Webhook endpoint: " + format % args)
+
+        return Handler
+
+    def start(self, port, host="0.0.0.0"):
+        """Serves webhooks from a background thread
+
+        :param port: (int) 0 picks a free port
+        :param host: (str)
+        :return: (tuple) The address it listens on
+        """
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="trello-webhooks", daemon=True).start()
+        logger.info("Receiving Trello webhooks on {}:{}".format(*self.server.server_address[:2]))
+        return self.server.server_address[:2]
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
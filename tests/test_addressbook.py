@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import unittest
+from dave.addressbook import AddressBook
+from dave.snapshot import BoardSnapshot
+
+
+BOARD = {
+    "id": "ab",
+    "name": "Address Book",
+    "lists": [{"id": "l1", "name": "Contacts", "pos": 1}],
+    "cards": [
+        {"id": "c1", "name": "Alice", "desc": "id: '1'\nslack: alice\n", "idList": "l1", "idLabels": []},
+        {"id": "c2", "name": "Bob", "desc": "id: 2\nslack: null\n", "idList": "l1", "idLabels": []},
+        {"id": "c3", "name": "Broken", "desc": "{", "idList": "l1", "idLabels": []},
+    ],
+    "labels": [],
+}
+
+
+class TestAddressBook(unittest.TestCase):
+
+    def setUp(self):
+        self.loads = 0
+
+        def loader():
+            self.loads += 1
+            return BoardSnapshot.from_json(BOARD)
+
+        self.book = AddressBook(loader, refresh_interval=3600)
+
+    def test_lookups(self):
+        self.assertEqual("alice", self.book.by_id(1)["slack"])
+        self.assertEqual("2", self.book.by_name("Bob")["id"])
+        self.assertEqual("Alice", self.book.by_slack_name("alice")["name"])
+
+    def test_misses_are_local(self):
+        self.assertIsNone(self.book.by_name("Nobody"))
+        self.assertIsNone(self.book.by_slack_name("nobody"))
+        self.assertIsNone(self.book.by_id("3"))
+        self.assertEqual(1, self.loads)
+
+    def test_add(self):
+        self.book.add("Carol", 3)
+        self.assertEqual("Carol", self.book.by_id("3")["name"])
+        self.assertEqual(1, self.loads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+import json
+import unittest
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from benchmarks.fakes import FakeServices
+from benchmarks.memory_store import MemoryDatabase, MemoryStore
+from benchmarks.synthetic import World
+
+
+class TestFakeServices(unittest.TestCase):
+
+    def setUp(self):
+        self.world = World(events=2, rsvps=3, tables=2, contacts=5)
+        self.services = FakeServices(self.world).start()
+
+    def tearDown(self):
+        self.services.stop()
+
+    def _call(self, path, json_body=None, form=None):
+        data, headers = None, {}
+        if json_body is not None:
+            data, headers = json.dumps(json_body).encode(), {"Content-Type": "application/json; charset=utf-8"}
+        elif form is not None:
+            data = urlencode(form).encode()
+        with urlopen(Request(self.services.url + path, data=data, headers=headers)) as resp:
+            return json.loads(resp.read().decode())
+
+    def test_meetup(self):
+        events = self._call("/meetup/2/events?group_id=1&status=upcoming")["results"]
+        self.assertEqual(2, len(events))
+        rsvps = self._call("/meetup/2/rsvps?event_id={}".format(events[0]["id"]))["results"]
+        self.assertEqual(3, len(rsvps))
+
+    def test_meetup_pages(self):
+        event_id = self.world.events[0]["id"]
+        page = self._call("/meetup/2/rsvps?event_id={}&page=2&only=response".format(event_id))
+        self.assertEqual([{"response": "yes"}] * 2, page["results"])
+        self.assertIn("offset=1", page["meta"]["next"])
+        last = self._call("/meetup/2/rsvps?event_id={}&page=2&offset=1".format(event_id))
+        self.assertEqual(1, len(last["results"]))
+        self.assertEqual("", last["meta"]["next"])
+
+    def test_trello_writes_show_up_in_the_action_feed(self):
+        board = self.world.board_by_name("Meetup Template")
+        since = self._call("/trello/1/boards/{}".format(board["id"]))["actions"][0]["id"]
+        board_list = self._call("/trello/1/lists", {"idBoard": board["id"], "name": "3. New table"})
+        card = self._call("/trello/1/cards", {"idList": board_list["id"], "name": "Info", "desc": "Players: 4"})
+
+        actions = self._call("/trello/1/boards/{}/actions?since={}".format(board["id"], since))
+        self.assertEqual(["createCard", "createList"], [a["type"] for a in actions])
+        self.assertEqual(card, self._call("/trello/1/cards/{}".format(card["id"])))
+        self.assertEqual({"trello POST /1/cards": 1, "trello POST /1/lists": 1},
+                         {k: v for k, v in self.services.reset_calls().items() if "POST" in k})
+
+    def test_slack(self):
+        self.assertTrue(self._call("/slack/api/chat.postMessage", form={"channel": "#dungeon_lab", "text": "Hi"})["ok"])
+        self.assertEqual("Hi", self.world.posted[0]["text"])
+        channels = self._call("/slack/api/channels.list", form={})["channels"]
+        self.assertEqual(2, len(channels))
+
+
+class TestMemoryStore(unittest.TestCase):
+
+    def test_notifications_reach_other_stores(self):
+        database = MemoryDatabase()
+        monitor, worker = MemoryStore(database), MemoryStore(database)
+        self.assertEqual((0, None), worker.listen_events())
+        monitor.store_events({"1": {"name": "Game night"}})
+        monitor.publish_events(["1"], ["1"])
+        self.assertEqual([{"version": 1, "upcoming": ["1"], "changed": ["1"]}], worker.poll_events())
+        self.assertEqual({"1": {"name": "Game night"}}, worker.retrieve_events(["1"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
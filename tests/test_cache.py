@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+import unittest
+from dave.cache import TTLCache, cached
+
+
+class Lookup(object):
+    def __init__(self, ttl=60, negative_ttl=60):
+        self._caches = {"thing": TTLCache(ttl=ttl, negative_ttl=negative_ttl, negative_maxsize=2)}
+        self.calls = 0
+        self.things = {"a": 1}
+
+    @cached("thing")
+    def thing(self, name):
+        self.calls += 1
+        return self.things.get(name)
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_hits_and_misses(self):
+        lookup = Lookup()
+        self.assertEqual(1, lookup.thing("a"))
+        self.assertEqual(1, lookup.thing(name="a"))
+        self.assertEqual(1, lookup.calls)
+        self.assertEqual({"hits": 1, "misses": 1, "size": 1, "negative_size": 0}, lookup._caches["thing"].stats)
+
+    def test_expiry(self):
+        lookup = Lookup(ttl=0)
+        lookup.thing("a")
+        lookup.thing("a")
+        self.assertEqual(2, lookup.calls)
+
+    def test_negative_caching_is_bounded(self):
+        lookup = Lookup()
+        for name in ("x", "y", "z"):
+            self.assertIsNone(lookup.thing(name))
+        self.assertEqual(2, lookup._caches["thing"].stats["negative_size"])
+        lookup.thing("x")
+        self.assertEqual(4, lookup.calls)
+
+    def test_invalidation(self):
+        lookup = Lookup()
+        self.assertIsNone(lookup.thing("b"))
+        lookup.things["b"] = 2
+        self.assertIsNone(lookup.thing("b"))
+        lookup._caches["thing"].invalidate_negatives()
+        self.assertEqual(2, lookup.thing("b"))
+        lookup._caches["thing"].invalidate(("b",))
+        lookup.thing("b")
+        self.assertEqual(3, lookup.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,189 @@
 #!/usr/bin/env python
 
+import threading
 import unittest
+from concurrent.futures import Future
+
+from benchmarks.memory_store import MemoryDatabase, MemoryStore
 from dave import bot
+from dave.resolver import EventResolver
+
+
+def rsvp(member_id, name, response="yes"):
+    return {"member": {"member_id": member_id, "name": name}, "response": response}
+
+
+class FakeChat(object):
+    def __init__(self):
+        self.announced = []
+
+    def new_rsvp(self, names, response, event_name, spots_left, channel):
+        self.announced.append((names, response))
+
+
+class FakeTrello(object):
+    def __init__(self):
+        self.added = []
+        self.failing = set()
+
+    def add_rsvp(self, name, member_id, board_name):
+        self.added.append(member_id)
+        written = Future()
+        if member_id in self.failing:
+            written.set_exception(ConnectionError("Trello is down"))
+        else:
+            written.set_result({"id": "card"})
+        return written
+
+    def cancel_rsvp(self, member_id, board_name):
+        pass
+
+
+class FakeMeetup(object):
+    def __init__(self, upcoming_events=()):
+        self.upcoming_events = list(upcoming_events)
+
+
+def new_bot(database):
+    """A Bot with stand-ins for its clients. Bot() would post to Slack."""
+    dave = bot.Bot.__new__(bot.Bot)
+    dave.storg = FakeMeetup()
+    dave.chat = FakeChat()
+    dave.trello = FakeTrello()
+    dave.ds = MemoryStore(database)
+    dave.stored_events = {}
+    dave._saved_fingerprints = {}
+    dave._published_upcoming = None
+    dave._state_version = None
+    dave._resolver = EventResolver()
+    dave._failed_rsvps = {}
+    dave._failed_rsvps_lock = threading.Lock()
+    return dave
+
+
+def event(event_id, name, time, **data):
+    return dict({"id": event_id, "name": name, "time": time, "venue": {"name": "STORG Clubhouse"},
+                 "rsvp_limit": None, "yes_rsvp_count": 0}, **data)
+
 
 class TestBot(unittest.TestCase):
 
     def test(self):
         pass
 
+    def test_no_migration_without_rsvps(self):
+        dave = new_bot(MemoryDatabase())
+        stored = event("e1", "Dungeon", 1, participants=["Alice", "Bob"])
+        dave.stored_events = {"e1": stored}
+        # What a failed Meetup fetch looks like
+        self.assertFalse(dave._handle_rsvps(stored, rsvps=iter([])))
+        self.assertEqual(["Alice", "Bob"], stored["participants"])
+        self.assertEqual([], dave.chat.announced)
+
+        self.assertTrue(dave._handle_rsvps(stored, rsvps=iter([rsvp(1, "Alice"), rsvp(2, "Bob"), rsvp(3, "Carol")])))
+        self.assertEqual([["1", "Alice"], ["2", "Bob"], ["3", "Carol"]], stored["participants"])
+        self.assertEqual([("Carol", "yes")], dave.chat.announced)
+        self.assertEqual(["3"], dave.trello.added)
+
+    def test_next_event(self):
+        dave = new_bot(MemoryDatabase())
+        self.assertIsNone(dave.next_event)
+        later, sooner, unstored = event("e1", "Later", 2), event("e2", "Sooner", 1), event("e3", "Unstored", 0)
+        dave.storg.upcoming_events = [later, sooner, unstored]
+        dave.stored_events = {"e1": later, "e2": sooner}
+        self.assertIs(sooner, dave.next_event)
+        self.assertEqual(["e1", "e2", "e3"], [e["id"] for e in dave.storg.upcoming_events])
+
+    def test_retries_failed_card(self):
+        dave = new_bot(MemoryDatabase())
+        stored = event("e1", "Dungeon", 1, participants=[])
+        dave.stored_events = {"e1": stored}
+        dave.trello.failing.add("1")
+        self.assertTrue(dave._handle_rsvps(stored, rsvps=[rsvp(1, "Alice")]))
+        self.assertEqual({"e1": {"1"}}, dave._failed_rsvps)
+
+        # Only the card is written again, Alice isn't announced or stored a second time
+        dave.trello.failing.clear()
+        self.assertFalse(dave._handle_rsvps(stored, rsvps=[rsvp(1, "Alice")]))
+        self.assertEqual(["1", "1"], dave.trello.added)
+        self.assertEqual([("Alice", "yes")], dave.chat.announced)
+        self.assertEqual(1, dave.ds.queries["store_rsvps"])
+        self.assertEqual({}, dave._failed_rsvps)
+        self.assertFalse(dave._handle_rsvps(stored, rsvps=[rsvp(1, "Alice")]))
+        self.assertEqual(["1", "1"], dave.trello.added)
+
+
+class TestSharedState(unittest.TestCase):
+
+    def setUp(self):
+        self.database = MemoryDatabase()
+        self.monitor = new_bot(self.database)
+        self.events = {"e1": event("e1", "Dungeon", 1), "e2": event("e2", "Dragon", 2)}
+        self.monitor.stored_events = self.events
+        self.monitor.storg.upcoming_events = list(self.events.values())
+
+    def test_saves_changed_events(self):
+        self.monitor.save_events()
+        self.assertEqual(1, self.monitor.ds.queries["store_events"])
+        self.assertEqual(["e1", "e2"], sorted(self.database.notifications[-1]["changed"]))
+
+        # Nothing changed, nothing is written
+        self.monitor.save_events()
+        self.assertEqual(1, self.monitor.ds.queries["store_events"])
+        self.assertEqual(1, self.monitor.ds.queries["publish_events"])
+
+        self.events["e2"]["participants"] = [["1", "Alice"]]
+        self.monitor.save_events()
+        self.assertEqual(2, self.monitor.ds.queries["store_events"])
+        self.assertEqual({"version": 2, "upcoming": ["e1", "e2"], "changed": ["e2"]},
+                         self.database.notifications[-1])
+
+    def _synced_worker(self):
+        self.monitor.save_events()
+        worker = new_bot(self.database)
+        worker._sync_shared_state()
+        self.assertEqual(self.events, worker.stored_events)
+        self.assertEqual(1, worker.ds.queries["retrieve_events"])
+        return worker
+
+    def test_unchanged_state_is_not_reloaded(self):
+        worker = self._synced_worker()
+        worker._sync_shared_state()
+        self.monitor.save_events()
+        worker._sync_shared_state()
+        self.assertEqual(1, worker.ds.queries["retrieve_events"])
+
+    def test_reloads_changed_events(self):
+        worker = self._synced_worker()
+        self.events["e2"]["participants"] = [["1", "Alice"]]
+        self.monitor.save_events()
+        worker._sync_shared_state()
+        self.assertEqual(2, worker.ds.queries["retrieve_events"])
+        self.assertEqual([["1", "Alice"]], worker.stored_events["e2"]["participants"])
+        self.assertEqual(2, worker._state_version)
+
+    def test_missed_notification_reloads_upcoming(self):
+        worker = self._synced_worker()
+        self.events["e1"]["participants"] = [["1", "Alice"]]
+        self.monitor.save_events()
+        self.events["e2"]["participants"] = [["2", "Bob"]]
+        self.monitor.save_events()
+        # The notification about e1 never arrives
+        del self.database.notifications[-2]
+        worker._sync_shared_state()
+        self.assertEqual(self.events, worker.stored_events)
+
+    def test_drops_past_events(self):
+        worker = self._synced_worker()
+        # The monitor keeps past events, but stops publishing them as upcoming
+        self.monitor.storg.upcoming_events = [self.events["e2"]]
+        self.monitor.save_events()
+        worker._sync_shared_state()
+        self.assertEqual(["e2"], list(worker.stored_events))
+        self.assertEqual(["e2"], list(worker._saved_fingerprints))
+        self.assertEqual([self.events["e2"]], worker.storg.upcoming_events)
+        self.assertEqual(["Dragon"], worker.event_names)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+import json
+import shutil
+import tempfile
+import unittest
+from dave.disk_cache import DiskCache
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        cache = DiskCache(self.directory)
+        cache.save("trello", {"boards": [1, 2]})
+        data, age = cache.load("trello")
+        self.assertEqual({"boards": [1, 2]}, data)
+        self.assertLess(age, 60)
+
+    def test_merge(self):
+        monitor, worker = DiskCache(self.directory), DiskCache(self.directory)
+        monitor.merge("trello", [{"id": "b1", "v": 2}, {"id": "b2", "v": 1}], newest=lambda b: b["v"])
+        worker.merge("trello", [{"id": "b1", "v": 1}, {"id": "b3", "v": 1}], newest=lambda b: b["v"])
+        boards, _ = monitor.load_merged("trello")
+        self.assertEqual({"b1": 2, "b2": 1, "b3": 1}, {b["id"]: b["v"] for b in boards})
+
+    def test_merge_drops_what_nobody_saved_lately(self):
+        DiskCache(self.directory).merge("trello", [{"id": "b1"}], newest=len)
+        DiskCache(self.directory, max_age=-1).merge("trello", [{"id": "b2"}], newest=len)
+        boards, _ = DiskCache(self.directory).load_merged("trello")
+        self.assertEqual(["b2"], [b["id"] for b in boards])
+
+    def test_missing(self):
+        self.assertEqual((None, None), DiskCache(self.directory).load("trello"))
+
+    def test_too_old(self):
+        DiskCache(self.directory).save("trello", {})
+        self.assertEqual((None, None), DiskCache(self.directory, max_age=-1).load("trello"))
+
+    def test_other_version(self):
+        with open("{}/trello.json".format(self.directory), "w") as f:
+            json.dump({"version": 0, "saved_at": 0, "data": {}}, f)
+        self.assertEqual((None, None), DiskCache(self.directory, max_age=10 ** 10).load("trello"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import json
+import os
+import tempfile
+import unittest
+from time import time
+
+from dave.metrics import Metrics, collect, summary, trello_endpoint
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_record(self):
+        m = Metrics()
+        m.record("meetup", "/2/rsvps", 0.02)
+        m.record("meetup", "/2/rsvps", 20, error=True)
+        series = m.snapshot()["meetup /2/rsvps"]
+        self.assertEqual(2, series["calls"])
+        self.assertEqual(1, series["errors"])
+        self.assertEqual(1, series["buckets"][1])
+        self.assertEqual(1, series["buckets"][-1])
+
+    def test_timed_counts_exceptions_as_errors(self):
+        m = Metrics()
+        with self.assertRaises(ValueError):
+            with m.timed("postgres", "retrieve_events"):
+                raise ValueError()
+        self.assertEqual(1, m.snapshot()["postgres retrieve_events"]["errors"])
+
+    def test_collect_merges_live_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for pid in (1, 2):
+                m = Metrics()
+                m.record("slack", "chat.postMessage", 0.2)
+                with open(os.path.join(directory, "{}.json".format(pid)), "w") as f:
+                    json.dump({"updated_at": time(), "series": m.snapshot()}, f)
+            with open(os.path.join(directory, "3.json"), "w") as f:
+                json.dump({"updated_at": time() - 3600, "series": m.snapshot()}, f)
+            merged = collect(directory)
+            self.assertEqual(2, merged["slack chat.postMessage"]["calls"])
+            self.assertEqual(0.25, merged["slack chat.postMessage"]["p95"])
+            self.assertIn("slack chat.postMessage", summary(directory))
+
+    def test_summary_without_metrics(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual("No metrics yet", summary(directory))
+
+    def test_trello_endpoint(self):
+        self.assertEqual("GET /boards/:id/actions", trello_endpoint("GET", "/boards/5a1b2c3d4e5f60718293a4b5/actions"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+import threading
+import unittest
+from dave.outbox import Outbox
+
+
+class FakeSlack(object):
+    def __init__(self, responses=None):
+        self.calls = []
+        self.responses = list(responses or [])
+        self.posted = threading.Event()
+
+    def api_call(self, method, **kwargs):
+        self.calls.append((method, kwargs))
+        self.posted.set()
+        return self.responses.pop(0) if self.responses else {"ok": True}
+
+
+class TestOutbox(unittest.TestCase):
+
+    def test_post(self):
+        slack = FakeSlack()
+        outbox = Outbox(slack.api_call, rate=100, burst=10)
+        outbox.post("#general", text="Hello")
+        self.assertTrue(slack.posted.wait(2))
+        self.assertEqual(("chat.postMessage", {"channel": "#general", "text": "Hello"}), slack.calls[0])
+
+    def test_coalesce(self):
+        slack = FakeSlack()
+        outbox = Outbox(slack.api_call, rate=100, burst=10, coalesce_window=0.2)
+
+        def render(items):
+            return {"text": ", ".join(items)}
+
+        outbox.coalesce("rsvp", "#general", "Alice", render)
+        outbox.coalesce("rsvp", "#general", "Bob", render)
+        self.assertTrue(slack.posted.wait(2))
+        self.assertEqual([("chat.postMessage", {"channel": "#general", "text": "Alice, Bob"})], slack.calls)
+
+    def test_retry_after(self):
+        slack = FakeSlack([{"ok": False, "error": "ratelimited", "headers": {"Retry-After": "0.1"}}])
+        outbox = Outbox(slack.api_call, rate=100, burst=10)
+        outbox.post("#general", text="Hello")
+        self.assertTrue(slack.posted.wait(2))
+        slack.posted.clear()
+        self.assertTrue(slack.posted.wait(2))
+        self.assertEqual(2, len(slack.calls))
+        self.assertEqual(0, outbox.dropped)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import unittest
+from dave.participants import diff_rsvps, known_participants, needs_migration, participant_names, \
+    stored_participants
+
+
+def rsvp(member_id, name, response="yes"):
+    return {"member": {"member_id": member_id, "name": name}, "response": response}
+
+
+class TestParticipants(unittest.TestCase):
+
+    def test_diff(self):
+        known = {"1": "Alice", "2": "Bob"}
+        rsvps = [rsvp(1, "Alice"), rsvp(2, "Bob", "no"), rsvp(3, "Carol"), rsvp(4, "Dan", "no"), rsvp(5, "Eve")]
+        joined, cancelled = diff_rsvps(known, rsvps)
+        self.assertEqual({"3": "Carol", "5": "Eve"}, joined)
+        self.assertEqual(["3", "5"], list(joined))
+        self.assertEqual({"2": "Bob"}, cancelled)
+
+    def test_namesakes_are_different_members(self):
+        joined, _ = diff_rsvps({"1": "Alex"}, [rsvp(1, "Alex"), rsvp(7, "Alex")])
+        self.assertEqual({"7": "Alex"}, joined)
+
+    def test_migrates_list_of_names(self):
+        event = {"participants": ["Alice", "Bob", "Gone"]}
+        rsvps = [rsvp(1, "Alice"), rsvp(2, "Bob", "no"), rsvp(3, "Carol")]
+        self.assertTrue(needs_migration(event))
+        known = known_participants(event, rsvps)
+        self.assertEqual({"1": "Alice", "2": "Bob"}, known)
+        self.assertEqual(({"3": "Carol"}, {"2": "Bob"}), diff_rsvps(known, rsvps))
+
+    def test_keeps_join_order(self):
+        # JSONB would hand a dict back with its keys sorted, so "10" would come before "9"
+        event = {"participants": stored_participants({"9": "Alice", "10": "Bob"})}
+        self.assertEqual([["9", "Alice"], ["10", "Bob"]], event["participants"])
+        self.assertFalse(needs_migration(event))
+        self.assertEqual(["9", "10"], list(known_participants(event)))
+        self.assertEqual(["Alice", "Bob"], participant_names(event))
+
+    def test_names(self):
+        self.assertEqual(["Alice", "Bob"], participant_names({"participants": {"1": "Alice", "2": "Bob"}}))
+        self.assertEqual(["Alice"], participant_names({"participants": ["Alice"]}))
+        self.assertEqual([], participant_names({}))
+
+
+if __name__ == '__main__':
+    unittest.main()
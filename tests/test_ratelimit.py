@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+import unittest
+from time import time
+from dave.ratelimit import TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.now = time() + 1
+
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.assertEqual(0, bucket.consume(now=self.now))
+        self.assertEqual(0, bucket.consume(now=self.now))
+        self.assertAlmostEqual(1, bucket.consume(now=self.now))
+        self.assertEqual(0, bucket.consume(now=self.now + 1))
+
+    def test_pause(self):
+        bucket = TokenBucket(rate=10, capacity=10)
+        bucket.pause(30, now=self.now)
+        self.assertAlmostEqual(30, bucket.delay(now=self.now))
+        self.assertAlmostEqual(5, bucket.consume(now=self.now + 25))
+        self.assertEqual(0, bucket.consume(now=self.now + 31))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+import unittest
+from dave.resolver import EventResolver
+
+EVENTS = ["Rat Queens Night", "Blades in the Dark", "Blades of the Empire", "Mouse Guard"]
+
+
+class TestEventResolver(unittest.TestCase):
+
+    def test_exact(self):
+        self.assertEqual("Mouse Guard", EventResolver(EVENTS).resolve("mouse guard"))
+
+    def test_single_prefix(self):
+        self.assertEqual("Rat Queens Night", EventResolver(EVENTS).resolve("rat queens"))
+
+    def test_fuzzy(self):
+        resolver = EventResolver(EVENTS)
+        self.assertEqual("Blades in the Dark", resolver.resolve("blades dark"))
+        self.assertEqual("Mouse Guard", resolver.resolve("mouse gaurd"))
+
+    def test_index_forgets_resolutions(self):
+        resolver = EventResolver(EVENTS)
+        self.assertEqual("Mouse Guard", resolver.resolve("mouse"))
+        resolver.index(EVENTS + ["Mouse Guard Winter"])
+        self.assertEqual({}, resolver._memo)
+        self.assertEqual("Mouse Guard Winter", resolver.resolve("mouse guard winter"))
+        resolver.index(EVENTS[:1])
+        self.assertEqual("Rat Queens Night", resolver.resolve("mouse"))
+
+    def test_empty(self):
+        self.assertIsNone(EventResolver().resolve("rat queens"))
+        self.assertIsNone(EventResolver().resolve(""))
+
+
+if __name__ == '__main__':
+    unittest.main()
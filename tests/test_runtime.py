@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+import threading
+import unittest
+from time import sleep
+
+from dave.runtime import AsyncRuntime
+
+
+class FakeChat(object):
+    def __init__(self, commands):
+        self.commands = commands
+
+    def rtm(self, queue):
+        for command in self.commands:
+            queue.put(command)
+
+
+class FakeTrello(object):
+    def __init__(self):
+        self.pushed = []
+
+    def push(self, board_id, actions):
+        self.pushed.append((board_id, actions))
+
+
+class FakeBot(object):
+    def __init__(self, commands):
+        self.chat = FakeChat(commands)
+        self.trello = FakeTrello()
+        self.answered = []
+        self.starts = 0
+        self.checks = 0
+        self.done = threading.Event()
+        self.expected = len(commands)
+
+    def warm_up(self):
+        pass
+
+    def start_monitoring(self, restore=True):
+        self.starts += 1
+        if self.starts == 1:
+            raise ConnectionError("Postgres is down")
+        return "scheduler"
+
+    def check_once(self, scheduler):
+        self.checks += 1
+        if self.checks == 1:
+            raise ConnectionError("Postgres is down")
+        return 0.01
+
+    def answer(self, command, channel_id, user_id, sync=True):
+        # Slow answers give later commands from the same channel every chance to overtake
+        sleep(0.01 if command.endswith("1") else 0)
+        self.answered.append((command, channel_id, sync))
+        if len(self.answered) == self.expected:
+            self.done.set()
+
+
+class TestAsyncRuntime(unittest.TestCase):
+
+    def test_run(self):
+        commands = [("{} {}".format(channel, i), channel, "U1") for i in range(1, 4) for channel in ("C1", "C2")]
+        bot = FakeBot(commands)
+        runtime = AsyncRuntime(bot, workers=2, threads=4, retry_after=0.01)
+        running = threading.Thread(target=runtime.run)
+        running.start()
+        try:
+            self.assertTrue(bot.done.wait(5))
+            runtime.push("b1", {"id": "a1"})
+            for _ in range(100):
+                if bot.trello.pushed and bot.checks > 2:
+                    break
+                sleep(0.01)
+        finally:
+            runtime.stop()
+            running.join(5)
+        self.assertFalse(running.is_alive())
+        for channel in ("C1", "C2"):
+            self.assertEqual(["{} {}".format(channel, i) for i in range(1, 4)],
+                             [c for c, channel_id, _ in bot.answered if channel_id == channel])
+        self.assertEqual({False}, set(sync for _, _, sync in bot.answered))
+        self.assertEqual([("b1", [{"id": "a1"}])], bot.trello.pushed)
+        # The monitor carried on after failing to start and failing a check
+        self.assertEqual(2, bot.starts)
+        self.assertGreater(bot.checks, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
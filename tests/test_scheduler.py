@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import unittest
+from dave.scheduler import PollScheduler, DAY
+
+NOW = 1500000000
+
+
+def event(event_id, starts_in, rsvp_limit=None, yes=0):
+    return {"id": event_id, "time": (NOW + starts_in) * 1000, "rsvp_limit": rsvp_limit, "yes_rsvp_count": yes}
+
+
+class TestPollScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = PollScheduler(base_interval=600, min_interval=60, max_interval=3600)
+
+    def test_new_events_are_due(self):
+        events = [event("a", DAY * 30), event("b", 3600)]
+        self.assertEqual(events, self.scheduler.due(events, now=NOW))
+
+    def test_sooner_events_are_checked_more_often(self):
+        tonight = self.scheduler.interval(event("a", 3600), now=NOW)
+        next_month = self.scheduler.interval(event("b", DAY * 30), now=NOW)
+        self.assertLess(tonight, next_month)
+
+    def test_almost_full_events_are_checked_more_often(self):
+        roomy = self.scheduler.interval(event("a", DAY * 3, rsvp_limit=40, yes=10), now=NOW)
+        full = self.scheduler.interval(event("b", DAY * 3, rsvp_limit=40, yes=39), now=NOW)
+        self.assertLess(full, roomy)
+
+    def test_unchanged_events_back_off(self):
+        e = event("a", DAY * 3)
+        self.scheduler.record(e, changed=False, now=NOW)
+        first = self.scheduler.interval(e, now=NOW)
+        self.scheduler.record(e, changed=False, now=NOW)
+        self.assertLess(first, self.scheduler.interval(e, now=NOW))
+        self.scheduler.record(e, changed=True, now=NOW)
+        self.assertLess(self.scheduler.interval(e, now=NOW), first)
+
+    def test_due_after_interval(self):
+        e = event("a", DAY * 3)
+        self.scheduler.record(e, changed=True, now=NOW)
+        self.assertEqual([], self.scheduler.due([e], now=NOW + 1))
+        self.assertEqual([e], self.scheduler.due([e], now=NOW + 3600))
+
+    def test_next_wakeup_is_bounded(self):
+        self.assertEqual(600, self.scheduler.next_wakeup(now=NOW))
+        self.scheduler.record(event("a", 3600), changed=True, now=NOW)
+        self.assertEqual(60, self.scheduler.next_wakeup(now=NOW))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+import unittest
+
+from dave.slack import Slack
+
+
+class FakeSlackClient(object):
+    def __init__(self, channels):
+        self.channels = channels
+        self.calls = []
+        self.listing_fails = False
+
+    def api_call(self, method, **kwargs):
+        self.calls.append(method)
+        if method == "channels.list" and self.listing_fails:
+            return {"ok": False, "error": "ratelimited"}
+        if method == "channels.list":
+            return {"ok": True, "channels": [{"id": k, "name": v["name"], "topic": {"value": v["topic"]}}
+                                             for k, v in self.channels.items()]}
+        if method == "channels.info":
+            channel = self.channels.get(kwargs["channel"])
+            if not channel:
+                return {"ok": False, "error": "channel_not_found"}
+            return {"ok": True, "channel": {"id": kwargs["channel"], "name": channel["name"],
+                                            "topic": {"value": channel["topic"]}}}
+        if method == "im.list":
+            return {"ok": True, "ims": [{"id": "D1"}]}
+        return {"ok": True}
+
+
+class TestSlack(unittest.TestCase):
+
+    def setUp(self):
+        self.slack = Slack("xoxb-test", "UBOT")
+        self.sc = FakeSlackClient({"C1": {"name": "dungeon_lab", "topic": "<https://trello.com/b/old>"}})
+        self.slack.sc = self.sc
+
+    def test_channel_name_looks_up_new_channels(self):
+        self.assertEqual("dungeon_lab", self.slack.channel_name("C1"))
+        self.sc.channels["C2"] = {"name": "rat_queens", "topic": ""}
+        self.assertEqual("rat_queens", self.slack.channel_name("C2"))
+        self.assertIsNone(self.slack.channel_name("D1"))
+        self.assertEqual(1, self.sc.calls.count("channels.info"))
+
+    def test_failed_listing_is_not_retried_by_every_lookup(self):
+        self.sc.listing_fails = True
+        self.assertEqual("dungeon_lab", self.slack.channel_name("C1"))
+        self.assertEqual("dungeon_lab", self.slack.channel_name("C1"))
+        self.assertEqual(1, self.sc.calls.count("channels.list"))
+        self.assertEqual(1, self.sc.calls.count("channels.info"))
+
+    def test_channel_topic_for_writes_is_fresh(self):
+        self.assertEqual("<https://trello.com/b/old>", self.slack.channel_topic("C1"))
+        self.sc.channels["C1"]["topic"] = "<https://trello.com/b/new>"
+        self.assertEqual("<https://trello.com/b/old>", self.slack.channel_topic("C1"))
+        self.assertEqual("<https://trello.com/b/new>", self.slack.channel_topic("C1", cached=False))
+        with self.assertRaises(ValueError):
+            self.slack.channel_topic("C404", cached=False)
+
+    def test_parse_slack_output(self):
+        events = [
+            {"type": "hello"},
+            {"type": "message", "channel": "C1", "user": "U1", "text": "<@UBOT> table status"},
+            "not an event",
+            {"type": "message", "channel": "C1", "text": "<@UBOT> no user"},
+            {"type": "message", "subtype": "bot_message", "channel": "C1", "text": "<@UBOT> from a bot"},
+            {"type": "message", "channel": "C1", "user": "UBOT", "text": "<@UBOT> talking to myself"},
+            {"type": "message", "channel": "C1", "user": "U2", "text": "not for the bot"},
+            {"type": "message", "channel": "D1", "user": "U2", "text": "who is bob"},
+            {"type": "message", "channel": "C2", "user": "U3", "text": "thanks <@UBOT>"},
+        ]
+        self.assertEqual([("table status", "C1", "U1"), ("who is bob", "D1", "U2"), ("thanks", "C2", "U3")],
+                         self.slack._parse_slack_output(events))
+        self.assertEqual(2, self.slack.dropped_events)
+
+
+if __name__ == '__main__':
+    unittest.main()
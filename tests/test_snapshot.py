@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import unittest
+from dave.snapshot import BoardSnapshot, SnapshotCache
+
+
+BOARD = {
+    "id": "b1",
+    "name": "Meetup",
+    "url": "https://trello.com/b/abc/meetup",
+    "lists": [
+        {"id": "l2", "name": "1. Rat Queens", "pos": 2},
+        {"id": "l1", "name": "RSVPs", "pos": 1},
+    ],
+    "cards": [
+        {"id": "c1", "name": "Alice", "desc": "1", "idList": "l1", "idLabels": [], "pos": 2},
+        {"id": "c2", "name": "Bob", "desc": "2", "idList": "l1", "idLabels": ["x1"], "pos": 1},
+        {"id": "c3", "name": "Info", "desc": "Blurb", "idList": "l2", "idLabels": [], "pos": 1},
+    ],
+    "labels": [{"id": "x1", "name": "Canceled", "color": "red"}],
+}
+
+
+class TestBoardSnapshot(unittest.TestCase):
+
+    def test_ordering(self):
+        snapshot = BoardSnapshot.from_json(BOARD)
+        self.assertEqual(["l1", "l2"], [l["id"] for l in snapshot.open_lists()])
+        self.assertEqual(["Bob", "Alice"], [c["name"] for c in snapshot.cards_in("l1")])
+
+    def test_labels(self):
+        snapshot = BoardSnapshot.from_json(BOARD)
+        self.assertEqual(["Canceled"], snapshot.card_labels(snapshot.cards["c2"]))
+        self.assertEqual("x1", snapshot.label("Canceled")["id"])
+
+    def test_apply_actions(self):
+        snapshot = BoardSnapshot.from_json(BOARD)
+        actions = [
+            {"id": "a3", "type": "deleteCard", "data": {"card": {"id": "c1"}, "list": {"id": "l1"}}},
+            {"id": "a2", "type": "addLabelToCard", "data": {"card": {"id": "c3"}, "label": {"id": "x2"}}},
+            {"id": "a1", "type": "updateCard", "data": {"card": {"id": "c1"}, "list": {"id": "l1"}}},
+        ]
+        cards, lists, labels = snapshot.apply_actions(actions)
+        self.assertEqual({"c3"}, cards)
+        self.assertEqual(set(), lists)
+        self.assertEqual({"x2"}, labels)
+        self.assertNotIn("c1", snapshot.cards)
+        self.assertEqual("a3", snapshot.last_action_id)
+
+    def test_apply_actions_in_place(self):
+        snapshot = BoardSnapshot.from_json(BOARD)
+        actions = [
+            {"id": "a2", "type": "addLabelToCard", "data": {"card": {"id": "c1"}, "label": {"id": "x1"}}},
+            {"id": "a1", "type": "updateCard", "data": {"card": {"id": "c1", "idList": "l2"},
+                                                        "old": {"idList": "l1"}}},
+        ]
+        self.assertEqual((set(), set(), set()), snapshot.apply_actions(actions))
+        self.assertEqual(["Info", "Alice"], [c["name"] for c in snapshot.cards_in("l2")])
+        self.assertEqual(["Canceled"], snapshot.card_labels(snapshot.cards["c1"]))
+
+
+class TestSnapshotCache(unittest.TestCase):
+
+    def test_invalidate(self):
+        loads = []
+
+        def loader(board_id):
+            loads.append(board_id)
+            return BoardSnapshot.from_json(BOARD)
+
+        cache = SnapshotCache(loader, ttl=60)
+        cache.get("b1")
+        cache.get("b1")
+        self.assertEqual(1, len(loads))
+        cache.invalidate("b1")
+        cache.get("b1")
+        self.assertEqual(2, len(loads))
+
+    def test_expire_syncs(self):
+        loads, syncs = [], []
+        cache = SnapshotCache(lambda board_id: loads.append(board_id) or BoardSnapshot.from_json(BOARD),
+                              ttl=60, syncer=lambda snapshot: syncs.append(snapshot) or True)
+        cache.get("b1")
+        cache.expire("b1")
+        cache.get("b1")
+        self.assertEqual(1, len(loads))
+        self.assertEqual(1, len(syncs))
+
+    def test_push(self):
+        loads = []
+        cache = SnapshotCache(lambda board_id: loads.append(board_id) or BoardSnapshot.from_json(BOARD), ttl=0,
+                              syncer=lambda snapshot, actions=None: bool(actions) and not snapshot.apply_actions(actions)[0],
+                              pushed_ttl=60)
+        self.assertIsNone(cache.push("b1", []))
+        cache.get("b1")
+        pushed = cache.push("b1", [{"id": "a1", "type": "updateCard",
+                                    "data": {"card": {"id": "c3", "desc": "New blurb"}, "old": {"desc": "Blurb"}}}])
+        self.assertEqual("New blurb", pushed.cards["c3"]["desc"])
+        self.assertIsNone(pushed.last_action_id)
+        self.assertIs(pushed, cache.get("b1"))
+        self.assertEqual(1, len(loads))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import unittest
+
+import psycopg2
+
+from dave.store import Store
+
+
+class FakeCursor(object):
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, args=None):
+        if self.conn.fail:
+            raise psycopg2.ProgrammingError("relation \"events\" already exists")
+
+    def fetchone(self):
+        return ["jsonb"]
+
+
+class FakeConnection(object):
+    def __init__(self, fail):
+        self.fail = fail
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class TestStore(unittest.TestCase):
+
+    def test_schema_failure_is_retried(self):
+        connections = [FakeConnection(fail=True), FakeConnection(fail=False)]
+        store = Store()
+        opened = iter(connections)
+        store._connect = lambda: next(opened)
+        with self.assertRaises(psycopg2.Error):
+            store.conn
+        self.assertTrue(connections[0].closed)
+        self.assertIs(connections[1], store.conn)
+        self.assertIs(connections[1], store.conn)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import unittest
+from trello.exceptions import ResourceUnavailable
+
+from dave.snapshot import BoardSnapshot, SnapshotCache
+from dave.sync import REFETCH_LIMIT, BoardSync
+
+BOARD = {
+    "id": "b1",
+    "name": "Meetup",
+    "lists": [{"id": "l1", "name": "RSVPs", "pos": 1, "idBoard": "b1"}],
+    "cards": [{"id": "c1", "name": "Alice", "desc": "1", "idList": "l1", "idLabels": [], "pos": 1, "idBoard": "b1"}],
+    "labels": [],
+    "actions": [{"id": "a1"}],
+}
+
+
+class FakeResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeTrello(object):
+    def __init__(self, status=200):
+        self.status = status
+        self.calls = []
+
+    def fetch_json(self, path, query_params=None):
+        self.calls.append(path)
+        if path == "/boards/b1":
+            return BOARD
+        if path == "/boards/b1/actions":
+            return [update_card("c1")]
+        if self.status != 200:
+            raise ResourceUnavailable("failed", FakeResponse(self.status))
+        return dict(BOARD["cards"][0], name="Alice B.")
+
+
+def update_card(card_id):
+    return {"id": "a2", "type": "updateCard", "data": {"card": {"id": card_id}, "old": {"name": "Alice"}}}
+
+
+class TestBoardSync(unittest.TestCase):
+
+    def _cache(self, trello, ttl=60):
+        cache = SnapshotCache(lambda board_id: BoardSnapshot.from_json(trello.fetch_json("/boards/b1")), ttl=ttl,
+                              syncer=BoardSync(trello.fetch_json))
+        cache.get("b1")
+        return cache
+
+    def test_deleted(self):
+        trello = FakeTrello(status=404)
+        snapshot = BoardSnapshot.from_json(BOARD)
+        self.assertTrue(BoardSync(trello.fetch_json).apply(snapshot, [update_card("c1")]))
+        self.assertIsNone(snapshot.card_by_desc("1"))
+
+    def test_rate_limited_sync_reloads(self):
+        trello = FakeTrello(status=429)
+        cache = self._cache(trello, ttl=-1)
+        self.assertEqual("Alice", cache.get("b1").card_by_desc("1")["name"])
+        self.assertEqual(["/boards/b1", "/boards/b1/actions", "/cards/c1", "/boards/b1"], trello.calls)
+
+    def test_rate_limited_push_expires(self):
+        trello = FakeTrello(status=429)
+        cache = self._cache(trello)
+        self.assertIsNone(cache.push("b1", [update_card("c1")]))
+        self.assertEqual("Alice", cache.find("Meetup").card_by_desc("1")["name"])
+        self.assertEqual(0, cache.find("Meetup").fetched_at)
+
+    def test_many_changes_reload(self):
+        trello = FakeTrello()
+        snapshot = BoardSnapshot.from_json(BOARD)
+        actions = [update_card("c{}".format(i)) for i in range(REFETCH_LIMIT + 1)]
+        self.assertFalse(BoardSync(trello.fetch_json).apply(snapshot, actions))
+        self.assertEqual([], trello.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
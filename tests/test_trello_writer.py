@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import threading
+import unittest
+from time import sleep, time
+from trello.exceptions import ResourceUnavailable
+
+from dave.trello_boards import TrelloBoard
+from dave.trello_writer import TrelloWriter
+
+
+class FakeResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeBucket(object):
+    def __init__(self):
+        self.pauses = []
+
+    def acquire(self):
+        pass
+
+    def pause(self, seconds):
+        self.pauses.append(seconds)
+
+
+class FakeTrello(object):
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def fetch_json(self, path, http_method="GET", post_args=None):
+        self.release.wait(5)
+        self.calls.append((path, post_args))
+        if self.failures:
+            raise ResourceUnavailable("failed", FakeResponse(self.failures.pop(0)))
+        return {"id": "c{}".format(len(self.calls))}
+
+
+def eventually(check, timeout=5):
+    # on_done and the failure count are updated after the future resolves
+    deadline = time() + timeout
+    while not check() and time() < deadline:
+        sleep(0.01)
+    return check()
+
+
+class TestTrelloWriter(unittest.TestCase):
+
+    def test_rate_limited_write_is_retried(self):
+        trello = FakeTrello(failures=[429])
+        writer = TrelloWriter(trello.fetch_json)
+        writer.bucket = FakeBucket()
+        self.assertEqual({"id": "c2"}, writer.add_card("l1", "Alice", "1").result(5))
+        self.assertEqual(2, len(trello.calls))
+        self.assertEqual([10], writer.bucket.pauses)
+        self.assertEqual(0, writer.failed)
+
+    def test_client_errors_are_not_retried(self):
+        trello = FakeTrello(failures=[400])
+        writer = TrelloWriter(trello.fetch_json)
+        writer.bucket = FakeBucket()
+        with self.assertRaises(ResourceUnavailable):
+            writer.add_card("l1", "Alice", "1").result(5)
+        self.assertTrue(eventually(lambda: writer.failed == 1))
+        self.assertEqual(1, len(trello.calls))
+
+    def test_same_key_is_written_once(self):
+        trello = FakeTrello()
+        trello.release.clear()
+        writer = TrelloWriter(trello.fetch_json)
+        writer.bucket = FakeBucket()
+        done = []
+        first = writer.add_card("l1", "Alice", "1", key="rsvp:b1:1", on_done=done.append)
+        again = writer.add_card("l1", "Alice", "1", key="rsvp:b1:1", on_done=done.append)
+        self.assertIs(first, again)
+        trello.release.set()
+        self.assertEqual({"id": "c1"}, first.result(5))
+        self.assertTrue(eventually(lambda: done))
+        self.assertIs(first, writer.add_card("l1", "Alice", "1", key="rsvp:b1:1"))
+        self.assertEqual(1, len(trello.calls))
+        self.assertEqual([{"id": "c1"}], done)
+
+    def test_rate_limited_read_pauses_writes(self):
+        trello = FakeTrello(failures=[429])
+        bucket = FakeBucket()
+        fetch_json = TrelloBoard._limited_fetch_json(trello.fetch_json, bucket)
+        with self.assertRaises(ResourceUnavailable):
+            fetch_json("/boards/b1")
+        self.assertEqual([10], bucket.pauses)
+        self.assertEqual({"id": "c2"}, fetch_json("/boards/b1"))
+        self.assertEqual([10], bucket.pauses)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import json
+import unittest
+from time import sleep, time
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from benchmarks.fakes import FakeServices
+from benchmarks.synthetic import World
+from dave.webhooks import WebhookReceiver, signature
+
+
+class TestWebhookReceiver(unittest.TestCase):
+
+    def setUp(self):
+        self.actions = []
+        self.receiver = WebhookReceiver(lambda model_id, action: self.actions.append((model_id, action)),
+                                        secret="secret")
+        host, port = self.receiver.start(0, host="127.0.0.1")
+        self.url = "http://{}:{}/".format(host, port)
+        self.receiver.callback_url = self.url
+
+    def tearDown(self):
+        self.receiver.stop()
+
+    def _post(self, payload, signed=True):
+        body = json.dumps(payload).encode()
+        headers = {"X-Trello-Webhook": signature("secret" if signed else "guess", body, self.url)}
+        with urlopen(Request(self.url, data=body, headers=headers)) as resp:
+            return resp.status
+
+    def _wait(self):
+        # The receiver answers Trello before handing the action on
+        deadline = time() + 5
+        while not self.actions and time() < deadline:
+            sleep(0.01)
+
+    def test_head(self):
+        with urlopen(Request(self.url, method="HEAD")) as resp:
+            self.assertEqual(200, resp.status)
+
+    def test_signed(self):
+        self.assertEqual(200, self._post({"action": {"id": "a1", "type": "updateCard"}, "model": {"id": "b1"}}))
+        self._wait()
+        self.assertEqual([("b1", {"id": "a1", "type": "updateCard"})], self.actions)
+
+    def test_bad_signature(self):
+        with self.assertRaises(HTTPError) as raised:
+            self._post({"action": {"id": "a1"}, "model": {"id": "b1"}}, signed=False)
+        self.assertEqual(401, raised.exception.code)
+        self.assertEqual([], self.actions)
+
+    def test_driven_by_stand_in(self):
+        world = World(events=1, rsvps=1, tables=1, contacts=1)
+        services = FakeServices(world, webhook_secret="secret").start()
+        try:
+            board = world.board_by_name("Meetup Template")
+            board_list = next(iter(board["lists"].values()))
+            for path, args in (("/trello/1/webhooks", {"callbackURL": self.url, "idModel": board["id"]}),
+                               ("/trello/1/cards", {"idList": board_list["id"], "name": "Alice", "desc": "1"})):
+                urlopen(Request(services.url + path, data=json.dumps(args).encode(),
+                                headers={"Content-Type": "application/json"})).close()
+            self._wait()
+        finally:
+            services.stop()
+        self.assertEqual(board["id"], self.actions[0][0])
+        self.assertEqual("createCard", self.actions[0][1]["type"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,30 +1,111 @@
 #!/usr/bin/env python
 
 import multiprocessing as mp
+import threading
+import zlib
+from os import environ
 
-from dave.bot import Bot
+from dave.bot import Bot, metrics_dir, metrics_interval, trello_webhook_url
+from dave.metrics import metrics, serve as serve_metrics
+from dave.runtime import AsyncRuntime
+from dave.webhooks import WebhookReceiver
+
+runtime = environ.get("RUNTIME", "processes")
+conversation_workers = int(environ.get("CONVERSATION_WORKERS", "4"))
+runtime_threads = int(environ.get("RUNTIME_THREADS", "16"))
+metrics_port = environ.get("METRICS_PORT")
+metrics_host = environ.get("METRICS_HOST", "127.0.0.1")
+webhook_port = environ.get("WEBHOOK_PORT")
+trello_api_secret = environ.get("TRELLO_API_SECRET")
+
+
+class ChannelRouter(object):
+    def __init__(self, queues):
+        """Spreads tasks over several queues. Tasks from the same channel always go to the same queue, so
+        they're answered in the order they came in.
+
+        :param queues: (list) One task queue per worker
+        """
+        self.queues = queues
+
+    def put(self, task):
+        command, channel_id, user_id = task
+        self.queues[zlib.crc32(channel_id.encode()) % len(self.queues)].put(task)
+
+
+class FanOut(object):
+    def __init__(self, queues):
+        """Hands every pushed Trello action to each process that caches boards
+
+        :param queues: (list) One queue per process
+        """
+        self.queues = queues
+
+    def __call__(self, board_id, action):
+        for queue in self.queues:
+            queue.put((board_id, action))
 
 
 class Worker(mp.Process):
-    def __init__(self, task_queue, result_queue, bot):
+    def __init__(self, task_queue, result_queue, bot, pushes=None):
         mp.Process.__init__(self)
         self.task_queue = task_queue
         self.result_queue = result_queue
         self.bot = bot
+        self.pushes = pushes
 
     def run(self):
+        self.bot.after_fork()
+        if self.pushes:
+            self.bot.follow_trello(self.pushes)
+        self.bot.warm_up()
         self.bot.conversation(self.task_queue)
 
-if __name__ == "__main__":
+
+def run_monitor(bot, pushes=None):
+    bot.after_fork()
+    if pushes:
+        bot.follow_trello(pushes)
+    bot.monitor_events()
+
+
+def run_async(bot):
+    """Runs everything in this process, on one event loop"""
+    metrics.publish_periodically(metrics_dir, metrics_interval)
+    async_runtime = AsyncRuntime(bot, workers=conversation_workers, threads=runtime_threads)
+    if webhook_port:
+        WebhookReceiver(async_runtime.push, secret=trello_api_secret, callback_url=trello_webhook_url).start(
+            int(webhook_port))
+    if metrics_port:
+        threading.Thread(target=serve_metrics, args=(metrics_dir, int(metrics_port)), kwargs={"host": metrics_host},
+                         name="metrics", daemon=True).start()
+    async_runtime.run()
+
+
+if __name__ == "__main__" and runtime == "asyncio":
+    run_async(Bot())
+elif __name__ == "__main__":
     dave = Bot()
 
-    tasks = mp.JoinableQueue()
+    task_queues = [mp.JoinableQueue() for _ in range(max(1, conversation_workers))]
     results = mp.Queue()
 
-    worker = Worker(tasks, results, dave)
-    reader = mp.Process(target=dave.read_chat, args=(tasks,))
-    monitor = mp.Process(target=dave.monitor_events)
+    # The monitor and every conversation worker cache boards, so each gets the pushed Trello actions
+    pushes = [mp.Queue() if webhook_port else None for _ in range(len(task_queues) + 1)]
 
-    worker.start()
+    workers = [Worker(tasks, results, dave, pushes=p) for tasks, p in zip(task_queues, pushes)]
+    reader = mp.Process(target=dave.read_chat, args=(ChannelRouter(task_queues),))
+    monitor = mp.Process(target=run_monitor, args=(dave, pushes[-1]))
+
+    for worker in workers:
+        worker.start()
     reader.start()
     monitor.start()
+
+    if webhook_port:
+        WebhookReceiver(FanOut(pushes), secret=trello_api_secret, callback_url=trello_webhook_url).start(
+            int(webhook_port))
+    if metrics_port:
+        serve_metrics(metrics_dir, int(metrics_port), host=metrics_host)
+    for process in workers + [reader, monitor]:
+        process.join()